@@ -0,0 +1,134 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures the quality and the speed of the LOD hierarchy across projected size thresholds.
+
+    python -m benchmarks.lod_benchmark --n-points 2000000 --thresholds 0 1 2 4 8 16 --out lod.json
+
+Builds an LODHierarchy over a synthetic scene seen from a camera inside it,
+so most of the Gaussians are far away, and renders the same view at every
+threshold. Threshold 0 renders every visible Gaussian and is the reference.
+For every threshold, reports the median wall times of the cut and of the
+render, the Gaussians and keys rendered, the Gaussians picked at every level
+of the hierarchy, and the PSNR of the image against the reference.
+"""
+
+import argparse
+import json
+import math
+import statistics
+import sys
+import time
+import torch
+from benchmarks.run_benchmarks import environment
+from benchmarks.synthetic_scene import orbit_camera, synthetic_scene
+from slang_gaussian_rasterization.internal.lod import LODHierarchy
+from slang_gaussian_rasterization.internal.profiler import RenderProfiler
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+
+
+def _synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+
+
+def psnr(image, reference):
+    mse = float((image - reference).square().mean())
+    return 10.0 * math.log10(1.0 / mse) if mse > 0 else math.inf
+
+
+def run(n_points=500000, thresholds=(0.0, 1.0, 2.0, 4.0, 8.0, 16.0), blend=0.5, leaf_size=16, height=540,
+        width=960, extent=8.0, distance=1.0, repeats=5, warmup=2, device=None, seed=0, log=None):
+    """Renders one view at every threshold and returns the timings and PSNRs as a dict."""
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    scene = synthetic_scene(n_points, scale=0.0005, extent=extent, seed=seed, device=device)
+    start = time.perf_counter()
+    lod = LODHierarchy(scene['xyz_ws'], scene['rotations'], scene['scales'], scene['opacity'], scene['sh_coeffs'],
+                       leaf_size=leaf_size)
+    _synchronize(device)
+    build_ms = 1000.0 * (time.perf_counter() - start)
+    camera = orbit_camera(height, width, distance=distance, device=device)
+    world_view_transform, proj_mat, _, fovy, fovx = camera
+    render_grid = RenderGrid(height, width, tile_height=16, tile_width=16)
+    fovy_batch, fovx_batch = (torch.tensor([fov], device=device) for fov in (fovy, fovx))
+
+    results = {'environment': environment(device),
+               'config': {'n_points': n_points, 'blend': blend, 'leaf_size': leaf_size, 'height': height,
+                          'width': width, 'extent': extent, 'distance': distance},
+               'build_ms': build_ms, 'n_nodes': lod.n_nodes, 'depth': lod.depth, 'thresholds': {}}
+    reference = None
+    for threshold in sorted(thresholds):
+        cut_ms, render_ms = [], []
+        for iteration in range(warmup + repeats):
+            _synchronize(device)
+            start = time.perf_counter()
+            with torch.no_grad(), RenderProfiler() as profiler:
+                render_pkg = lod.render(*camera, height, width, threshold=threshold, blend=blend)
+            _synchronize(device)
+            total_ms = 1000.0 * (time.perf_counter() - start)
+            if iteration < warmup:
+                continue
+            # The cut is timed on its own, the rest of the frame is the render.
+            start = time.perf_counter()
+            lod.cut(world_view_transform[None], proj_mat[None], fovy_batch, fovx_batch, render_grid, threshold,
+                    blend)
+            _synchronize(device)
+            cut_ms.append(1000.0 * (time.perf_counter() - start))
+            render_ms.append(total_ms - cut_ms[-1])
+        image = render_pkg['render']
+        if reference is None:
+            reference = image
+        counters = profiler.summary()['counters']
+        results['thresholds'][str(threshold)] = {
+            'cut_ms': statistics.median(cut_ms),
+            'render_ms': statistics.median(render_ms),
+            'n_gaussians': render_pkg['lod_stats']['n_gaussians'],
+            'n_keys': counters['n_keys'][-1] if counters.get('n_keys') else None,
+            'level_counts': render_pkg['lod_stats']['level_counts'],
+            'n_leaf_gaussians': render_pkg['lod_stats']['n_leaf_gaussians'],
+            'psnr': psnr(image, reference)}
+        if log is not None:
+            entry = results['thresholds'][str(threshold)]
+            log(f"threshold {threshold:g}: {entry['n_gaussians']} Gaussians, {entry['n_keys']} keys, "
+                f"cut {entry['cut_ms']:.2f} ms, render {entry['render_ms']:.2f} ms, PSNR {entry['psnr']:.2f} dB")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the LOD hierarchy across projected size thresholds.")
+    parser.add_argument("--n-points", type=int, default=500000)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 1.0, 2.0, 4.0, 8.0, 16.0])
+    parser.add_argument("--blend", type=float, default=0.5)
+    parser.add_argument("--leaf-size", type=int, default=16)
+    parser.add_argument("--height", type=int, default=540)
+    parser.add_argument("--width", type=int, default=960)
+    parser.add_argument("--extent", type=float, default=8.0, help="Half the side of the cube of Gaussians.")
+    parser.add_argument("--distance", type=float, default=1.0, help="Distance of the camera to the center.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--device", help="Device to run on, CUDA when available by default.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Path of the JSON results.")
+    args = parser.parse_args(argv)
+
+    results = run(args.n_points, [0.0] + [t for t in args.thresholds if t > 0.0], args.blend, args.leaf_size,
+                  args.height, args.width, args.extent, args.distance, repeats=args.repeats, warmup=args.warmup, device=args.device,
+                  seed=args.seed, log=print)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
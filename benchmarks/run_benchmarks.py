@@ -0,0 +1,251 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Times the stages of the rasterizer on synthetic scenes and compares the results against a baseline.
+
+    python -m benchmarks.run_benchmarks run --preset smoke --out results.json
+    python -m benchmarks.run_benchmarks compare results.json baseline.json --threshold 0.1
+
+Every case renders a synthetic scene with render_alpha_blend_tiles_slang_raw
+and backpropagates a loss, inside a RenderProfiler. The stages of the vertex
+and tile shader (vertex_shader, generate_keys, sort_by_keys,
+compute_tile_ranges), of AlphaBlendTiledRender (splat_tiled, splat_tiled.bwd),
+of the vertex shader's backward pass (vertex_shader.bwd) and of the
+recomputation of the low_memory case (recompute) are reported as
+their median over the repeats, in GPU time on CUDA and in wall time
+otherwise, together with the forward and backward wall times, the bytes
+the pipeline allocated and, on CUDA, the peak memory. Tensors on the CPU go through the PyTorch reference, so the suite
+runs without a GPU, but CPU numbers are only comparable to CPU baselines.
+
+No baseline is checked in, the times depend on the machine. Run a known-good
+commit with --out baseline.json on each machine to make one.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import torch
+from benchmarks.synthetic_scene import orbit_camera, synthetic_scene
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw
+from slang_gaussian_rasterization.internal.profiler import RenderProfiler
+from slang_gaussian_rasterization.internal.slang.slang_modules import TILE_SIZES_HW
+
+BASE_CASES = {
+    # Small enough for the PyTorch reference on a CPU.
+    'smoke': {'n_points': 2000, 'scale_distribution': "lognormal", 'scale': 0.03, 'opacity': None,
+              'sh_degree': 3, 'height': 96, 'width': 128, 'tile_size': (16, 16), 'low_memory': False},
+    'default': {'n_points': 500000, 'scale_distribution': "lognormal", 'scale': 0.005, 'opacity': None,
+                'sh_degree': 3, 'height': 1080, 'width': 1920, 'tile_size': (16, 16), 'low_memory': False},
+}
+
+# Every case of a preset changes one setting of its base case.
+VARIATIONS = {
+    'smoke': {'tile_size': list(TILE_SIZES_HW),
+              'scale_distribution': ["uniform", "mixed"],
+              'sh_degree': [0],
+              'opacity': [0.9],
+              'low_memory': [True]},
+    'default': {'tile_size': list(TILE_SIZES_HW),
+                'n_points': [100000, 2000000],
+                'scale_distribution': ["uniform", "mixed"],
+                'opacity': [0.1, 0.9],
+                'sh_degree': [0, 1],
+                'height': [720, 2160],
+                'low_memory': [True]},
+}
+
+# Stages whose time is compared against the baseline, next to the forward and backward totals.
+STAGES = ["vertex_shader", "generate_keys", "sort_by_keys", "compute_tile_ranges", "splat_tiled",
+          "splat_tiled.bwd", "vertex_shader.bwd", "recompute"]
+
+
+def benchmark_cases(preset):
+    """Returns the base case of the preset and one case per variation of a setting."""
+    base = BASE_CASES[preset]
+    cases = [dict(base)]
+    for name, values in VARIATIONS[preset].items():
+        for value in values:
+            if value != base[name]:
+                case = dict(base)
+                if name == "height":
+                    case['width'] = base['width'] * value // base['height']
+                case[name] = value
+                cases.append(case)
+    return cases
+
+
+def case_name(case):
+    opacity = "rand" if case['opacity'] is None else case['opacity']
+    return (f"n{case['n_points']}_{case['scale_distribution']}_op{opacity}_sh{case['sh_degree']}_"
+            f"{case['height']}x{case['width']}_t{case['tile_size'][0]}x{case['tile_size'][1]}"
+            f"{'_lowmem' if case.get('low_memory') else ''}")
+
+
+def _synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+
+
+def run_case(case, device, repeats=5, warmup=2, seed=0):
+    """Renders one case warmup + repeats times and returns its median timings and memory."""
+    scene = synthetic_scene(case['n_points'], case['scale_distribution'], case['scale'], case['opacity'],
+                            case['sh_degree'], seed=seed, device=device)
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = orbit_camera(case['height'], case['width'], device=device)
+    params = {name: tensor.requires_grad_(True) for name, tensor in scene.items()}
+    stage_ms = {stage: [] for stage in STAGES}
+    forward_ms, backward_ms = [], []
+    counters, bytes_allocated = {}, 0
+    if torch.device(device).type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    for iteration in range(warmup + repeats):
+        for tensor in params.values():
+            tensor.grad = None
+        with RenderProfiler() as profiler:
+            _synchronize(device)
+            start = time.perf_counter()
+            render_pkg = render_alpha_blend_tiles_slang_raw(params['xyz_ws'], params['rotations'], params['scales'],
+                                                            params['opacity'], params['sh_coeffs'],
+                                                            case['sh_degree'], world_view_transform, proj_mat,
+                                                            cam_pos, fovy, fovx, case['height'], case['width'],
+                                                            tile_size=case['tile_size'],
+                                                            low_memory=case.get('low_memory', False))
+            _synchronize(device)
+            middle = time.perf_counter()
+            render_pkg['render'].square().mean().backward()
+            _synchronize(device)
+            end = time.perf_counter()
+        if iteration < warmup:
+            continue
+        forward_ms.append(1000.0 * (middle - start))
+        backward_ms.append(1000.0 * (end - middle))
+        summary = profiler.summary()
+        for stage, total in summary['stages'].items():
+            if stage in stage_ms:
+                stage_ms[stage].append(total.get('gpu_ms', total['wall_ms']))
+        counters = {name: values[-1] for name, values in summary['counters'].items()
+                    if values and isinstance(values[-1], (int, float))}
+        bytes_allocated = sum(total['bytes_allocated'] for total in summary['stages'].values())
+
+    result = {'config': case,
+              'stages_ms': {stage: statistics.median(times) for stage, times in stage_ms.items() if times},
+              'forward_ms': statistics.median(forward_ms),
+              'backward_ms': statistics.median(backward_ms),
+              'bytes_allocated': bytes_allocated,
+              'counters': counters}
+    if torch.device(device).type == "cuda":
+        result['peak_memory_bytes'] = torch.cuda.max_memory_allocated(device)
+    return result
+
+
+def environment(device):
+    env = {'torch': torch.__version__, 'python': platform.python_version(), 'device': str(device)}
+    if torch.device(device).type == "cuda":
+        env['gpu'] = torch.cuda.get_device_name(device)
+        env['cuda'] = torch.version.cuda
+    else:
+        env['cpu'] = platform.processor() or platform.machine()
+    return env
+
+
+def run(preset="smoke", device=None, repeats=5, warmup=2, seed=0, log=None):
+    """Runs every case of a preset on the device, CUDA when available, and returns the results as a dict."""
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    results = {'environment': environment(device), 'preset': preset, 'cases': {}}
+    for case in benchmark_cases(preset):
+        name = case_name(case)
+        results['cases'][name] = run_case(case, device, repeats, warmup, seed)
+        if log is not None:
+            log(f"{name}: forward {results['cases'][name]['forward_ms']:.2f} ms, "
+                f"backward {results['cases'][name]['backward_ms']:.2f} ms")
+    return results
+
+
+def _metrics(case_result):
+    metrics = {'forward_ms': case_result['forward_ms'], 'backward_ms': case_result['backward_ms']}
+    metrics.update({f"{stage}_ms": ms for stage, ms in case_result['stages_ms'].items()})
+    for metric in ['bytes_allocated', 'peak_memory_bytes']:
+        if metric in case_result:
+            metrics[metric] = case_result[metric]
+    return metrics
+
+
+def compare(results, baseline, threshold=0.1, min_ms=0.05):
+    """Lists the metrics of the cases in both results that got more than threshold worse than the baseline.
+
+    Times below min_ms in the baseline are skipped, they are dominated by noise.
+
+    Returns:
+      A list of {'case', 'metric', 'baseline', 'result', 'ratio'} dicts, empty if nothing regressed.
+    """
+    if results.get('environment', {}).get('device') != baseline.get('environment', {}).get('device'):
+        print("Warning: the results and the baseline were measured on different devices.", file=sys.stderr)
+    regressions = []
+    for name in sorted(set(results['cases']) & set(baseline['cases'])):
+        result_metrics = _metrics(results['cases'][name])
+        for metric, reference in _metrics(baseline['cases'][name]).items():
+            if metric not in result_metrics or reference <= 0:
+                continue
+            if metric.endswith("_ms") and reference < min_ms:
+                continue
+            ratio = result_metrics[metric] / reference
+            if ratio > 1.0 + threshold:
+                regressions.append({'case': name, 'metric': metric, 'baseline': reference,
+                                    'result': result_metrics[metric], 'ratio': ratio})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the rasterizer on synthetic scenes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run a preset and save the results as JSON.")
+    run_parser.add_argument("--preset", choices=sorted(BASE_CASES), default="smoke")
+    run_parser.add_argument("--device", help="Device to run on, CUDA when available by default.")
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--warmup", type=int, default=2)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--out", required=True, help="Path of the JSON results.")
+    run_parser.add_argument("--baseline", help="Baseline JSON to compare the new results against.")
+    run_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser = subparsers.add_parser("compare", help="Compare saved results against a baseline.")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Largest allowed slowdown, 0.1 fails metrics more than 10%% worse.")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.preset, args.device, args.repeats, args.warmup, args.seed, log=print)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        if not args.baseline:
+            return 0
+        baseline_path = args.baseline
+    else:
+        with open(args.results) as f:
+            results = json.load(f)
+        baseline_path = args.baseline
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"{regression['case']} {regression['metric']}: {regression['baseline']:.3f} -> "
+              f"{regression['result']:.3f} ({regression['ratio']:.2f}x)")
+    print(f"{len(regressions)} regressions above {args.threshold:.0%}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
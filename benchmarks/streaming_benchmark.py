@@ -0,0 +1,129 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Times the cold start and the per-view I/O of a chunked scene file on local disk.
+
+    python -m benchmarks.streaming_benchmark --n-points 2000000 --quantize uint8 --out streaming.json
+
+Writes a synthetic scene to a chunked scene file, drops the file from the
+page cache where os.posix_fadvise is available, and then times opening the
+file with ChunkedScene and rendering the first view, followed by a walk of
+cameras on a circle inside the scene. Every view reports its wall time and
+the chunks and bytes it paged in, with the cache held under --memory-budget.
+"""
+
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import torch
+from benchmarks.run_benchmarks import environment
+from benchmarks.synthetic_scene import orbit_camera, synthetic_scene
+from slang_gaussian_rasterization.internal.chunked_scene import QUANTIZE_MODES, ChunkedScene, write_chunked_scene
+
+
+def _synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+
+
+def _drop_page_cache(path):
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+        return True
+    return False
+
+
+def run(path, n_points=500000, chunk_size=4096, quantize=None, n_views=16, memory_budget=None, height=540,
+        width=960, extent=4.0, distance=1.0, device=None, seed=0):
+    """Writes the scene to path, then times the cold start and a walk of n_views cameras."""
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    scene = synthetic_scene(n_points, scale=0.002, extent=extent, seed=seed)
+    start = time.perf_counter()
+    write_chunked_scene(path, scene['xyz_ws'], scene['rotations'], scene['scales'], scene['opacity'],
+                        scene['sh_coeffs'], chunk_size=chunk_size, quantize=quantize)
+    write_ms = 1000.0 * (time.perf_counter() - start)
+    cold = _drop_page_cache(path)
+
+    start = time.perf_counter()
+    chunked_scene = ChunkedScene(path, device=device, memory_budget=memory_budget)
+    open_ms = 1000.0 * (time.perf_counter() - start)
+    views = []
+    for view in range(n_views):
+        camera = orbit_camera(height, width, angle=2 * math.pi * view / n_views, distance=distance, device=device)
+        _synchronize(device)
+        start = time.perf_counter()
+        with torch.no_grad():
+            render_pkg = chunked_scene.render(*camera, height, width)
+        _synchronize(device)
+        views.append(dict(render_pkg['stream_stats'], wall_ms=1000.0 * (time.perf_counter() - start)))
+
+    return {'environment': environment(device),
+            'config': {'n_points': n_points, 'chunk_size': chunk_size, 'quantize': quantize, 'n_views': n_views,
+                       'memory_budget': memory_budget, 'height': height, 'width': width},
+            'file_bytes': os.path.getsize(path),
+            'n_chunks': chunked_scene.n_chunks,
+            'write_ms': write_ms,
+            'page_cache_dropped': cold,
+            'open_ms': open_ms,
+            'first_view_ms': views[0]['wall_ms'],
+            'median_view_ms': statistics.median(view['wall_ms'] for view in views[1:]) if n_views > 1 else None,
+            'median_view_bytes_read': (statistics.median(view['bytes_read'] for view in views[1:])
+                                       if n_views > 1 else None),
+            'totals': chunked_scene.stats,
+            'views': views}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark streaming a chunked scene file from local disk.")
+    parser.add_argument("--n-points", type=int, default=500000)
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--quantize", choices=[mode for mode in QUANTIZE_MODES if mode is not None])
+    parser.add_argument("--views", type=int, default=16)
+    parser.add_argument("--memory-budget", type=int, help="Bytes of chunks to cache, unlimited by default.")
+    parser.add_argument("--height", type=int, default=540)
+    parser.add_argument("--width", type=int, default=960)
+    parser.add_argument("--device", help="Device to run on, CUDA when available by default.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--path", help="Scene file to write, a temporary file by default.")
+    parser.add_argument("--out", help="Path of the JSON results.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path or os.path.join(directory, "scene.gsc")
+        results = run(path, args.n_points, args.chunk_size, args.quantize, args.views, args.memory_budget,
+                      args.height, args.width, device=args.device, seed=args.seed)
+    print(f"{results['file_bytes'] / 2**20:.1f} MiB in {results['n_chunks']} chunks, "
+          f"written in {results['write_ms']:.0f} ms")
+    print(f"open {results['open_ms']:.2f} ms, first view {results['first_view_ms']:.2f} ms"
+          f"{'' if results['page_cache_dropped'] else ' (page cache not dropped)'}")
+    if results['median_view_ms'] is not None:
+        print(f"median view {results['median_view_ms']:.2f} ms, "
+              f"{results['median_view_bytes_read'] / 2**20:.2f} MiB read")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Deterministic synthetic Gaussian scenes and cameras for the benchmarks.
+
+The scenes are drawn from a seeded CPU generator and moved to the device
+afterwards, so a (config, seed) pair gives the same scene on every backend.
+"""
+
+import math
+import torch
+
+SCALE_DISTRIBUTIONS = ["uniform", "lognormal", "mixed"]
+
+
+def sample_scales(n_points, distribution, scale, generator):
+    """Samples [N, 3] scales around scale.
+
+    uniform: every axis in [0.1, 1] * scale.
+    lognormal: a heavy tail of large splats, like the scenes trained by 3DGS.
+    mixed: 95% small splats and 5% splats ten times larger, which stresses the load balance.
+    """
+    assert distribution in SCALE_DISTRIBUTIONS, (
+        f"Unknown scale distribution {distribution}, available: {SCALE_DISTRIBUTIONS}")
+    if distribution == "uniform":
+        return (0.1 + 0.9 * torch.rand(n_points, 3, generator=generator)) * scale
+    if distribution == "lognormal":
+        return torch.exp(torch.randn(n_points, 3, generator=generator) * 0.5) * scale
+    scales = (0.1 + 0.9 * torch.rand(n_points, 3, generator=generator)) * scale
+    large = torch.rand(n_points, generator=generator) < 0.05
+    return torch.where(large[:, None], scales * 10.0, scales)
+
+
+def synthetic_scene(n_points, scale_distribution="lognormal", scale=0.01, opacity=None, sh_degree=3,
+                    extent=1.0, seed=0, device="cpu"):
+    """Draws N Gaussians uniformly in a cube of half size extent.
+
+    Args:
+      n_points: The number N of Gaussians.
+      scale_distribution: One of SCALE_DISTRIBUTIONS.
+      scale: The typical scale of a Gaussian, relative to extent.
+      opacity: A fixed opacity for every Gaussian, or None for opacities uniform in [0, 1].
+      sh_degree: The spherical harmonics degree, the coefficients above it are zero.
+      extent: Half the side of the cube holding the means.
+      seed: Seed of the generator.
+      device: Device of the returned tensors.
+
+    Returns:
+      A dict with xyz_ws [N, 3], rotations [N, 4], scales [N, 3], opacity [N, 1] and sh_coeffs [N, 16, 3].
+    """
+    generator = torch.Generator().manual_seed(seed)
+    xyz_ws = (torch.rand(n_points, 3, generator=generator) * 2 - 1) * extent
+    rotations = torch.nn.functional.normalize(torch.randn(n_points, 4, generator=generator), dim=1)
+    scales = sample_scales(n_points, scale_distribution, scale * extent, generator)
+    if opacity is None:
+        opacities = torch.rand(n_points, 1, generator=generator)
+    else:
+        opacities = torch.full((n_points, 1), float(opacity))
+    sh_coeffs = torch.randn(n_points, 16, 3, generator=generator) * 0.2
+    sh_coeffs[:, (sh_degree + 1) ** 2:] = 0.0
+    scene = {'xyz_ws': xyz_ws, 'rotations': rotations, 'scales': scales, 'opacity': opacities,
+             'sh_coeffs': sh_coeffs}
+    return {name: tensor.to(device) for name, tensor in scene.items()}
+
+
+def projection_matrix(fovx, fovy, znear=0.01, zfar=100.0):
+    """Returns the [4, 4] perspective projection in the convention of the Inria code base."""
+    tan_x, tan_y = math.tan(fovx / 2), math.tan(fovy / 2)
+    proj_mat = torch.zeros(4, 4)
+    proj_mat[0, 0] = 1 / tan_x
+    proj_mat[1, 1] = 1 / tan_y
+    proj_mat[2, 2] = zfar / (zfar - znear)
+    proj_mat[2, 3] = -(zfar * znear) / (zfar - znear)
+    proj_mat[3, 2] = 1.0
+    return proj_mat
+
+
+def orbit_camera(height, width, angle=0.0, distance=3.0, fovx=1.0, device="cpu"):
+    """Returns a camera on a circle around the origin that looks at it.
+
+    Returns:
+      (world_view_transform [4, 4], proj_mat [4, 4], cam_pos [3], fovy, fovx), in the layout the render
+      functions take. The camera axes are x right, y down and z forward.
+    """
+    fovy = 2 * math.atan(math.tan(fovx / 2) * height / width)
+    cam_pos = torch.tensor([distance * math.sin(angle), 0.0, -distance * math.cos(angle)])
+    forward = -cam_pos / cam_pos.norm()
+    down = torch.tensor([0.0, 1.0, 0.0])
+    right = torch.linalg.cross(down, forward)
+    right = right / right.norm()
+    down = torch.linalg.cross(forward, right)
+    world_view_transform = torch.eye(4)
+    world_view_transform[:3, :3] = torch.stack([right, down, forward])
+    world_view_transform[:3, 3] = -world_view_transform[:3, :3] @ cam_pos
+    return (world_view_transform.to(device), projection_matrix(fovx, fovy).to(device), cam_pos.to(device),
+            fovy, fovx)
@@ -12,7 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import subprocess
+import sys
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+
+
+class BuildPyWithShaderCache(build_py):
+    """Compiles the shaders into the package's read-only shader cache if SLANG_GAUSSIAN_RASTERIZATION_PREBUILD=1.
+
+    Needs slangtorch and a CUDA toolchain on the packaging machine, see internal/shader_cache.py.
+    """
+    def run(self):
+        super().run()
+        if os.environ.get("SLANG_GAUSSIAN_RASTERIZATION_PREBUILD") != "1":
+            return
+        cache_dir = os.path.join(os.path.abspath(self.build_lib), "slang_gaussian_rasterization", "internal",
+                                 "_prebuilt_shader_cache")
+        subprocess.check_call([sys.executable, "-m", "slang_gaussian_rasterization.internal.shader_cache",
+                               "warm", "--cache-dir", cache_dir], cwd=os.path.abspath(self.build_lib))
+
 
 setup(
     name='slang_gaussian_rasterization',
@@ -21,12 +41,18 @@ setup(
     author='George Kopanas',
     author_email='gkopanas@google.com',
     license='Apache 2.0',
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     include_package_data=True,
     package_data={
         'slang_gaussian_rasterization': ['slang_gaussian_rasterization/internal/slang/alpha_blend_sai.slang']
     },
     install_requires=['slangtorch',
-                      'torch']
+                      'torch'],
+    cmdclass={'build_py': BuildPyWithShaderCache},
+    entry_points={
+        'console_scripts': [
+            'slang-gaussian-rasterization-cache=slang_gaussian_rasterization.internal.shader_cache:main',
+        ]
+    }
 )
 
@@ -1,9 +1,12 @@
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Tuple, Union
 from typing_extensions import Literal
 import math
 import torch
 from torch import Tensor
-from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw, render_alpha_blend_tiles_slang_inference
+from slang_gaussian_rasterization.internal.tile_autotune import TileAutotuner, resolve_tile_size
+from slang_gaussian_rasterization.internal.densification_stats import DensificationStats
+from slang_gaussian_rasterization.internal.distributed import render_alpha_blend_tiles_distributed
 
 
 def fov2focal(fov, pixels):
@@ -33,23 +36,25 @@ def get_slang_projection_matrix(znear, zfar, fy, fx, height, width, device):
     return P
 
 def common_camera_properties_from_gsplat(viewmats, Ks, height, width):
-  """ Fetches all the Camera properties from the inria defined object"""
+  """ Fetches the properties of the C cameras from the gsplat viewmats [C, 4, 4] and Ks [C, 3, 3]"""
   zfar = 100.0
   znear = 0.01
   
   world_view_transform = viewmats
-  fx = Ks[0,0]
-  fy = Ks[1,1]
-  projection_matrix = get_slang_projection_matrix(znear, zfar, fy, fx, height, width, Ks.device)
-  fovx = focal2fov(fx, width)
-  fovy = focal2fov(fy, height)
+  projection_matrix = torch.stack([get_slang_projection_matrix(znear, zfar, K[1,1], K[0,0], height, width, Ks.device)
+                                   for K in Ks])
+  fovx = torch.tensor([focal2fov(K[0,0], width) for K in Ks], device=Ks.device)
+  fovy = torch.tensor([focal2fov(K[1,1], height) for K in Ks], device=Ks.device)
 
-  cam_pos = viewmats.inverse()[:, 3]
+  cam_pos = viewmats.inverse()[:, :3, 3]
 
   return world_view_transform, projection_matrix, cam_pos, fovy, fovx
  
 
 
+RENDER_MODES = ["RGB", "D", "ED", "RGB+D", "RGB+ED"]
+
+
 def rasterization(
     means: Tensor,  # [N, 3]
     quats: Tensor,  # [N, 4]
@@ -66,7 +71,7 @@ def rasterization(
     eps2d: float = 0.3,
     sh_degree: Optional[int] = None,
     packed: bool = True,
-    tile_size: int = 16,
+    tile_size: Union[int, Tuple[int, int], str, TileAutotuner] = 16,
     backgrounds: Optional[Tensor] = None,
     render_mode: Literal["RGB", "D", "ED", "RGB+D", "RGB+ED"] = "RGB",
     sparse_grad: bool = False,
@@ -74,28 +79,67 @@ def rasterization(
     rasterize_mode: Literal["classic", "antialiased"] = "classic",
     channel_chunk: int = 32,
     distributed: bool = False,
+    densification_stats: Optional[DensificationStats] = None,
 ) -> Tuple[Tensor, Tensor, Dict]:
 
-  assert viewmats.shape[0] == 1, "Camera Batching is not support in the slang-gaussian-rasterization"
-  assert Ks.shape[0] == 1, "Camera Batching is not support in the slang-gaussian-rasterization"
-  assert not(len(colors.shape) == 4 and colors.shape[0] == 1), "Camera Batching is not support in the slang-gaussian-rasterization"
-  assert render_mode == "RGB", "Currently only render_mode=\"RGB\" is supported."
+  assert viewmats.shape[0] == Ks.shape[0], "viewmats and Ks must describe the same number of cameras."
+  assert len(colors.shape) == 3, "Per-camera colors are not supported, colors must be SH coefficients [N, K, 3]."
+  assert render_mode in RENDER_MODES, f"Unknown render_mode {render_mode}, available: {RENDER_MODES}"
   assert rasterize_mode == "classic", "Currently only rasterize_mode=\"classic\" is supported."
-  assert absgrad == False, "Currently only absgrd=False is supported."
-  assert backgrounds is None
   assert packed == False, "Currently only packed=False is supported."
-  assert sparse_grad == False, "Currently only sparce_grad=False is supported."
-  assert distributed == False, "Currently ony distributed=False is supported."
-
-  world_view_transform, projection_matrix, cam_pos, fovy, fovx = common_camera_properties_from_gsplat(viewmats[0], Ks[0], height, width)
-
-  render_pkg = render_alpha_blend_tiles_slang_raw(means, quats, scales, opacities, 
-                                                  colors, sh_degree,
-                                                  world_view_transform, projection_matrix, cam_pos,
-                                                  fovy, fovx, height, width, tile_size=tile_size)
-
-
-  meta = {"radii": render_pkg["radii"][None, ...],
-          "means2d": render_pkg["viewspace_points"]}
-
-  return render_pkg["render"].permute(1,2,0)[None,...], None, meta
+  assert not distributed or (densification_stats is None and not absgrad and not sparse_grad), (
+    "distributed=True does not support densification_stats, absgrad or sparse_grad.")
+  # Each rank would pick the tile size from its own shard, but all of them have to share one RenderGrid.
+  assert not distributed or not isinstance(tile_size, (str, TileAutotuner)), (
+    "distributed=True needs a fixed tile_size.")
+
+  n_cameras = viewmats.shape[0]
+  world_view_transform, projection_matrix, cam_pos, fovy, fovx = common_camera_properties_from_gsplat(viewmats, Ks, height, width)
+  batched = n_cameras > 1 or distributed
+  if not batched:
+    # A single camera renders unbatched, so means2d stays the [N, 3] tensor the gsplat trainer patch reads the gradient of.
+    world_view_transform, projection_matrix, cam_pos = world_view_transform[0], projection_matrix[0], cam_pos[0]
+
+  # tile_size may also be "auto" or a TileAutotuner, which pick the tile size from the scene.
+  tile_size = resolve_tile_size(tile_size, means, quats, scales, opacities, colors, sh_degree,
+                                world_view_transform, projection_matrix, cam_pos, fovy, fovx, height, width)
+  if distributed:
+    # Like gsplat, every rank passes its own shard of the Gaussians and its own cameras, and gets back the
+    # images of its cameras, rendered from the Gaussians of all ranks.
+    render_pkg = render_alpha_blend_tiles_distributed(means, quats, scales, opacities,
+                                                      colors, sh_degree,
+                                                      world_view_transform, projection_matrix, cam_pos,
+                                                      fovy, fovx, height, width, tile_size=tile_size,
+                                                      render_depth=render_mode != "RGB", local_cameras=True)
+  elif torch.is_grad_enabled():
+    render_pkg = render_alpha_blend_tiles_slang_raw(means, quats, scales, opacities, 
+                                                    colors, sh_degree,
+                                                    world_view_transform, projection_matrix, cam_pos,
+                                                    fovy, fovx, height, width, tile_size=tile_size,
+                                                    sparse_grad=sparse_grad,
+                                                    densification_stats=densification_stats, absgrad=absgrad,
+                                                    render_depth=render_mode != "RGB")
+  else:
+    # The evaluation of the trainer runs under torch.no_grad() and takes the inference path.
+    render_pkg = render_alpha_blend_tiles_slang_inference(means, quats, scales, opacities,
+                                                          colors, sh_degree,
+                                                          world_view_transform, projection_matrix, cam_pos,
+                                                          fovy, fovx, height, width, tile_size=tile_size,
+                                                          render_depth=render_mode != "RGB")
+
+
+  # The color, depth and alpha all come out of the same blend pass.
+  outputs = {name: render_pkg[name] if batched else render_pkg[name][None, ...]
+             for name in ["render", "alpha", "depth", "expected_depth"] if name in render_pkg}
+  channels = {"RGB": ["render"], "D": ["depth"], "ED": ["expected_depth"],
+              "RGB+D": ["render", "depth"], "RGB+ED": ["render", "expected_depth"]}[render_mode]
+  render = torch.cat([outputs[name] for name in channels], dim=1)
+  alphas = outputs["alpha"]
+  if backgrounds is not None:
+    # Like gsplat, the [C, D] backgrounds are composited over every channel of the output.
+    render = render + (1.0 - alphas) * backgrounds[:, :, None, None]
+  # With absgrad, the backward pass sets means2d.absgrad. With densification_stats, means2d.grad is not retained.
+  meta = {"radii": render_pkg["radii"] if batched else render_pkg["radii"][None, ...],
+          "means2d": render_pkg.get("viewspace_points")}
+
+  return render.permute(0,2,3,1), alphas.permute(0,2,3,1), meta
@@ -15,7 +15,8 @@
 Inria 3DGS code-base https://github.com/graphdeco-inria/gaussian-splatting"""
 
 import torch
-from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw, render_alpha_blend_tiles_slang_inference
+from slang_gaussian_rasterization.internal.tile_autotune import resolve_tile_size
 
 def common_properties_from_inria_GaussianModel(gaussian_model):
   """ Fetches all the Gaussian properties from the inria defined Gaussian Model object"""
@@ -39,24 +40,44 @@ def common_properties_from_inria_Camera(camera):
 
   return world_view_transform, projection_matrix, cam_pos, fovy, fovx, height, width 
 
-def render(viewpoint_camera, pc, pipe, bg_color, scaling_modifier = 1.0, override_color = None):
-  """ Implements the Interface defined in the inria code-base."""
+def render(viewpoint_camera, pc, pipe, bg_color, scaling_modifier = 1.0, override_color = None, tile_size = 16,
+           densification_stats = None, render_depth = False):
+  """ Implements the Interface defined in the inria code-base.
+
+  tile_size may be an int, a (tile_height, tile_width) pair, "auto" or a TileAutotuner, see tile_autotune.py.
+  With a DensificationStats, the backward pass accumulates the statistics the trainer reads from
+  viewspace_points.grad instead, see densification_stats.py.
+  The image is composited over bg_color and the package also holds its 'alpha', and with
+  render_depth the 'depth' and 'expected_depth' rendered in the same blend pass.
+  """
   assert scaling_modifier == 1.0, "scaling_modifier is not supported in the slang-gaussian-rasterization."
   assert override_color is None, "override_color is not support in the slang-gaussian-rasterization."
   assert pipe.convert_SHs_python is False, "convert_SHs_python is not supported."
   assert pipe.compute_cov3D_python is False, "compute_cov3D_python is not supported."
   assert pipe.debug is False, "debug mode is not supported."
-  assert torch.equal(bg_color, torch.zeros_like(bg_color)), "only black background is supported currently."
 
   active_sh = pc.active_sh_degree
   xyz_ws, rotations, scales, sh_coeffs, opacity = common_properties_from_inria_GaussianModel(pc)
   world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width = common_properties_from_inria_Camera(viewpoint_camera)  
 
 
-  render_pkg = render_alpha_blend_tiles_slang_raw(xyz_ws, rotations, scales, opacity, 
-                                                  sh_coeffs, active_sh,
-                                                  world_view_transform, proj_mat, cam_pos,
-                                                  fovy, fovx, height, width)
+  tile_size = resolve_tile_size(tile_size, xyz_ws, rotations, scales, opacity, sh_coeffs, active_sh,
+                                world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width)
+  # The network viewer of the patched train.py renders under torch.no_grad() and takes the inference path,
+  # training_report renders with gradients enabled and takes the raw path.
+  if torch.is_grad_enabled():
+    render_pkg = render_alpha_blend_tiles_slang_raw(xyz_ws, rotations, scales, opacity,
+                                                    sh_coeffs, active_sh,
+                                                    world_view_transform, proj_mat, cam_pos,
+                                                    fovy, fovx, height, width, tile_size=tile_size,
+                                                    densification_stats=densification_stats,
+                                                    render_depth=render_depth, background=bg_color)
+  else:
+    render_pkg = render_alpha_blend_tiles_slang_inference(xyz_ws, rotations, scales, opacity,
+                                                          sh_coeffs, active_sh,
+                                                          world_view_transform, proj_mat, cam_pos,
+                                                          fovy, fovx, height, width, tile_size=tile_size,
+                                                          render_depth=render_depth, background=bg_color)
   
   return render_pkg
  
\ No newline at end of file
@@ -13,9 +13,29 @@
 # limitations under the License.
 
 import torch
-from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid, tile_size_hw
 import slang_gaussian_rasterization.internal.slang.slang_modules as slang_modules
-from slang_gaussian_rasterization.internal.tile_shader_slang import vertex_and_tile_shader
+from slang_gaussian_rasterization.internal.tile_shader_slang import vertex_and_tile_shader, vertex_shader_outputs, frustum_cull
+from slang_gaussian_rasterization.internal.tile_shader_torch import vertex_and_tile_shader_torch, frustum_cull_torch
+from slang_gaussian_rasterization.internal.alphablend_tiled_torch import AlphaBlendTiledRenderTorch, alpha_blend_torch
+from slang_gaussian_rasterization.internal.render_workspace import allocate_buffer
+from slang_gaussian_rasterization.internal.profiler import (RenderProfiler, active_profiler, profile_stage,
+                                                            record_allocation, record_frame_counters,
+                                                            record_contributor_counters, record_cull_counters,
+                                                            record_backward_skip_counters, record_recompute_counters)
+from slang_gaussian_rasterization.internal.sparse_grad import set_sparse_rows, sparse_row_grad, visible_gaussian_rows
+from slang_gaussian_rasterization.internal.roi import crop_to_roi, roi_tile_mask
+from slang_gaussian_rasterization.internal.densification_stats import DensificationFrame
+from slang_gaussian_rasterization.internal.recompute import TileShaderRecompute, recomputed_bytes
+from slang_gaussian_rasterization.internal.precision import float_grad_pair, float_view, is_reduced, storage_bits, storage_format
+
+# How the backward blend accumulates the gradients of the splats, see bwd_alpha_blend:
+#   atomic: every pixel adds its share with atomics, the fastest for scenes with few overlapping splats.
+#   block: the tile sums the shares of each splat in shared memory and adds them with one atomic.
+#   deterministic: like block, but every (tile, splat) key writes its own row and the rows of each
+#     splat are summed in list order afterwards, so the gradients are bitwise reproducible.
+GRAD_REDUCTION_MODES = {"atomic": 0, "block": 1, "deterministic": 2}
+SPLAT_GRAD_SIZE = 11
 
 def set_grad(var):
     def hook(grad):
@@ -25,60 +45,450 @@ def set_grad(var):
 def render_alpha_blend_tiles_slang_raw(xyz_ws, rotations, scales, opacity, 
                                        sh_coeffs, active_sh,
                                        world_view_transform, proj_mat, cam_pos,
-                                       fovy, fovx, height, width, tile_size=16):
-    
-    render_grid = RenderGrid(height,
-                             width,
-                             tile_height=tile_size,
-                             tile_width=tile_size)
-    sorted_gauss_idx, tile_ranges, radii, xyz_vs, inv_cov_vs, rgb = vertex_and_tile_shader(xyz_ws,
-                                                                                           rotations,
-                                                                                           scales,
-                                                                                           sh_coeffs,
-                                                                                           active_sh,
-                                                                                           world_view_transform,
-                                                                                           proj_mat,
-                                                                                           cam_pos,
-                                                                                           fovy,
-                                                                                           fovx,
-                                                                                           render_grid)
+                                       fovy, fovx, height, width, tile_size=16, workspace=None,
+                                       depth_bits=None, tight_tile_bounds=False, profile=False,
+                                       frustum_culling=False, cull_min_opacity=0.0, cull_min_radius=0.0,
+                                       spatial_index=None, sparse_grad=False, grad_reduction=None,
+                                       balanced_keys=False, temporal_sort=None, splat_dtype=None, roi=None,
+                                       densification_stats=None, absgrad=False, render_depth=False,
+                                       background=None, low_memory=False):
+    """Renders the Gaussians from one camera, or from a batch of C cameras at once.
+
+    A single camera is described by a [4, 4] world_view_transform and proj_mat,
+    a [3] cam_pos and scalar fields of view. A batch uses [C, 4, 4], [C, 3] and
+    [C] tensors instead, then all cameras share one vertex pass, one sort and
+    one blend launch, and every output of the render package gets a leading
+    camera dimension.
+
+    tile_size is the side of square tiles or a (tile_height, tile_width)
+    pair, every size must be in TILE_SIZES_HW to render on the GPU, see
+    tile_autotune.py to pick one automatically.
+
+    With depth_bits set, the depth in the sort keys is quantized to that many
+    bits so that the keys can be sorted as 32-bit integers, see depth_keys.py.
+    With tight_tile_bounds, splats only get keys for the tiles that their
+    1/255 alpha ellipse overlaps, and the render package reports the number
+    of keys this saved as 'n_keys_saved'.
+
+    With profile=True, the stages and counters of this render, including its
+    backward pass, are recorded into a RenderProfiler that is returned as
+    'profiler' in the render package. An enclosing `with RenderProfiler()`
+    block is used instead when there is one.
+
+    With frustum_culling, a cheap pre-pass first lists the camera and Gaussian
+    pairs whose splat can reach the image, see frustum_cull. The vertex, key
+    and backward passes only run over that list, and the radii, viewspace
+    points and gradients are scattered back to all N Gaussians. The pre-pass
+    is conservative and leaves the image unchanged, unless cull_min_opacity
+    or cull_min_radius (in pixels) also drop faint or tiny splats.
+
+    A GaussianOctree passed as spatial_index picks the candidate Gaussians of
+    every camera from its nodes before any per-Gaussian work runs, and only
+    those go through the pipeline, see spatial_index.py. Combined with
+    frustum_culling, the pre-pass then only tests these candidates.
+
+    With sparse_grad, xyz_ws, rotations, scales, opacity and sh_coeffs receive
+    torch.sparse_coo gradients that only hold the rows of the Gaussians with a
+    non-zero radius, for optimizers like torch.optim.SparseAdam. On the GPU the
+    vertex shader's backward pass then also only allocates these rows. Inputs
+    computed by operations without sparse support, like torch.sigmoid, keep
+    a dense gradient, see sparse_grad.py.
+
+    grad_reduction picks how the backward blend accumulates the gradients of
+    the splats, one of GRAD_REDUCTION_MODES. It defaults to "deterministic"
+    when torch.use_deterministic_algorithms is enabled and to "atomic"
+    otherwise.
+
+    With balanced_keys, the sort keys are generated with one thread per key
+    instead of one thread per splat, so that splats close to the camera that
+    cover many tiles do not stall the key generation. The keys are the same.
+
+    A TemporalSort passed as temporal_sort keeps the sorted order of each
+    frame and repairs it for the next one instead of sorting every key again,
+    for renders along smooth camera paths, see temporal_sort.py. The sorted
+    order is the same. It can not be combined with depth_bits or
+    tight_tile_bounds.
+
+    The spherical harmonics are read in the dtype of sh_coeffs, which may be
+    torch.float16 or torch.bfloat16 to halve their memory and bandwidth, and
+    splat_dtype sets the storage dtype of the 2D splats handed from the vertex
+    pass to the blend the same way. All arithmetic stays in float32, see
+    precision.py.
+
+    roi restricts the render to a region of interest, either a pixel
+    rectangle (x_min, y_min, x_max, y_max) shared by all cameras, or a bool
+    mask of the tiles, [grid_height, grid_width] or [C, grid_height,
+    grid_width]. Only the keys of the tiles it covers are sorted and blended.
+    A rectangle returns the crop as 'render', a mask the full image with the
+    other tiles left empty, and splats outside of it get a zero radius, see
+    roi.py. It can not be combined with temporal_sort.
+
+    A DensificationStats passed as densification_stats has the densification
+    statistics of the render, the 2D gradient norms, visible counts and
+    radii, added to its buffers by the backward pass, see
+    densification_stats.py. The gradient of 'viewspace_points' is then not
+    retained. With absgrad, the backward pass also sets
+    'viewspace_points'.absgrad to the gradient summed with absolute values
+    over the pixels, like gsplat.
+
+    The render package always holds the 'alpha' [1, H, W] of the pixels, and
+    'render' is composited over background, a [3] color or one [C, 3] color
+    per camera, when it is given. With render_depth, the blend pass also
+    accumulates the view space depth of the splats like a color, which the
+    package holds as 'depth' [1, H, W], and 'expected_depth' is that depth
+    divided by the alpha, see blend_outputs.
+
+    With low_memory, the backward pass runs the vertex and tile shader again
+    instead of keeping their per-splat outputs and sorted tile lists alive
+    in the autograd graph between the forward and the backward pass, and the
+    render package reports the bytes this frees as 'n_bytes_recomputed', see
+    recompute.py. The gradients are bitwise the same as without low_memory
+    with grad_reduction="deterministic" or on the CPU, the other reductions
+    add with atomics in a different order on every run. It can not be
+    combined with a workspace or temporal_sort.
+    """
+    if profile and active_profiler() is None:
+        with RenderProfiler():
+            render_pkg = render_alpha_blend_tiles_slang_raw(xyz_ws, rotations, scales, opacity,
+                                                            sh_coeffs, active_sh,
+                                                            world_view_transform, proj_mat, cam_pos,
+                                                            fovy, fovx, height, width, tile_size, workspace,
+                                                            depth_bits, tight_tile_bounds, profile,
+                                                            frustum_culling, cull_min_opacity, cull_min_radius,
+                                                            spatial_index, sparse_grad, grad_reduction,
+                                                            balanced_keys, temporal_sort, splat_dtype, roi,
+                                                            densification_stats, absgrad, render_depth,
+                                                            background, low_memory)
+        return render_pkg
+
+    if grad_reduction is None:
+        grad_reduction = "deterministic" if torch.are_deterministic_algorithms_enabled() else "atomic"
+    assert grad_reduction in GRAD_REDUCTION_MODES, (
+        f"Unknown grad_reduction {grad_reduction}, available modes: {list(GRAD_REDUCTION_MODES)}")
+    assert not low_memory or (workspace is None and temporal_sort is None), (
+        "low_memory recomputes the buffers a RenderWorkspace keeps and would advance a TemporalSort twice.")
+
+    batched, cameras, render_grid, splat_idx, tile_mask = render_setup(xyz_ws, rotations, scales, opacity,
+                                                                       world_view_transform, proj_mat, cam_pos,
+                                                                       fovy, fovx, height, width, tile_size,
+                                                                       workspace, frustum_culling, cull_min_opacity,
+                                                                       cull_min_radius, spatial_index, roi)
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = cameras
+    n_cameras = world_view_transform.shape[0]
+    n_points = xyz_ws.shape[0]
+
+    # Tensors that live on the CPU are rendered with the PyTorch reference implementation.
+    if xyz_ws.device.type == "cpu":
+        vertex_and_tile_shader_fn = vertex_and_tile_shader_torch
+        # The reference checkpoints its vertex shader, see recompute.py.
+        vertex_shader_fn = None
+        alpha_blend_fn = AlphaBlendTiledRenderTorch.apply
+    else:
+        vertex_and_tile_shader_fn = vertex_and_tile_shader
+        vertex_shader_fn = vertex_shader_outputs
+        alpha_blend_fn = AlphaBlendTiledRender.apply
+
+    if sparse_grad:
+        sparse_inputs = [sparse_row_grad(t) for t in (xyz_ws, rotations, scales, opacity, sh_coeffs)]
+        xyz_ws, rotations, scales, opacity, sh_coeffs = sparse_inputs
+
+    tile_shader_args = (xyz_ws, rotations, scales, sh_coeffs, active_sh, world_view_transform, proj_mat, cam_pos,
+                        fovy, fovx, render_grid)
+    tile_shader_kwargs = dict(depth_bits=depth_bits, opacity=opacity, tight_tile_bounds=tight_tile_bounds,
+                              splat_idx=splat_idx, balanced_keys=balanced_keys,
+                              splat_dtype=splat_dtype or torch.float, tile_mask=tile_mask)
+    recompute = None
+    if low_memory:
+        recompute = TileShaderRecompute(vertex_and_tile_shader_fn, *tile_shader_args,
+                                        vertex_shader_fn=vertex_shader_fn, **tile_shader_kwargs)
+    (sorted_gauss_idx, tile_ranges, radii,
+     xyz_vs, inv_cov_vs, rgb, n_keys_saved) = vertex_and_tile_shader_fn(*tile_shader_args,
+                                                                        workspace=workspace,
+                                                                        sparse_grad=sparse_grad,
+                                                                        temporal_sort=temporal_sort,
+                                                                        recompute_vertex=recompute,
+                                                                        **tile_shader_kwargs)
+    if low_memory:
+        # radii and xyz_vs are returned in the render package, so only the other outputs are freed.
+        n_bytes_recomputed = recomputed_bytes(sorted_gauss_idx, tile_ranges, inv_cov_vs, rgb)
+        record_recompute_counters(n_bytes_recomputed)
+    blend_radii = radii
+    if splat_idx is not None:
+        # Scatter the compacted splats back to all C * N pairs, so that the radii and the
+        # gradients of the viewspace points stay per Gaussian.
+        radii = scatter_entries(radii, splat_idx, n_cameras * n_points)
+        xyz_vs = scatter_entries(xyz_vs, splat_idx, n_cameras * n_points)
+    record_frame_counters(sorted_gauss_idx, tile_ranges, radii)
+    if sparse_grad:
+        rows = visible_gaussian_rows(radii, n_points)
+        for tensor in sparse_inputs:
+            set_sparse_rows(tensor, rows)
    
-    # retain_grad fails if called with torch.no_grad() under evaluation
-    try:
-        xyz_vs.retain_grad()
-    except:
-        pass
+    viewspace_points = xyz_vs.view(n_cameras, n_points, 3) if batched else xyz_vs
+    densification = None
+    if densification_stats is not None or absgrad:
+        # The backward blend accumulates the statistics, the gradient does not need to be retained.
+        densification = DensificationFrame(densification_stats, blend_radii, splat_idx, n_points,
+                                           viewspace_points if absgrad else None)
+    if densification_stats is None and viewspace_points.requires_grad:
+        viewspace_points.retain_grad()
+
+    # Every camera blends its own copy of the opacities, autograd sums their gradients.
+    if n_cameras > 1:
+        opacity = opacity.repeat((n_cameras,) + (1,) * (opacity.dim() - 1))
+    blend_xyz_vs = viewspace_points.reshape(n_cameras * n_points, 3)
+    if splat_idx is not None:
+        # The keys index the compacted splats, gather their inputs again for blending.
+        entries = splat_idx.long()
+        blend_xyz_vs = blend_xyz_vs[entries]
+        opacity = opacity[entries]
 
-    image_rgb = AlphaBlendTiledRender.apply(
+    output_img, output_depth = alpha_blend_fn(
         sorted_gauss_idx,
         tile_ranges,
-        xyz_vs,
+        blend_xyz_vs,
         inv_cov_vs,
         opacity,
         rgb,
-        render_grid)
+        render_grid,
+        workspace,
+        grad_reduction,
+        densification,
+        render_depth,
+        recompute)
     
-    render_pkg = {
-        'render': image_rgb.permute(2,0,1)[:3, ...],
-        'viewspace_points': xyz_vs,
-        'visibility_filter': radii > 0,
-        'radii': radii,
-    }
+    radii = radii.view(n_cameras, n_points)
+    render_pkg = {name: image if batched else image[0]
+                  for name, image in blend_outputs(output_img, output_depth, render_grid, background, roi).items()}
+    render_pkg.update({
+        'viewspace_points': viewspace_points,
+        'visibility_filter': radii > 0 if batched else radii[0] > 0,
+        'radii': radii if batched else radii[0],
+    })
+    if tight_tile_bounds:
+        render_pkg['n_keys'] = sorted_gauss_idx.shape[0]
+        render_pkg['n_keys_saved'] = n_keys_saved
+    if low_memory:
+        render_pkg['n_bytes_recomputed'] = n_bytes_recomputed
+    if profile:
+        render_pkg['profiler'] = active_profiler()
 
     return render_pkg
 
 
-class AlphaBlendTiledRender(torch.autograd.Function):
-    @staticmethod
-    def forward(ctx, 
-                sorted_gauss_idx, tile_ranges,
-                xyz_vs, inv_cov_vs, opacity, rgb, render_grid, device="cuda"):
-        output_img = torch.zeros((render_grid.image_height, 
-                                  render_grid.image_width, 4), 
-                                 device=device)
-        n_contributors = torch.zeros((render_grid.image_height, 
-                                      render_grid.image_width, 1),
-                                     dtype=torch.int32, device=device)
+def render_alpha_blend_tiles_slang_inference(xyz_ws, rotations, scales, opacity,
+                                             sh_coeffs, active_sh,
+                                             world_view_transform, proj_mat, cam_pos,
+                                             fovy, fovx, height, width, tile_size=16, workspace=None,
+                                             depth_bits=None, tight_tile_bounds=False,
+                                             frustum_culling=False, cull_min_opacity=0.0, cull_min_radius=0.0,
+                                             spatial_index=None, balanced_keys=False, temporal_sort=None,
+                                             splat_dtype=None, roi=None, render_depth=False, background=None):
+    """Renders like render_alpha_blend_tiles_slang_raw, for viewers and evaluation that need no gradients.
+
+    Runs outside of autograd: nothing is saved for a backward pass, the blend
+    kernel does not track the contributors of the pixels, and the vertex pass
+    only reads the spherical harmonics of the splats that are visible. Takes
+    the arguments of the raw function that do not concern training and
+    returns the same package without 'viewspace_points'.
+
+    Calls from several threads are safe as long as each thread uses its own
+    RenderWorkspace or none, since the workspace buffers are reused between
+    calls. The Slang modules are loaded once, under a lock.
+    """
+    batched, cameras, render_grid, splat_idx, tile_mask = render_setup(xyz_ws, rotations, scales, opacity,
+                                                                       world_view_transform, proj_mat, cam_pos,
+                                                                       fovy, fovx, height, width, tile_size,
+                                                                       workspace, frustum_culling, cull_min_opacity,
+                                                                       cull_min_radius, spatial_index, roi)
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = cameras
+    n_cameras = world_view_transform.shape[0]
+    n_points = xyz_ws.shape[0]
+
+    on_cpu = xyz_ws.device.type == "cpu"
+    with torch.no_grad():
+        vertex_and_tile_shader_fn = vertex_and_tile_shader_torch if on_cpu else vertex_and_tile_shader
+        (sorted_gauss_idx, tile_ranges, radii,
+         xyz_vs, inv_cov_vs, rgb, n_keys_saved) = vertex_and_tile_shader_fn(xyz_ws, rotations, scales, sh_coeffs,
+                                                                            active_sh, world_view_transform, proj_mat,
+                                                                            cam_pos, fovy, fovx, render_grid,
+                                                                            workspace=workspace,
+                                                                            depth_bits=depth_bits,
+                                                                            opacity=opacity,
+                                                                            tight_tile_bounds=tight_tile_bounds,
+                                                                            splat_idx=splat_idx,
+                                                                            balanced_keys=balanced_keys,
+                                                                            inference=True,
+                                                                            temporal_sort=temporal_sort,
+                                                                            splat_dtype=splat_dtype or torch.float,
+                                                                            tile_mask=tile_mask)
+        record_frame_counters(sorted_gauss_idx, tile_ranges, radii)
+
+        if n_cameras > 1:
+            opacity = opacity.repeat((n_cameras,) + (1,) * (opacity.dim() - 1))
+        if splat_idx is not None:
+            opacity = opacity[splat_idx.long()]
+        output_depth = None
+        if render_depth:
+            output_depth = allocate_buffer(workspace, "output_depth", (n_cameras * height, width), torch.float,
+                                           xyz_ws.device, zero=False)
+        if on_cpu:
+            output_img, _, _ = alpha_blend_torch(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, opacity, rgb,
+                                                 render_grid, workspace, output_depth)
+        else:
+            output_img, _, _ = run_splat_tiled(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, opacity, rgb,
+                                               render_grid, workspace, track_contributors=False,
+                                               output_depth=output_depth)
+        if splat_idx is not None:
+            radii = scatter_entries(radii, splat_idx, n_cameras * n_points)
+
+        radii = radii.view(n_cameras, n_points)
+        render_pkg = {name: image if batched else image[0]
+                      for name, image in blend_outputs(output_img, output_depth, render_grid, background, roi).items()}
+    render_pkg.update({
+        'visibility_filter': radii > 0 if batched else radii[0] > 0,
+        'radii': radii if batched else radii[0],
+    })
+    if tight_tile_bounds:
+        render_pkg['n_keys'] = sorted_gauss_idx.shape[0]
+        render_pkg['n_keys_saved'] = n_keys_saved
+    return render_pkg
+
+
+def render_setup(xyz_ws, rotations, scales, opacity, world_view_transform, proj_mat, cam_pos, fovy, fovx,
+                 height, width, tile_size, workspace, frustum_culling, cull_min_opacity, cull_min_radius,
+                 spatial_index, roi):
+    """Runs the preamble that the raw and the inference render share.
+
+    Adds the camera dimension to a single camera, builds the RenderGrid,
+    starts a frame of the workspace, and lists the splats that the
+    spatial index and the frustum culling keep.
+
+    Returns:
+      batched: Whether the cameras came with a camera dimension.
+      cameras: world_view_transform [C, 4, 4], proj_mat [C, 4, 4], cam_pos [C, 3], fovy [C] and fovx [C].
+      render_grid: The RenderGrid of the images.
+      splat_idx: The int32 c * N + i entries of the kept splats [M], None if every splat is kept.
+      tile_mask: The bool tile mask of the roi, None without one.
+    """
+    batched = world_view_transform.dim() == 3
+    if not batched:
+        world_view_transform = world_view_transform[None]
+        proj_mat = proj_mat[None]
+        cam_pos = cam_pos[None]
+    n_cameras = world_view_transform.shape[0]
+    n_points = xyz_ws.shape[0]
+    fovy = torch.as_tensor(fovy, dtype=torch.float, device=xyz_ws.device).reshape(-1).expand(n_cameras).contiguous()
+    fovx = torch.as_tensor(fovx, dtype=torch.float, device=xyz_ws.device).reshape(-1).expand(n_cameras).contiguous()
+
+    tile_height, tile_width = tile_size_hw(tile_size)
+    render_grid = RenderGrid(height,
+                             width,
+                             tile_height=tile_height,
+                             tile_width=tile_width)
+    if workspace is not None:
+        assert workspace.matches(render_grid), "The RenderWorkspace was created for a different RenderGrid."
+        workspace.next_frame()
+
+    splat_idx = None
+    if spatial_index is not None:
+        assert spatial_index.n_points == n_points, "The spatial index is out of date, refit it after densification."
+        with profile_stage("spatial_index_query", xyz_ws.device):
+            splat_idx = spatial_index.query(world_view_transform, proj_mat, fovy, fovx, render_grid)
+    if frustum_culling:
+        # Tensors that live on the CPU are culled with the PyTorch reference implementation.
+        frustum_cull_fn = frustum_cull_torch if xyz_ws.device.type == "cpu" else frustum_cull
+        splat_idx = frustum_cull_fn(xyz_ws, rotations, scales, opacity,
+                                    world_view_transform, proj_mat, cam_pos, fovy, fovx, render_grid,
+                                    cull_min_opacity, cull_min_radius, splat_idx)
+    if splat_idx is not None:
+        record_cull_counters(splat_idx, n_cameras * n_points)
+    tile_mask = None if roi is None else roi_tile_mask(roi, render_grid, n_cameras, xyz_ws.device)
+    return batched, (world_view_transform, proj_mat, cam_pos, fovy, fovx), render_grid, splat_idx, tile_mask
+
+
+def scatter_entries(values, splat_idx, n_entries):
+    """Scatters the rows of the compacted splats [M, ...] back to all n_entries camera and Gaussian pairs."""
+    return values.new_zeros((n_entries,) + values.shape[1:]).index_copy(0, splat_idx.long(), values)
+
+
+def blend_outputs(output_img, output_depth, render_grid, background=None, roi=None):
+    """Turns the stacked outputs of the blend into the [C, ...] images of the render package.
+
+    Returns 'render' [C, 3, H, W] composited over the background, 'alpha'
+    [C, 1, H, W] and, with an output_depth, the accumulated 'depth' and the
+    'expected_depth' [C, 1, H, W], the depth divided by the alpha. All of
+    them are cropped to a rectangle roi.
+    """
+    n_cameras = output_img.shape[0] // render_grid.image_height
+    image = output_img.view(n_cameras, render_grid.image_height, render_grid.image_width, 4).permute(0,3,1,2)
+    rgb, transmittance = image[:, :3], image[:, 3:]
+    if background is not None:
+        background = torch.as_tensor(background, dtype=rgb.dtype, device=rgb.device).reshape(-1, 3)
+        rgb = rgb + transmittance * background[:, :, None, None]
+    outputs = {'render': rgb, 'alpha': 1.0 - transmittance}
+    if output_depth is not None:
+        outputs['depth'] = output_depth.view(n_cameras, 1, render_grid.image_height, render_grid.image_width)
+        outputs['expected_depth'] = outputs['depth'] / outputs['alpha'].clamp_min(1e-10)
+    return {name: crop_to_roi(image, roi, render_grid) for name, image in outputs.items()}
+
+
+def splat_key_ranges(sorted_gauss_idx, n_splats):
+    """Groups the keys by splat, returns the key indices in list order per splat and each splat's [start, end)."""
+    key_order = torch.sort(sorted_gauss_idx, stable=True).indices.to(torch.int32)
+    counts = torch.bincount(sorted_gauss_idx, minlength=n_splats)
+    ends = torch.cumsum(counts, 0)
+    return key_order, torch.stack([ends - counts, ends], dim=1).to(torch.int32)
+
+
+def split_splat_grads(splat_grads, xyz_vs, inv_cov_vs, opacity, rgb):
+    """Splits the [M, SPLAT_GRAD_SIZE] rows of sum_key_grads into the gradients of the blend inputs."""
+    return (splat_grads[:, 0:3].reshape(xyz_vs.shape).contiguous(),
+            splat_grads[:, 3:7].reshape(inv_cov_vs.shape).contiguous(),
+            splat_grads[:, 7:8].reshape(opacity.shape).contiguous(),
+            splat_grads[:, 8:11].reshape(rgb.shape).contiguous())
+
+
+def blend_storage_args(inv_cov_vs, rgb, grad_inv_cov_vs=None, grad_rgb=None):
+    """Returns the 16-bit storage arguments of the blend kernels, the grad_* buffers are placeholders if not given."""
+    n_splats = inv_cov_vs.shape[0]
+    return {
+        'inv_cov_vs_16': storage_bits(inv_cov_vs, (n_splats, 4)),
+        'd_inv_cov_vs_16': grad_inv_cov_vs if grad_inv_cov_vs is not None else float_view(inv_cov_vs, (1, 1)),
+        'rgb_16': storage_bits(rgb, (n_splats, 3)),
+        'd_rgb_16': grad_rgb if grad_rgb is not None else float_view(rgb, (1, 1)),
+        'splat_storage': storage_format(inv_cov_vs.dtype),
+    }
+
+
+def run_splat_tiled(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, opacity, rgb, render_grid, workspace=None,
+                    track_contributors=True, output_depth=None):
+    """Allocates the stacked images of the C cameras and launches splat_tiled.
+
+    Returns output_img [C * H, W, 4], n_contributors [C * H, W, 1] and
+    tile_n_contributors [C * T]. Without track_contributors, the kernel skips
+    the contributors that only the backward pass needs and both are None.
+    With an output_depth [C * H, W], the same pass also writes the blended
+    view space depth of every pixel into it.
+    """
+    # The images of the C cameras are stacked along the rows.
+    n_cameras = tile_ranges.shape[0] // (render_grid.grid_height * render_grid.grid_width)
+    device = xyz_vs.device
+    with profile_stage("splat_tiled", device):
+        # splat_tiled writes every pixel, so the workspace does not need to clear them.
+        output_img = allocate_buffer(workspace, "output_img",
+                                     (n_cameras * render_grid.image_height, render_grid.image_width, 4),
+                                     torch.float, device, zero=False)
+        if track_contributors:
+            n_contributors = allocate_buffer(workspace, "n_contributors",
+                                             (n_cameras * render_grid.image_height, render_grid.image_width, 1),
+                                             torch.int32, device, zero=False)
+            # Every block writes the largest n_contributors of its tile.
+            tile_n_contributors = allocate_buffer(workspace, "tile_n_contributors", (tile_ranges.shape[0],),
+                                                  torch.int32, device, zero=False)
+        else:
+            n_contributors = torch.zeros((1, 1, 1), dtype=torch.int32, device=device)
+            tile_n_contributors = torch.zeros((1,), dtype=torch.int32, device=device)
 
         assert (render_grid.tile_height, render_grid.tile_width) in slang_modules.alpha_blend_shaders, (
             'Alpha Blend Shader was not compiled for this tile'
@@ -90,69 +500,184 @@ class AlphaBlendTiledRender(torch.autograd.Function):
         splat_kernel_with_args = alpha_blend_tile_shader.splat_tiled(
             sorted_gauss_idx=sorted_gauss_idx,
             tile_ranges=tile_ranges,
-            xyz_vs=xyz_vs, inv_cov_vs=inv_cov_vs, 
-            opacity=opacity, rgb=rgb, 
+            xyz_vs=xyz_vs, inv_cov_vs=float_view(inv_cov_vs, (1, 1, 1)),
+            opacity=opacity, rgb=float_view(rgb, (1, 1)),
             output_img=output_img,
             n_contributors=n_contributors,
+            tile_n_contributors=tile_n_contributors,
+            key_grads=torch.zeros((1, SPLAT_GRAD_SIZE), dtype=torch.float, device=device),
+            track_contributors=track_contributors,
+            abs_grad_xy=torch.zeros((1, 2), dtype=torch.float, device=device),
+            track_abs_grad=False,
+            output_depth=output_depth if output_depth is not None else torch.zeros((1, 1), device=device),
+            d_output_depth=torch.zeros((1, 1), device=device),
+            render_depth=output_depth is not None,
+            **blend_storage_args(inv_cov_vs, rgb),
+            image_height=render_grid.image_height,
             grid_height=render_grid.grid_height,
             grid_width=render_grid.grid_width,
             tile_height=render_grid.tile_height,
             tile_width=render_grid.tile_width
         )
         splat_kernel_with_args.launchRaw(
-            blockSize=(render_grid.tile_width, 
+            blockSize=(render_grid.tile_width,
                        render_grid.tile_height, 1),
-            gridSize=(render_grid.grid_width, 
-                      render_grid.grid_height, 1)
+            gridSize=(render_grid.grid_width,
+                      render_grid.grid_height, n_cameras)
         )
+    if not track_contributors:
+        return output_img, None, None
+    return output_img, n_contributors, tile_n_contributors
+
+
+def run_accumulate_densification_stats(alpha_blend_tile_shader, densification, xyz_vs_grad, abs_grad_xy):
+    """Adds the statistics of the blended splats of a DensificationFrame to its DensificationStats in one launch."""
+    stats = densification.stats
+    radii = densification.radii.reshape(-1)
+    splat_idx = densification.splat_idx
+    alpha_blend_tile_shader.accumulate_densification_stats(
+        xyz_vs_grad=xyz_vs_grad,
+        abs_grad_xy=abs_grad_xy,
+        radii=radii,
+        splat_idx=splat_idx if splat_idx is not None else radii,
+        use_splat_idx=splat_idx is not None,
+        track_abs_grad=stats.absgrad,
+        n_points=densification.n_points,
+        grad_norm_sum=stats.grad_norm_sum,
+        abs_grad_sum=stats.abs_grad_sum,
+        visible_count=stats.visible_count,
+        max_radii=stats.max_radii).launchRaw(
+            blockSize=(256, 1, 1),
+            gridSize=((radii.shape[0] + 255) // 256, 1, 1))
+
+
+class AlphaBlendTiledRender(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, 
+                sorted_gauss_idx, tile_ranges,
+                xyz_vs, inv_cov_vs, opacity, rgb, render_grid, workspace=None, grad_reduction="atomic",
+                densification=None, render_depth=False, recompute=None):
+        output_depth = None
+        if render_depth:
+            n_cameras = tile_ranges.shape[0] // (render_grid.grid_height * render_grid.grid_width)
+            # splat_tiled writes every pixel, so the workspace does not need to clear them.
+            output_depth = allocate_buffer(workspace, "output_depth",
+                                           (n_cameras * render_grid.image_height, render_grid.image_width),
+                                           torch.float, xyz_vs.device, zero=False)
+        output_img, n_contributors, tile_n_contributors = run_splat_tiled(sorted_gauss_idx, tile_ranges,
+                                                                          xyz_vs, inv_cov_vs, opacity, rgb,
+                                                                          render_grid, workspace,
+                                                                          output_depth=output_depth)
 
-        ctx.save_for_backward(sorted_gauss_idx, tile_ranges,
-                              xyz_vs, inv_cov_vs, opacity, rgb, 
-                              output_img, n_contributors)
+        if recompute is not None:
+            # The tile lists and the splats are recomputed before the backward pass, see recompute.py.
+            ctx.save_for_backward(None, None, None, None, opacity, None,
+                                  output_img, n_contributors, tile_n_contributors)
+        else:
+            ctx.save_for_backward(sorted_gauss_idx, tile_ranges,
+                                  xyz_vs, inv_cov_vs, opacity, rgb, 
+                                  output_img, n_contributors, tile_n_contributors)
+        ctx.recompute = recompute
+        ctx.render_depth = render_depth
         ctx.render_grid = render_grid
+        ctx.grad_reduction = grad_reduction
+        ctx.densification = densification
+        ctx.profiler = active_profiler()
+        record_contributor_counters(n_contributors)
 
-        return output_img
+        return output_img, output_depth
 
     @staticmethod
-    def backward(ctx, grad_output_img):
+    def backward(ctx, grad_output_img, grad_output_depth):
         (sorted_gauss_idx, tile_ranges, 
          xyz_vs, inv_cov_vs, opacity, rgb, 
-         output_img, n_contributors) = ctx.saved_tensors
+         output_img, n_contributors, tile_n_contributors) = ctx.saved_tensors
+        if ctx.recompute is not None:
+            with profile_stage("recompute", opacity.device, ctx.profiler):
+                sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, rgb = ctx.recompute.outputs()
         render_grid = ctx.render_grid
+        n_cameras = tile_ranges.shape[0] // (render_grid.grid_height * render_grid.grid_width)
 
-        xyz_vs_grad = torch.zeros_like(xyz_vs)
-        inv_cov_vs_grad = torch.zeros_like(inv_cov_vs)
-        opacity_grad = torch.zeros_like(opacity)
-        rgb_grad = torch.zeros_like(rgb)
+        with profile_stage("splat_tiled.bwd", xyz_vs.device, ctx.profiler):
+            # The gradients of reduced precision splats are accumulated in float32.
+            xyz_vs_grad = torch.zeros_like(xyz_vs)
+            inv_cov_vs_grad = torch.zeros_like(inv_cov_vs, dtype=torch.float)
+            opacity_grad = torch.zeros_like(opacity)
+            rgb_grad = torch.zeros_like(rgb, dtype=torch.float)
+            deterministic = ctx.grad_reduction == "deterministic"
+            # Only the deterministic mode writes one gradient row per key.
+            key_grads = torch.zeros((sorted_gauss_idx.shape[0] if deterministic else 1, SPLAT_GRAD_SIZE),
+                                    dtype=torch.float, device=xyz_vs.device)
+            densification = ctx.densification
+            track_abs_grad = densification is not None and densification.absgrad
+            abs_grad_xy = torch.zeros((xyz_vs.shape[0] if track_abs_grad else 1, 2),
+                                      dtype=torch.float, device=xyz_vs.device)
+            record_allocation(xyz_vs_grad.nbytes + inv_cov_vs_grad.nbytes + opacity_grad.nbytes + rgb_grad.nbytes +
+                              key_grads.nbytes + abs_grad_xy.nbytes, ctx.profiler)
 
 
-        assert (render_grid.tile_height, render_grid.tile_width) in slang_modules.alpha_blend_shaders, (
-            'Alpha Blend Shader was not compiled for this tile'
-            f' {render_grid.tile_height}x{render_grid.tile_width} configuration, available configurations:'
-            f' {slang_modules.alpha_blend_shaders.keys()}'
-        )
+            assert (render_grid.tile_height, render_grid.tile_width) in slang_modules.alpha_blend_shaders, (
+                'Alpha Blend Shader was not compiled for this tile'
+                f' {render_grid.tile_height}x{render_grid.tile_width} configuration, available configurations:'
+                f' {slang_modules.alpha_blend_shaders.keys()}'
+            )
 
-        alpha_blend_tile_shader = slang_modules.alpha_blend_shaders[(render_grid.tile_height, render_grid.tile_width)]
+            alpha_blend_tile_shader = slang_modules.alpha_blend_shaders[(render_grid.tile_height, render_grid.tile_width,
+                                                                         GRAD_REDUCTION_MODES[ctx.grad_reduction])]
 
-        kernel_with_args = alpha_blend_tile_shader.splat_tiled.bwd(
-            sorted_gauss_idx=sorted_gauss_idx,
-            tile_ranges=tile_ranges,
-            xyz_vs=(xyz_vs, xyz_vs_grad),
-            inv_cov_vs=(inv_cov_vs, inv_cov_vs_grad),
-            opacity=(opacity, opacity_grad),
-            rgb=(rgb, rgb_grad),
-            output_img=(output_img, grad_output_img),
-            n_contributors=n_contributors,
-            grid_height=render_grid.grid_height,
-            grid_width=render_grid.grid_width,
-            tile_height=render_grid.tile_height,
-            tile_width=render_grid.tile_width)
-        
-        kernel_with_args.launchRaw(
-            blockSize=(render_grid.tile_width, 
-                       render_grid.tile_height, 1),
-            gridSize=(render_grid.grid_width, 
-                      render_grid.grid_height, 1)
-        )
+            kernel_with_args = alpha_blend_tile_shader.splat_tiled.bwd(
+                sorted_gauss_idx=sorted_gauss_idx,
+                tile_ranges=tile_ranges,
+                xyz_vs=(xyz_vs, xyz_vs_grad),
+                inv_cov_vs=float_grad_pair(inv_cov_vs, inv_cov_vs_grad, (1, 1, 1)),
+                opacity=(opacity, opacity_grad),
+                rgb=float_grad_pair(rgb, rgb_grad, (1, 1)),
+                output_img=(output_img, grad_output_img),
+                n_contributors=n_contributors,
+                tile_n_contributors=tile_n_contributors,
+                key_grads=key_grads,
+                track_contributors=True,
+                abs_grad_xy=abs_grad_xy,
+                track_abs_grad=track_abs_grad,
+                output_depth=torch.zeros((1, 1), device=xyz_vs.device),
+                d_output_depth=(grad_output_depth.contiguous() if ctx.render_depth
+                                else torch.zeros((1, 1), device=xyz_vs.device)),
+                render_depth=ctx.render_depth,
+                **blend_storage_args(inv_cov_vs, rgb,
+                                     grad_inv_cov_vs=(inv_cov_vs_grad.view(-1, 4)
+                                                      if is_reduced(inv_cov_vs) else None),
+                                     grad_rgb=rgb_grad if is_reduced(rgb) else None),
+                image_height=render_grid.image_height,
+                grid_height=render_grid.grid_height,
+                grid_width=render_grid.grid_width,
+                tile_height=render_grid.tile_height,
+                tile_width=render_grid.tile_width)
         
-        return None, None, xyz_vs_grad, inv_cov_vs_grad, opacity_grad, rgb_grad, None, None
+            kernel_with_args.launchRaw(
+                blockSize=(render_grid.tile_width, 
+                           render_grid.tile_height, 1),
+                gridSize=(render_grid.grid_width, 
+                          render_grid.grid_height, n_cameras)
+            )
+
+            if deterministic:
+                key_order, key_ranges = splat_key_ranges(sorted_gauss_idx, xyz_vs.shape[0])
+                splat_grads = torch.empty((xyz_vs.shape[0], SPLAT_GRAD_SIZE), dtype=torch.float, device=xyz_vs.device)
+                alpha_blend_tile_shader.sum_key_grads(key_grads=key_grads, key_order=key_order,
+                                                      splat_key_ranges=key_ranges,
+                                                      splat_grads=splat_grads).launchRaw(
+                    blockSize=(256, 1, 1),
+                    gridSize=((xyz_vs.shape[0] + 255) // 256, 1, 1))
+                xyz_vs_grad, inv_cov_vs_grad, opacity_grad, rgb_grad = split_splat_grads(splat_grads, xyz_vs, inv_cov_vs,
+                                                                                         opacity, rgb)
+
+            if densification is not None:
+                if track_abs_grad:
+                    densification.set_absgrad(abs_grad_xy)
+                if densification.stats is not None:
+                    run_accumulate_densification_stats(alpha_blend_tile_shader, densification,
+                                                       xyz_vs_grad, abs_grad_xy)
+        record_backward_skip_counters(tile_ranges, tile_n_contributors, render_grid, ctx.profiler)
+
+        return (None, None, xyz_vs_grad, inv_cov_vs_grad.to(inv_cov_vs.dtype), opacity_grad, rgb_grad.to(rgb.dtype),
+                None, None, None, None, None, None)
@@ -0,0 +1,355 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pure PyTorch reference of the tiled alpha blending in alphablend_shader.slang.
+
+Tiles are processed in batches of similar list length and every tile list is
+walked in rounds of `SPLATS_PER_ROUND` splats, the same way the Slang kernel
+walks it in rounds of shared memory, so the peak memory is bounded and the
+rounds stop as soon as every pixel of the batch has saturated.
+"""
+
+import torch
+from slang_gaussian_rasterization.internal.tile_shader_torch import ndc2pix
+from slang_gaussian_rasterization.internal.render_workspace import allocate_buffer
+from slang_gaussian_rasterization.internal.densification_stats import accumulate_densification_stats_torch
+from slang_gaussian_rasterization.internal.profiler import (active_profiler, profile_stage, record_allocation,
+                                                            record_contributor_counters, record_backward_skip_counters)
+
+ALPHA_THRESHOLD = 1.0 / 255.0
+TRANSMITTANCE_THRESHOLD = 0.0001
+MAX_ALPHA = 0.99
+
+SPLATS_PER_ROUND = 64
+MAX_ELEMENTS_PER_BATCH = 1 << 22
+
+
+def tile_batches(tile_ranges, render_grid):
+    """Yields batches of non-empty tile indices, longest lists first."""
+    tile_lengths = (tile_ranges[:, 1] - tile_ranges[:, 0]).to(torch.int64)
+    non_empty_tiles = torch.nonzero(tile_lengths > 0).squeeze(1)
+    order = non_empty_tiles[torch.argsort(tile_lengths[non_empty_tiles], descending=True)]
+    n_pixels = render_grid.tile_height * render_grid.tile_width
+    batch_size = max(1, MAX_ELEMENTS_PER_BATCH // (n_pixels * SPLATS_PER_ROUND))
+    for i in range(0, order.shape[0], batch_size):
+        yield order[i:i + batch_size]
+
+
+def tile_pixel_coords(tile_idx, render_grid):
+    """Returns the coordinates [B, P] of every pixel in the given tiles of the camera stacked grids.
+
+    Besides the pixel coordinates within the camera's image it returns the flat
+    index of the pixel in the [C * H * W] stacked images and whether it is inside
+    the image.
+    """
+    local_idx = torch.arange(render_grid.tile_height * render_grid.tile_width, device=tile_idx.device)
+    cam_idx = tile_idx // (render_grid.grid_height * render_grid.grid_width)
+    cam_tile_idx = tile_idx % (render_grid.grid_height * render_grid.grid_width)
+    tile_y = cam_tile_idx // render_grid.grid_width
+    tile_x = cam_tile_idx % render_grid.grid_width
+    pix_x = tile_x[:, None] * render_grid.tile_width + (local_idx % render_grid.tile_width)[None]
+    pix_y = tile_y[:, None] * render_grid.tile_height + (local_idx // render_grid.tile_width)[None]
+    is_inside = (pix_x < render_grid.image_width) & (pix_y < render_grid.image_height)
+    pix_flat = (cam_idx[:, None] * render_grid.image_height + pix_y) * render_grid.image_width + pix_x
+    pix_flat = torch.where(is_inside, pix_flat, torch.zeros_like(pix_flat))
+    return pix_x, pix_y, pix_flat, is_inside
+
+
+def prepare_splats(xyz_vs, inv_cov_vs, opacity, render_grid):
+    """Precomputes the per-splat pixel-space centers [N, 2] and conics [N, 3] used by evaluate_splats."""
+    center = torch.stack([ndc2pix(xyz_vs[:, 0], render_grid.image_width),
+                          ndc2pix(xyz_vs[:, 1], render_grid.image_height)], dim=1)
+    conic = torch.stack([inv_cov_vs[:, 0, 0],
+                         inv_cov_vs[:, 0, 1] + inv_cov_vs[:, 1, 0],
+                         inv_cov_vs[:, 1, 1]], dim=1)
+    return center, conic, opacity.reshape(-1)
+
+
+def evaluate_splats(splat_idx, pix_x, pix_y, center, conic, opacity):
+    """Evaluates the splats [B, L] on the pixels [B, P] of their tile, see evaluate_splat in utils.slang.
+
+    Returns the pixel offsets, the Gaussian falloff, the unclamped and the clamped alpha, all [B, P, L].
+    """
+    d_x = pix_x[:, :, None].to(center.dtype) - center[splat_idx, 0][:, None, :]
+    d_y = pix_y[:, :, None].to(center.dtype) - center[splat_idx, 1][:, None, :]
+    g_conic = conic[splat_idx][:, None, :, :]
+    power = -0.5 * (g_conic[..., 0] * d_x * d_x +
+                    g_conic[..., 2] * d_y * d_y +
+                    g_conic[..., 1] * d_x * d_y)
+    gauss = torch.exp(power)
+    alpha_raw = opacity[splat_idx][:, None, :] * gauss
+    alpha = torch.clamp_max(alpha_raw, MAX_ALPHA)
+    return d_x, d_y, gauss, alpha_raw, alpha
+
+
+def round_splat_idx(sorted_gauss_idx, tile_start, tile_length, round_start, round_end):
+    """Gathers the Gaussian indices [B, L] of one round, padding entries past the end of a list with index 0."""
+    offsets = torch.arange(round_start, round_end, device=tile_start.device)
+    in_list = offsets[None, :] < tile_length[:, None]
+    list_idx = torch.where(in_list, tile_start[:, None] + offsets[None, :], torch.zeros_like(in_list, dtype=torch.int64))
+    return sorted_gauss_idx[list_idx].to(torch.int64), offsets, in_list
+
+
+def alpha_blend_torch(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, opacity, rgb, render_grid, workspace=None,
+                      output_depth=None):
+    """Forward tiled alpha blending.
+
+    Returns output_img [C * H, W, 4], n_contributors [C * H, W, 1] and the
+    largest n_contributors of every tile, tile_n_contributors [C * T]. With an
+    output_depth [C * H, W], the blended view space depth is written into it.
+    """
+    # Splats stored in 16 bits are blended in the dtype of xyz_vs, float32 like the kernel.
+    inv_cov_vs, rgb = inv_cov_vs.to(xyz_vs.dtype), rgb.to(xyz_vs.dtype)
+    device = xyz_vs.device
+    n_cameras = tile_ranges.shape[0] // (render_grid.grid_height * render_grid.grid_width)
+    n_pixels = n_cameras * render_grid.image_height * render_grid.image_width
+    output_img = allocate_buffer(workspace, "output_img", (n_pixels, 4), xyz_vs.dtype, device)
+    output_img[:, 3] = 1.0
+    n_contributors = allocate_buffer(workspace, "n_contributors", (n_pixels,), torch.int32, device)
+    tile_n_contributors = allocate_buffer(workspace, "tile_n_contributors", (tile_ranges.shape[0],), torch.int32, device)
+    center, conic, opacity = prepare_splats(xyz_vs, inv_cov_vs, opacity, render_grid)
+
+    for tile_idx in tile_batches(tile_ranges, render_grid):
+        pix_x, pix_y, pix_flat, is_inside = tile_pixel_coords(tile_idx, render_grid)
+        tile_start = tile_ranges[tile_idx, 0].to(torch.int64)
+        tile_length = tile_ranges[tile_idx, 1].to(torch.int64) - tile_start
+
+        pixel_rgb = torch.zeros(pix_x.shape + (3,), device=device, dtype=xyz_vs.dtype)
+        pixel_depth = torch.zeros(pix_x.shape, device=device, dtype=xyz_vs.dtype)
+        transmittance = torch.ones(pix_x.shape, device=device, dtype=xyz_vs.dtype)
+        local_n_contrib = torch.zeros(pix_x.shape, device=device, dtype=torch.int32)
+        thread_active = is_inside.clone()
+
+        max_length = int(tile_length.max())
+        for round_start in range(0, max_length, SPLATS_PER_ROUND):
+            if not thread_active.any():
+                break
+            round_end = min(round_start + SPLATS_PER_ROUND, max_length)
+            splat_idx, _, in_list = round_splat_idx(sorted_gauss_idx, tile_start, tile_length, round_start, round_end)
+            _, _, _, _, alpha = evaluate_splats(splat_idx, pix_x, pix_y, center, conic, opacity)
+
+            alpha = torch.where(in_list[:, None, :] & (alpha >= ALPHA_THRESHOLD), alpha, torch.zeros_like(alpha))
+            # Prepending the running transmittance keeps the products in the same order as the kernel.
+            trans = torch.cumprod(torch.cat([transmittance[..., None], 1.0 - alpha], dim=-1), dim=-1)
+            contrib = thread_active[..., None] & in_list[:, None, :] & (trans[..., 1:] >= TRANSMITTANCE_THRESHOLD)
+
+            weight = torch.where(contrib, alpha * trans[..., :-1], torch.zeros_like(alpha))
+            pixel_rgb += torch.einsum('bpl,blc->bpc', weight, rgb[splat_idx])
+            if output_depth is not None:
+                pixel_depth += torch.einsum('bpl,bl->bp', weight, xyz_vs[splat_idx, 2])
+
+            round_n_contrib = contrib.sum(dim=-1)
+            last_trans = trans[..., 1:].gather(-1, (round_n_contrib - 1).clamp_min(0)[..., None]).squeeze(-1)
+            transmittance = torch.where(round_n_contrib > 0, last_trans, transmittance)
+            local_n_contrib += round_n_contrib.to(torch.int32)
+            thread_active &= ~(in_list[:, None, :] & ~contrib).any(dim=-1)
+
+        output_img[pix_flat[is_inside]] = torch.cat([pixel_rgb, transmittance[..., None]], dim=-1)[is_inside]
+        n_contributors[pix_flat[is_inside]] = local_n_contrib[is_inside]
+        if output_depth is not None:
+            output_depth.view(-1)[pix_flat[is_inside]] = pixel_depth[is_inside]
+        tile_n_contributors[tile_idx] = local_n_contrib.amax(dim=1)
+
+    return (output_img.view(n_cameras * render_grid.image_height, render_grid.image_width, 4),
+            n_contributors.view(n_cameras * render_grid.image_height, render_grid.image_width, 1),
+            tile_n_contributors)
+
+
+def bwd_alpha_blend_torch(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, opacity, rgb,
+                          output_img, n_contributors, grad_output_img, render_grid, tile_n_contributors=None,
+                          abs_grad_xy=None, output_depth=None, grad_output_depth=None):
+    """Backward tiled alpha blending, see bwd_alpha_blend in alphablend_shader.slang.
+
+    The blending state is re-played front to back, the suffix of the color sum
+    that the kernel recovers by undoing the pixel state is taken from the
+    forward output instead. Like the kernel, every tile list is only walked up
+    to its tile_n_contributors, without them the full lists are walked.
+    The gradients of inv_cov_vs and rgb have the dtype of xyz_vs, float32, in any storage dtype.
+    With abs_grad_xy [N, 2], the absolute xy gradients of the viewspace points
+    of every pixel are added into it, see densification_stats.py. The depth
+    blended into output_depth is back-propagated like a fourth color channel
+    when grad_output_depth is given.
+    """
+    inv_cov_vs, rgb = inv_cov_vs.to(xyz_vs.dtype), rgb.to(xyz_vs.dtype)
+    device = xyz_vs.device
+    dtype = xyz_vs.dtype
+    n_points = xyz_vs.shape[0]
+    center, conic, opacity_flat = prepare_splats(xyz_vs, inv_cov_vs, opacity, render_grid)
+
+    grad_center = torch.zeros((n_points, 2), device=device, dtype=dtype)
+    grad_conic = torch.zeros((n_points, 3), device=device, dtype=dtype)
+    grad_opacity = torch.zeros((n_points,), device=device, dtype=dtype)
+    grad_rgb = torch.zeros_like(rgb)
+    grad_depth = torch.zeros((n_points,), device=device, dtype=dtype)
+    # The pixel-space centers move by half the image size per unit of NDC.
+    center_to_ndc = torch.tensor([0.5 * render_grid.image_width, 0.5 * render_grid.image_height],
+                                 device=device, dtype=dtype)
+
+    output_flat = output_img.reshape(-1, 4)
+    grad_output_flat = grad_output_img.reshape(-1, 4)
+    n_contrib_flat = n_contributors.reshape(-1)
+    render_depth = grad_output_depth is not None
+    if render_depth:
+        depth_flat = output_depth.reshape(-1)
+        grad_depth_flat = grad_output_depth.reshape(-1)
+
+    for tile_idx in tile_batches(tile_ranges, render_grid):
+        pix_x, pix_y, pix_flat, is_inside = tile_pixel_coords(tile_idx, render_grid)
+        tile_start = tile_ranges[tile_idx, 0].to(torch.int64)
+        tile_length = tile_ranges[tile_idx, 1].to(torch.int64) - tile_start
+        if tile_n_contributors is not None:
+            tile_length = torch.minimum(tile_length, tile_n_contributors[tile_idx].to(torch.int64))
+
+        inside = is_inside[..., None].to(dtype)
+        final_rgb = output_flat[pix_flat, :3]
+        final_transmittance = output_flat[pix_flat, 3]
+        d_pixel_rgb = grad_output_flat[pix_flat, :3] * inside
+        d_pixel_transmittance = grad_output_flat[pix_flat, 3] * inside[..., 0]
+        n_contrib_fwd = torch.where(is_inside, n_contrib_flat[pix_flat], torch.zeros_like(n_contrib_flat[pix_flat]))
+
+        # Only the projection of the color sum on the incoming gradient is needed to back-propagate through it.
+        d_final_rgb = (d_pixel_rgb * final_rgb).sum(dim=-1)
+        if render_depth:
+            d_pixel_depth = grad_depth_flat[pix_flat] * inside[..., 0]
+            d_final_rgb = d_final_rgb + d_pixel_depth * depth_flat[pix_flat]
+        transmittance = torch.ones(pix_x.shape, device=device, dtype=dtype)
+        d_rgb_prefix = torch.zeros(pix_x.shape, device=device, dtype=dtype)
+
+        max_length = int(tile_length.max())
+        for round_start in range(0, max_length, SPLATS_PER_ROUND):
+            round_end = min(round_start + SPLATS_PER_ROUND, max_length)
+            splat_idx, offsets, _ = round_splat_idx(sorted_gauss_idx, tile_start, tile_length, round_start, round_end)
+            d_x, d_y, gauss, alpha_raw, alpha = evaluate_splats(splat_idx, pix_x, pix_y, center, conic, opacity_flat)
+
+            contrib = (offsets[None, None, :] < n_contrib_fwd[..., None]) & (alpha >= ALPHA_THRESHOLD)
+            alpha = torch.where(contrib, alpha, torch.zeros_like(alpha))
+            trans = torch.cumprod(torch.cat([transmittance[..., None], 1.0 - alpha], dim=-1), dim=-1)
+            trans_before = trans[..., :-1]
+
+            weight = alpha * trans_before
+            d_g_rgb = torch.einsum('bpc,blc->bpl', d_pixel_rgb, rgb[splat_idx])
+            if render_depth:
+                d_g_rgb = d_g_rgb + d_pixel_depth[..., None] * xyz_vs[splat_idx, 2][:, None, :]
+            d_rgb_prefix_incl = d_rgb_prefix[..., None] + torch.cumsum(weight * d_g_rgb, dim=-1)
+            d_rgb_suffix = d_final_rgb[..., None] - d_rgb_prefix_incl
+            one_minus_alpha = 1.0 - alpha
+
+            d_alpha = (d_g_rgb * trans_before
+                       - (d_rgb_suffix + d_pixel_transmittance[..., None] * final_transmittance[..., None]) / one_minus_alpha)
+            d_alpha_raw = torch.where(contrib & (alpha_raw < MAX_ALPHA), d_alpha, torch.zeros_like(d_alpha))
+            d_power = d_alpha_raw * alpha_raw
+
+            g_conic = conic[splat_idx][:, None, :, :]
+            round_grad_rgb = torch.einsum('bpl,bpc->blc', weight, d_pixel_rgb)
+            round_grad_opacity = (d_alpha_raw * gauss).sum(dim=1)
+            round_grad_conic = torch.stack([(d_power * -0.5 * d_x * d_x).sum(dim=1),
+                                            (d_power * -0.5 * d_x * d_y).sum(dim=1),
+                                            (d_power * -0.5 * d_y * d_y).sum(dim=1)], dim=-1)
+            pixel_grad_center = torch.stack([d_power * (g_conic[..., 0] * d_x + 0.5 * g_conic[..., 1] * d_y),
+                                             d_power * (g_conic[..., 2] * d_y + 0.5 * g_conic[..., 1] * d_x)],
+                                            dim=-1)
+            round_grad_center = pixel_grad_center.sum(dim=1)
+
+            # Padded entries point at Gaussian 0 with exactly zero gradient.
+            flat_idx = splat_idx.reshape(-1)
+            grad_rgb.index_add_(0, flat_idx, round_grad_rgb.reshape(-1, 3))
+            grad_opacity.index_add_(0, flat_idx, round_grad_opacity.reshape(-1))
+            grad_conic.index_add_(0, flat_idx, round_grad_conic.reshape(-1, 3))
+            grad_center.index_add_(0, flat_idx, round_grad_center.reshape(-1, 2))
+            if render_depth:
+                grad_depth.index_add_(0, flat_idx, torch.einsum('bpl,bp->bl', weight, d_pixel_depth).reshape(-1))
+            if abs_grad_xy is not None:
+                abs_grad_xy.index_add_(0, flat_idx, (pixel_grad_center.abs().sum(dim=1).reshape(-1, 2) *
+                                                     center_to_ndc).to(abs_grad_xy.dtype))
+
+            transmittance = trans[..., -1]
+            d_rgb_prefix = d_rgb_prefix_incl[..., -1]
+
+    grad_xyz_vs = torch.zeros_like(xyz_vs)
+    grad_xyz_vs[:, :2] = grad_center * center_to_ndc
+    grad_xyz_vs[:, 2] = grad_depth
+    grad_inv_cov_vs = torch.stack([grad_conic[:, 0], grad_conic[:, 1],
+                                   grad_conic[:, 1], grad_conic[:, 2]], dim=1).view(-1, 2, 2)
+
+    return grad_xyz_vs, grad_inv_cov_vs, grad_opacity.view(opacity.shape), grad_rgb
+
+
+class AlphaBlendTiledRenderTorch(torch.autograd.Function):
+    """PyTorch counterpart of AlphaBlendTiledRender with the same inputs and outputs.
+
+    The CPU accumulates the gradients in a fixed order, so every grad_reduction gives the same result.
+    """
+    @staticmethod
+    def forward(ctx,
+                sorted_gauss_idx, tile_ranges,
+                xyz_vs, inv_cov_vs, opacity, rgb, render_grid, workspace=None, grad_reduction="atomic",
+                densification=None, render_depth=False, recompute=None):
+        with profile_stage("splat_tiled", xyz_vs.device):
+            output_depth = None
+            if render_depth:
+                n_cameras = tile_ranges.shape[0] // (render_grid.grid_height * render_grid.grid_width)
+                output_depth = allocate_buffer(workspace, "output_depth",
+                                               (n_cameras * render_grid.image_height, render_grid.image_width),
+                                               xyz_vs.dtype, xyz_vs.device)
+            output_img, n_contributors, tile_n_contributors = alpha_blend_torch(sorted_gauss_idx, tile_ranges,
+                                                           xyz_vs, inv_cov_vs, opacity, rgb,
+                                                           render_grid, workspace, output_depth)
+
+        if recompute is not None:
+            ctx.save_for_backward(None, None, None, None, opacity, None,
+                                  output_img, n_contributors, tile_n_contributors, output_depth)
+        else:
+            ctx.save_for_backward(sorted_gauss_idx, tile_ranges,
+                                  xyz_vs, inv_cov_vs, opacity, rgb,
+                                  output_img, n_contributors, tile_n_contributors, output_depth)
+        ctx.recompute = recompute
+        ctx.render_grid = render_grid
+        ctx.densification = densification
+        ctx.profiler = active_profiler()
+        record_contributor_counters(n_contributors)
+
+        return output_img, output_depth
+
+    @staticmethod
+    def backward(ctx, grad_output_img, grad_output_depth):
+        (sorted_gauss_idx, tile_ranges,
+         xyz_vs, inv_cov_vs, opacity, rgb,
+         output_img, n_contributors, tile_n_contributors, output_depth) = ctx.saved_tensors
+        if ctx.recompute is not None:
+            with profile_stage("recompute", opacity.device, ctx.profiler):
+                sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, rgb = ctx.recompute.outputs()
+
+        densification = ctx.densification
+        with profile_stage("splat_tiled.bwd", xyz_vs.device, ctx.profiler):
+            abs_grad_xy = (torch.zeros((xyz_vs.shape[0], 2), dtype=torch.float, device=xyz_vs.device)
+                           if densification is not None and densification.absgrad else None)
+            xyz_vs_grad, inv_cov_vs_grad, opacity_grad, rgb_grad = bwd_alpha_blend_torch(sorted_gauss_idx, tile_ranges,
+                                                                                         xyz_vs, inv_cov_vs, opacity, rgb,
+                                                                                         output_img, n_contributors,
+                                                                                         grad_output_img, ctx.render_grid,
+                                                                                         tile_n_contributors, abs_grad_xy,
+                                                                                         output_depth,
+                                                                                         grad_output_depth
+                                                                                         if output_depth is not None
+                                                                                         else None)
+            record_allocation(xyz_vs_grad.nbytes + inv_cov_vs_grad.nbytes + opacity_grad.nbytes + rgb_grad.nbytes,
+                              ctx.profiler)
+            if densification is not None:
+                if abs_grad_xy is not None:
+                    densification.set_absgrad(abs_grad_xy)
+                if densification.stats is not None:
+                    accumulate_densification_stats_torch(densification, xyz_vs_grad, abs_grad_xy)
+        record_backward_skip_counters(tile_ranges, tile_n_contributors, ctx.render_grid, ctx.profiler)
+
+        return (None, None, xyz_vs_grad, inv_cov_vs_grad.to(inv_cov_vs.dtype), opacity_grad, rgb_grad.to(rgb.dtype),
+                None, None, None, None, None, None)
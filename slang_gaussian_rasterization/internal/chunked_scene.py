@@ -0,0 +1,329 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Memory-mapped, spatially chunked scene files and a renderer that streams them.
+
+    convert_inria_ply("point_cloud.ply", "scene.gsc", quantize="uint8")
+    scene = ChunkedScene("scene.gsc", device="cuda", memory_budget=2 << 30)
+    render_pkg = scene.render(world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width)
+
+A scene file holds the Gaussians sorted along the Morton order of their
+means, like the leaves of GaussianOctree, and cut into chunks of chunk_size consecutive
+Gaussians. Every attribute is one contiguous array, so a chunk is a range of
+rows of each of them, and the file stores the bounding box of the means and
+the largest scale of every chunk. The attributes are stored ready to render:
+unit quaternions, and scales and opacities after their activations, with 16
+SH coefficients per color.
+
+The file starts with the 8 bytes GSCHUNK1 and the little-endian uint64
+length of a JSON header, which lists n_points, sh_degree, chunk_size,
+quantize and the offset, dtype and shape of every array. The arrays follow
+the header, at offsets aligned to 64 bytes from the end of its padding.
+
+quantize="float16" stores everything but the means in float16, and the
+spherical harmonics are then rendered from float16, see precision.py.
+quantize="uint8" also stores every SH coefficient in 8 bits, linearly
+between its minimum and maximum within the chunk.
+
+ChunkedScene maps the file with torch.from_file, so the arrays are views of
+the page cache and only the chunks that get rendered are ever read. A render
+tests the chunk boxes against the cameras like the nodes of GaussianOctree,
+copies the visible chunks that are not cached to the device, dequantizing
+them, and renders them with render_alpha_blend_tiles_slang_raw. The cache
+evicts the least recently used chunks once the cached chunks exceed
+memory_budget bytes.
+"""
+
+import collections
+import json
+import math
+import os
+import struct
+import torch
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid, tile_size_hw
+from slang_gaussian_rasterization.internal.spatial_index import boxes_visible, morton_codes
+from slang_gaussian_rasterization.internal.tile_shader_torch import EPS
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw
+
+MAGIC = b"GSCHUNK1"
+ALIGNMENT = 64
+QUANTIZE_MODES = [None, "float16", "uint8"]
+N_SH_COEFFS = 16
+MORTON_DEPTH = 10
+DTYPES = {"float32": torch.float32, "float16": torch.float16, "uint8": torch.uint8, "int64": torch.int64}
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_chunked_scene(path, xyz_ws, rotations, scales, opacity, sh_coeffs, sh_degree=3, chunk_size=4096,
+                        quantize=None):
+    """Writes the Gaussians to a chunked scene file.
+
+    Args:
+      path: The file to write.
+      xyz_ws, rotations, scales, opacity, sh_coeffs: The Gaussians in the layout of
+        render_alpha_blend_tiles_slang_raw, [N, 3], [N, 4], [N, 3], [N, 1] and [N, K, 3] with K <= 16.
+      sh_degree: The active spherical harmonics degree of the scene.
+      chunk_size: The number of Gaussians per chunk.
+      quantize: One of QUANTIZE_MODES.
+    """
+    assert quantize in QUANTIZE_MODES, f"Unknown quantize {quantize}, available: {QUANTIZE_MODES}"
+    with torch.no_grad():
+        xyz_ws, rotations, scales, opacity, sh_coeffs = (t.detach().float().cpu()
+                                                         for t in (xyz_ws, rotations, scales, opacity, sh_coeffs))
+        n_points = xyz_ws.shape[0]
+        scene_min = xyz_ws.min(dim=0).values
+        scene_extent = torch.clamp_min((xyz_ws.max(dim=0).values - scene_min).max(), EPS)
+        n_cells = 1 << MORTON_DEPTH
+        cells = torch.clamp(((xyz_ws - scene_min) / scene_extent * n_cells).long(), 0, n_cells - 1)
+        order = torch.sort(morton_codes(cells, MORTON_DEPTH), stable=True).indices
+        xyz_ws, rotations, scales, opacity, sh_coeffs = (t[order] for t in (xyz_ws, rotations, scales,
+                                                                            opacity.reshape(-1, 1), sh_coeffs))
+        rotations = torch.nn.functional.normalize(rotations, dim=1)
+        sh_coeffs = torch.cat([sh_coeffs, sh_coeffs.new_zeros((n_points, N_SH_COEFFS - sh_coeffs.shape[1], 3))], dim=1)
+
+        n_chunks = math.ceil(n_points / chunk_size)
+        chunk_of_point = torch.arange(n_points) // chunk_size
+        arrays = {
+            'chunk_start': torch.cat([torch.arange(0, n_points, chunk_size), torch.tensor([n_points])]),
+            'chunk_box_min': xyz_ws.new_full((n_chunks, 3), torch.inf).scatter_reduce(
+                0, chunk_of_point[:, None].expand(-1, 3), xyz_ws, "amin"),
+            'chunk_box_max': xyz_ws.new_full((n_chunks, 3), -torch.inf).scatter_reduce(
+                0, chunk_of_point[:, None].expand(-1, 3), xyz_ws, "amax"),
+            'chunk_max_scale': xyz_ws.new_zeros((n_chunks,)).scatter_reduce(
+                0, chunk_of_point, scales.abs().amax(dim=1), "amax"),
+            'xyz_ws': xyz_ws,
+        }
+        attribute_dtype = torch.float32 if quantize is None else torch.float16
+        arrays.update({'rotations': rotations.to(attribute_dtype), 'scales': scales.to(attribute_dtype),
+                       'opacity': opacity.to(attribute_dtype)})
+        if quantize == "uint8":
+            index = chunk_of_point[:, None, None].expand(-1, N_SH_COEFFS, 3)
+            sh_min = sh_coeffs.new_full((n_chunks, N_SH_COEFFS, 3), torch.inf).scatter_reduce(
+                0, index, sh_coeffs, "amin")
+            sh_max = sh_coeffs.new_full((n_chunks, N_SH_COEFFS, 3), -torch.inf).scatter_reduce(
+                0, index, sh_coeffs, "amax")
+            sh_scale = (sh_max - sh_min) / 255.0
+            quantized = torch.round((sh_coeffs - sh_min[chunk_of_point]) / sh_scale[chunk_of_point].clamp_min(1e-12))
+            arrays.update({'sh_coeffs': quantized.clamp(0, 255).to(torch.uint8), 'sh_min': sh_min,
+                           'sh_scale': sh_scale})
+        else:
+            arrays['sh_coeffs'] = sh_coeffs.to(attribute_dtype)
+
+    header = {'version': 1, 'n_points': n_points, 'sh_degree': sh_degree, 'chunk_size': chunk_size,
+              'quantize': quantize, 'arrays': {}}
+    offset = 0
+    for name, array in arrays.items():
+        header['arrays'][name] = {'offset': offset, 'dtype': str(array.dtype).split(".")[-1],
+                                  'shape': list(array.shape)}
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header).encode()
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+        f.truncate(data_start + offset)
+    # Write the arrays through a shared mapping of the file, without another copy in memory.
+    mapped = torch.from_file(path, shared=True, size=data_start + offset, dtype=torch.uint8)
+    for name, array in arrays.items():
+        start = data_start + header['arrays'][name]['offset']
+        mapped[start:start + array.nbytes].copy_(array.contiguous().view(-1).view(torch.uint8))
+    del mapped
+
+
+def read_inria_ply(path):
+    """Reads a point_cloud.ply of the Inria code base.
+
+    Returns:
+      The xyz_ws [N, 3], rotations [N, 4], scales [N, 3], opacity [N, 1] and sh_coeffs [N, K, 3] after their
+      activations, like the get_* properties of the Inria GaussianModel, and the sh_degree.
+    """
+    with open(path, "rb") as f:
+        assert f.readline().strip() == b"ply", f"{path} is not a PLY file."
+        properties, n_points = [], None
+        while True:
+            line = f.readline().decode().strip()
+            if line.startswith("format"):
+                assert line.split()[1] == "binary_little_endian", "Only binary little-endian PLY files are supported."
+            elif line.startswith("element vertex"):
+                n_points = int(line.split()[2])
+            elif line.startswith("property"):
+                dtype, name = line.split()[1:3]
+                assert dtype == "float", f"Only float properties are supported, {name} is {dtype}."
+                properties.append(name)
+            elif line == "end_header":
+                break
+        body = f.read(n_points * len(properties) * 4)
+    values = torch.frombuffer(bytearray(body), dtype=torch.float32).view(n_points, len(properties))
+    column = {name: i for i, name in enumerate(properties)}
+
+    def columns(prefix):
+        names = sorted((name for name in properties if name.startswith(prefix)), key=lambda n: int(n.split("_")[-1]))
+        return values[:, [column[name] for name in names]]
+
+    xyz_ws = values[:, [column["x"], column["y"], column["z"]]]
+    features_dc = columns("f_dc_")
+    features_rest = columns("f_rest_")
+    n_rest = features_rest.shape[1] // 3
+    sh_degree = int(round(math.sqrt(n_rest + 1))) - 1
+    # The Inria PLY stores the rest of the coefficients color by color.
+    sh_coeffs = torch.cat([features_dc[:, None, :], features_rest.view(n_points, 3, n_rest).transpose(1, 2)], dim=1)
+    opacity = torch.sigmoid(values[:, [column["opacity"]]])
+    scales = torch.exp(columns("scale_"))
+    rotations = torch.nn.functional.normalize(columns("rot_"), dim=1)
+    return xyz_ws, rotations, scales, opacity, sh_coeffs.contiguous(), sh_degree
+
+
+def convert_inria_ply(ply_path, path, chunk_size=4096, quantize=None):
+    """Converts a point_cloud.ply of the Inria code base into a chunked scene file."""
+    xyz_ws, rotations, scales, opacity, sh_coeffs, sh_degree = read_inria_ply(ply_path)
+    write_chunked_scene(path, xyz_ws, rotations, scales, opacity, sh_coeffs, sh_degree, chunk_size, quantize)
+
+
+class ChunkedScene():
+    """Renders a chunked scene file, keeping the recently rendered chunks on the device.
+
+    Args:
+      path: The file written by write_chunked_scene.
+      device: The device the chunks are rendered on.
+      memory_budget: The most bytes of chunks the cache keeps on the device, None for no limit. The
+                     chunks of the current view are kept even if they alone exceed it.
+
+    Attributes:
+      stats: Totals over all renders of 'n_chunk_loads', 'bytes_read' from the file, 'bytes_loaded' on the
+             device after dequantization, 'n_cache_hits' and 'n_evictions'.
+    """
+    def __init__(self, path, device="cuda", memory_budget=None):
+        with open(path, "rb") as f:
+            assert f.read(len(MAGIC)) == MAGIC, f"{path} is not a chunked scene file."
+            header_length, = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_length))
+        data_start = _aligned(len(MAGIC) + 8 + header_length)
+        self.data = torch.from_file(path, shared=False, size=os.path.getsize(path), dtype=torch.uint8)
+        self.arrays = {}
+        for name, array in self.header['arrays'].items():
+            dtype = DTYPES[array['dtype']]
+            n_bytes = math.prod(array['shape']) * torch.tensor([], dtype=dtype).element_size()
+            start = data_start + array['offset']
+            self.arrays[name] = self.data[start:start + n_bytes].view(dtype).view(array['shape'])
+        self.device = torch.device(device)
+        self.memory_budget = memory_budget
+        self.chunk_start = self.arrays['chunk_start'].tolist()
+        self.chunk_bounds = [self.arrays[name].to(self.device)
+                             for name in ('chunk_box_min', 'chunk_box_max', 'chunk_max_scale')]
+        self.cache = collections.OrderedDict()
+        self.cache_bytes = 0
+        self.stats = {'n_chunk_loads': 0, 'bytes_read': 0, 'bytes_loaded': 0, 'n_cache_hits': 0,
+                      'n_evictions': 0}
+
+    @property
+    def n_points(self):
+        return self.header['n_points']
+
+    @property
+    def n_chunks(self):
+        return len(self.chunk_start) - 1
+
+    @property
+    def sh_degree(self):
+        return self.header['sh_degree']
+
+    def visible_chunks(self, world_view_transform, proj_mat, fovy, fovx, render_grid):
+        """Lists the chunks that can touch the tile grid of any of the batched cameras."""
+        with torch.no_grad():
+            n_cameras = world_view_transform.shape[0]
+            cam_idx = torch.arange(n_cameras, device=self.device).repeat_interleave(self.n_chunks)
+            chunk_idx = torch.arange(self.n_chunks, device=self.device).repeat(n_cameras)
+            box_min, box_max, max_scale = (bound[chunk_idx] for bound in self.chunk_bounds)
+            visible = boxes_visible(box_min, box_max, max_scale, cam_idx, world_view_transform, proj_mat,
+                                    fovy, fovx, render_grid)
+            return torch.unique(chunk_idx[visible]).tolist()
+
+    def load_chunk(self, chunk):
+        """Copies a chunk from the file to the device, returns its xyz_ws, rotations, scales, opacity and sh_coeffs."""
+        start, end = self.chunk_start[chunk], self.chunk_start[chunk + 1]
+        stored = {name: self.arrays[name][start:end] for name in ('xyz_ws', 'rotations', 'scales', 'opacity',
+                                                                  'sh_coeffs')}
+        if self.header['quantize'] == "uint8":
+            stored.update({name: self.arrays[name][chunk] for name in ('sh_min', 'sh_scale')})
+        self.stats['bytes_read'] += sum(t.nbytes for t in stored.values())
+        loaded = {name: t.to(self.device) for name, t in stored.items()}
+        sh_coeffs = loaded['sh_coeffs']
+        if self.header['quantize'] == "uint8":
+            sh_coeffs = loaded['sh_min'] + sh_coeffs.float() * loaded['sh_scale']
+        return (loaded['xyz_ws'], loaded['rotations'].float(), loaded['scales'].float(), loaded['opacity'].float(),
+                sh_coeffs)
+
+    def chunks(self, chunk_ids):
+        """Returns the tensors of the chunks, loading the ones that are not cached and evicting the oldest."""
+        entries = []
+        for chunk in chunk_ids:
+            if chunk in self.cache:
+                self.cache.move_to_end(chunk)
+                self.stats['n_cache_hits'] += 1
+            else:
+                self.cache[chunk] = self.load_chunk(chunk)
+                n_bytes = sum(t.nbytes for t in self.cache[chunk])
+                self.cache_bytes += n_bytes
+                self.stats['n_chunk_loads'] += 1
+                self.stats['bytes_loaded'] += n_bytes
+            entries.append(self.cache[chunk])
+        if self.memory_budget is not None:
+            current = set(chunk_ids)
+            for chunk in list(self.cache):
+                if self.cache_bytes <= self.memory_budget:
+                    break
+                if chunk not in current:
+                    self.cache_bytes -= sum(t.nbytes for t in self.cache.pop(chunk))
+                    self.stats['n_evictions'] += 1
+        return entries
+
+    def render(self, world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width, tile_size=16,
+               **render_kwargs):
+        """Renders the chunks visible from the cameras with render_alpha_blend_tiles_slang_raw.
+
+        Takes the cameras of render_alpha_blend_tiles_slang_raw and passes render_kwargs on to it.
+
+        Returns:
+          Its render package, with 'gaussian_ids', the rows of the rendered Gaussians in the file [M], and
+          'stream_stats' with the visible chunks, chunk loads, bytes read and loaded of this render and the bytes
+          in the cache after it.
+        """
+        batched = world_view_transform.dim() == 3
+        n_cameras = world_view_transform.shape[0] if batched else 1
+        fovy_batch = torch.as_tensor(fovy, dtype=torch.float, device=self.device).reshape(-1).expand(n_cameras)
+        fovx_batch = torch.as_tensor(fovx, dtype=torch.float, device=self.device).reshape(-1).expand(n_cameras)
+        tile_height, tile_width = tile_size_hw(tile_size)
+        render_grid = RenderGrid(height, width, tile_height=tile_height, tile_width=tile_width)
+        chunk_ids = self.visible_chunks(world_view_transform if batched else world_view_transform[None],
+                                        proj_mat if batched else proj_mat[None], fovy_batch, fovx_batch, render_grid)
+        # An empty view still renders one chunk, none of its splats can reach the image.
+        chunk_ids = chunk_ids or [0]
+
+        loads, bytes_read, bytes_loaded = (self.stats[name] for name in ('n_chunk_loads', 'bytes_read',
+                                                                          'bytes_loaded'))
+        entries = self.chunks(chunk_ids)
+        xyz_ws, rotations, scales, opacity, sh_coeffs = (torch.cat(tensors) for tensors in zip(*entries))
+        render_pkg = render_alpha_blend_tiles_slang_raw(xyz_ws, rotations, scales, opacity, sh_coeffs,
+                                                        self.sh_degree, world_view_transform, proj_mat, cam_pos,
+                                                        fovy, fovx, height, width, tile_size=tile_size,
+                                                        **render_kwargs)
+        render_pkg['gaussian_ids'] = torch.cat([torch.arange(self.chunk_start[chunk], self.chunk_start[chunk + 1])
+                                                for chunk in chunk_ids])
+        render_pkg['stream_stats'] = {'n_visible_chunks': len(chunk_ids),
+                                      'n_chunk_loads': self.stats['n_chunk_loads'] - loads,
+                                      'bytes_read': self.stats['bytes_read'] - bytes_read,
+                                      'bytes_loaded': self.stats['bytes_loaded'] - bytes_loaded,
+                                      'cache_bytes': self.cache_bytes}
+        return render_pkg
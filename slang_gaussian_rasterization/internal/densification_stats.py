@@ -0,0 +1,125 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Densification statistics accumulated by the backward pass of the blend.
+
+    stats = DensificationStats(gaussians.get_xyz.shape[0], device="cuda")
+    render_pkg = render_alpha_blend_tiles_slang_raw(..., densification_stats=stats)
+    loss.backward()
+    grads = stats.mean_grad()
+
+The trainers of 3DGS densify the Gaussians whose viewspace points got large
+gradients. Instead of retaining the gradient of the viewspace points and
+reducing it in Python after every backward pass, the backward blend adds,
+for every camera and Gaussian pair with a non-zero radius, the norm of the
+xy gradient of its viewspace point, the norm of the xy gradient summed with
+absolute values over the pixels (gsplat's absgrad, with absgrad=True), one
+visible count and its radius into the buffers, on the GPU in one kernel.
+The Inria trainer's xyz_gradient_accum, denom and max_radii2D are
+grad_norm_sum, visible_count and max_radii.
+"""
+
+import weakref
+import torch
+
+
+class DensificationStats():
+    """Per-Gaussian buffers that the backward passes of the renders accumulate into.
+
+    Attributes:
+      grad_norm_sum: The sum of the norms of the xy gradients of the viewspace points [N].
+      abs_grad_sum: The same sum for the absolute gradients [N], only accumulated with absgrad.
+      visible_count: The number of camera and Gaussian pairs with a non-zero radius [N], int32.
+      max_radii: The largest radius in pixels [N], int32.
+    """
+    def __init__(self, n_points, device="cuda", absgrad=False):
+        self.absgrad = absgrad
+        self.reset(n_points, device)
+
+    def reset(self, n_points=None, device=None):
+        """Zeroes the buffers, and resizes them when the number of Gaussians changed after densification."""
+        n_points = self.n_points if n_points is None else n_points
+        device = self.grad_norm_sum.device if device is None else device
+        self.grad_norm_sum = torch.zeros((n_points,), dtype=torch.float, device=device)
+        self.abs_grad_sum = torch.zeros((n_points if self.absgrad else 1,), dtype=torch.float, device=device)
+        self.visible_count = torch.zeros((n_points,), dtype=torch.int32, device=device)
+        self.max_radii = torch.zeros((n_points,), dtype=torch.int32, device=device)
+
+    @property
+    def n_points(self):
+        return self.grad_norm_sum.shape[0]
+
+    def mean_grad(self):
+        """Returns the mean gradient norm of every Gaussian over the pairs it was visible in."""
+        return self.grad_norm_sum / self.visible_count.clamp_min(1)
+
+    def mean_abs_grad(self):
+        assert self.absgrad, "The absolute gradients are only accumulated with absgrad=True."
+        return self.abs_grad_sum / self.visible_count.clamp_min(1)
+
+
+class DensificationFrame():
+    """What the backward blend of one render needs to accumulate its statistics.
+
+    Args:
+      stats: The DensificationStats to accumulate into, or None.
+      radii: The radii of the blended splats [M].
+      splat_idx: The c * N + i entries of the blended splats, None if they are all C * N pairs.
+      n_points: The number N of Gaussians.
+      absgrad_target: The viewspace points whose .absgrad the backward pass sets, or None.
+    """
+    def __init__(self, stats, radii, splat_idx, n_points, absgrad_target=None):
+        assert stats is None or stats.n_points == n_points, (
+            f"The DensificationStats hold {stats.n_points} Gaussians but {n_points} are rendered, "
+            "reset them after densification.")
+        self.stats = stats
+        self.radii = radii
+        self.splat_idx = splat_idx
+        self.n_points = n_points
+        # A weak reference, the viewspace points hold the graph that holds this frame.
+        self.absgrad_target = None if absgrad_target is None else weakref.ref(absgrad_target)
+
+    @property
+    def absgrad(self):
+        """Whether the backward blend needs to sum the absolute gradients of the splats."""
+        return (self.stats is not None and self.stats.absgrad) or self.absgrad_target is not None
+
+    def gaussian_ids(self):
+        """Returns the Gaussian of every blended splat [M]."""
+        if self.splat_idx is None:
+            return torch.arange(self.radii.shape[0], device=self.radii.device) % self.n_points
+        return self.splat_idx.long() % self.n_points
+
+    def set_absgrad(self, abs_grad_xy):
+        """Sets .absgrad of the viewspace points from the absolute xy gradients of the splats [M, 2]."""
+        target = self.absgrad_target() if self.absgrad_target is not None else None
+        if target is None:
+            return
+        absgrad = torch.zeros((target.numel() // 3, 3), dtype=abs_grad_xy.dtype, device=abs_grad_xy.device)
+        if self.splat_idx is None:
+            absgrad[:, :2] = abs_grad_xy
+        else:
+            absgrad[self.splat_idx.long(), :2] = abs_grad_xy
+        target.absgrad = absgrad.view(target.shape)
+
+
+def accumulate_densification_stats_torch(frame, xyz_vs_grad, abs_grad_xy=None):
+    """PyTorch counterpart of accumulate_densification_stats in alphablend_shader.slang."""
+    stats = frame.stats
+    visible = frame.radii.reshape(-1) > 0
+    gaussian_ids = frame.gaussian_ids()[visible]
+    stats.grad_norm_sum.index_add_(0, gaussian_ids, xyz_vs_grad[visible, :2].norm(dim=-1).float())
+    if stats.absgrad:
+        stats.abs_grad_sum.index_add_(0, gaussian_ids, abs_grad_xy[visible].norm(dim=-1).float())
+    stats.visible_count.index_add_(0, gaussian_ids, torch.ones_like(gaussian_ids, dtype=torch.int32))
+    stats.max_radii.scatter_reduce_(0, gaussian_ids, frame.radii.reshape(-1)[visible].to(torch.int32), "amax")
@@ -0,0 +1,67 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Layout of the tile/depth sort keys.
+
+By default every key is 64 bits, (tile_id << 32) | float_bits(z), and the
+radix sort runs over 32 + tile_bits bits. With `depth_bits` set, the depth
+is instead quantized between the nearest and farthest visible splat of the
+frame and packed as (tile_id << depth_bits) | quantized_z. When tile_bits +
+depth_bits fit into 32 bits the keys are stored as 32-bit integers, which
+halves the bytes moved by the sort and drops the radix passes to
+(tile_bits + depth_bits) / 8; otherwise the exact 64-bit keys are used.
+"""
+
+import torch
+
+
+def depth_key_layout(n_tiles, depth_bits=None):
+    """Chooses the key encoding for a frame with n_tiles tiles (over all cameras).
+
+    Returns:
+      compact_keys: True if the keys are 32-bit quantized depth keys.
+      end_bit: The number of low key bits the radix sort has to look at.
+    """
+    tile_bits = n_tiles.bit_length()
+    if depth_bits is not None:
+        assert 0 < depth_bits < 32, "depth_bits must be in [1, 31]."
+        if tile_bits + depth_bits <= 32:
+            return True, tile_bits + depth_bits
+    return False, 32 + tile_bits
+
+
+def key_tile_ids(sorted_keys, depth_bits=None):
+    """Extracts the tile ids from 64-bit keys or from 32-bit compact keys with depth_bits depth bits."""
+    if sorted_keys.dtype == torch.int32:
+        return (sorted_keys.to(torch.int64) & 0xFFFFFFFF) >> depth_bits
+    return sorted_keys >> 32
+
+
+def visible_depth_range(xyz_vs, radii):
+    """Returns the [near, far] view-space depth of the splats with a non-zero radius as a [2] tensor.
+
+    Stays on the device, so picking the quantization bounds does not synchronize with the host.
+    """
+    visible = radii.reshape(-1) > 0
+    z = xyz_vs[:, 2].detach()
+    near = torch.where(visible, z, torch.inf).min()
+    far = torch.where(visible, z, -torch.inf).max()
+    return torch.stack([near, far]).contiguous()
+
+
+def quantize_depth_torch(z, depth_range, depth_bits):
+    """Maps z in [near, far] linearly to the integers [0, 2^depth_bits - 1], like quantize_depth in tile_shader.slang."""
+    near, far = depth_range[0], depth_range[1]
+    t = (z - near) / torch.clamp_min(far - near, 1e-7)
+    q = (torch.clamp(t, 0.0, 1.0) * float(1 << depth_bits)).to(torch.int64)
+    return torch.clamp_max(q, (1 << depth_bits) - 1)
@@ -0,0 +1,373 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Image-space distributed rendering over torch.distributed.
+
+    torch.distributed.init_process_group("nccl")  # "gloo" for tensors on the CPU
+    render_pkg = render_alpha_blend_tiles_distributed(xyz_ws, rotations, scales, opacity, sh_coeffs, ...)
+    loss(render_pkg['render']).backward()
+
+Every rank holds its own shard of the Gaussians and renders the same cameras.
+The tile rows of the RenderGrid are split into one band per rank. Every rank
+projects its shard, sends each projected splat to the ranks whose band its
+tile rectangle overlaps with one all_to_all, and generates, sorts and blends
+the keys of its band from the splats it received. The bands are then summed
+into the full image on every rank. So no rank holds the vertex outputs of all
+Gaussians, nor the keys of all tiles.
+
+The backward pass sends the gradients of the received splats back to their
+owners with the reverse all_to_all, so every rank only gets the gradients of
+its own shard. All ranks have to call backward, and the loss of every rank
+has to cover the pixels of its band, like the same loss on the gathered
+image on every rank.
+
+With balance="keys", the band boundaries are placed so that every rank
+blends about the same number of keys, from the number of keys per tile row
+summed over the ranks. balance="rows" gives every rank the same number of
+rows. The render package reports the load of every rank as 'load_balance'.
+"""
+
+import math
+import torch
+import torch.distributed as dist
+import slang_gaussian_rasterization.internal.slang.slang_modules as slang_modules
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid, tile_size_hw
+from slang_gaussian_rasterization.internal.tile_shader_slang import VertexShader
+from slang_gaussian_rasterization.internal.tile_shader_torch import (compute_tile_ranges_torch, generate_keys_torch,
+                                                                     vertex_shader_torch)
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import AlphaBlendTiledRender, blend_outputs
+from slang_gaussian_rasterization.internal.alphablend_tiled_torch import AlphaBlendTiledRenderTorch
+from slang_gaussian_rasterization.internal.depth_keys import depth_key_layout
+from slang_gaussian_rasterization.internal.temporal_sort import full_sort
+from slang_gaussian_rasterization.internal.profiler import profile_stage, record_frame_counters
+
+BALANCE_MODES = ["keys", "rows"]
+
+# The 11 floats of a projected splat that travel between the ranks: xyz_vs, inv_cov_vs, opacity and rgb.
+SPLAT_SIZES = [3, 4, 1, 3]
+
+
+def row_key_histogram(rect_tile_space, radii, grid_height):
+    """Returns the number of keys that the splats emit in every tile row [grid_height], int64."""
+    rect = rect_tile_space[radii.reshape(-1) > 0].to(torch.int64)
+    row_keys = torch.zeros((grid_height + 1,), dtype=torch.int64, device=rect.device)
+    width = rect[:, 2] - rect[:, 0]
+    row_keys.index_add_(0, rect[:, 1], width)
+    row_keys.index_add_(0, rect[:, 3], -width)
+    return torch.cumsum(row_keys, dim=0)[:grid_height]
+
+
+def tile_row_bands(row_costs, world_size):
+    """Splits the tile rows into world_size contiguous bands of about equal cost.
+
+    Returns:
+      The [world_size + 1] row boundaries, band r covers the tile rows [bands[r], bands[r + 1]).
+    """
+    grid_height = row_costs.shape[0]
+    # The cost above every row boundary, rows without keys still cost a little.
+    cost_above = torch.cumsum(torch.cat([row_costs.new_zeros((1,)), row_costs]).double().clamp_min(0) + 1e-6, dim=0)
+    targets = cost_above[-1] * torch.arange(1, world_size, dtype=torch.double, device=row_costs.device) / world_size
+    # Every inner boundary is the row boundary closest to its target.
+    after = torch.searchsorted(cost_above, targets).clamp(1, grid_height)
+    closer_before = (targets - cost_above[after - 1]) < (cost_above[after] - targets)
+    inner = torch.where(closer_before, after - 1, after)
+    bands = torch.cat([inner.new_zeros((1,)), inner, inner.new_full((1,), grid_height)])
+    return torch.cummax(bands, dim=0).values.to(torch.int64)
+
+
+class SplatExchange(torch.autograd.Function):
+    """Sends the rows of splats to the ranks, grouped by destination, the backward pass returns their gradients."""
+    @staticmethod
+    def forward(ctx, splats, send_counts, recv_counts, group=None):
+        received = splats.new_empty((sum(recv_counts), splats.shape[1]))
+        dist.all_to_all_single(received, splats.contiguous(), recv_counts, send_counts, group=group)
+        ctx.send_counts = send_counts
+        ctx.recv_counts = recv_counts
+        ctx.group = group
+        return received
+
+    @staticmethod
+    def backward(ctx, grad_received):
+        grad_splats = grad_received.new_empty((sum(ctx.send_counts), grad_received.shape[1]))
+        dist.all_to_all_single(grad_splats, grad_received.contiguous(), ctx.send_counts, ctx.recv_counts,
+                               group=ctx.group)
+        return grad_splats, None, None, None
+
+
+class BandGather(torch.autograd.Function):
+    """Sums the bands of the ranks into the full image, every rank keeps the gradient of its own band.
+
+    With sum_grads, the gradients of the full image are first summed over the ranks, for losses that each
+    cover only part of the image, like the cameras of their rank.
+    """
+    @staticmethod
+    def forward(ctx, image, band_mask, group=None, sum_grads=False):
+        full_image = image * band_mask
+        dist.all_reduce(full_image, group=group)
+        ctx.save_for_backward(band_mask)
+        ctx.group = group
+        ctx.sum_grads = sum_grads
+        return full_image
+
+    @staticmethod
+    def backward(ctx, grad_full_image):
+        band_mask, = ctx.saved_tensors
+        if ctx.sum_grads:
+            grad_full_image = grad_full_image.clone(memory_format=torch.contiguous_format)
+            dist.all_reduce(grad_full_image, group=ctx.group)
+        return grad_full_image * band_mask, None, None, None
+
+
+def gather_cameras(world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width, group=None):
+    """Gathers the batched cameras of all ranks, in rank order.
+
+    Returns:
+      The world_view_transform [C, 4, 4], proj_mat [C, 4, 4], cam_pos [C, 3], fovy [C] and fovx [C] of the
+      cameras of all ranks, and the range [first, last) of the cameras of this rank among them.
+    """
+    world_size = dist.get_world_size(group)
+    rank = dist.get_rank(group)
+    n_cameras = world_view_transform.shape[0]
+    device = world_view_transform.device
+    sizes = torch.tensor([n_cameras, height, width], dtype=torch.int64, device=device)
+    all_sizes = [torch.empty_like(sizes) for _ in range(world_size)]
+    dist.all_gather(all_sizes, sizes, group=group)
+    all_sizes = torch.stack(all_sizes).tolist()
+    assert all(size[1:] == [height, width] for size in all_sizes), "Every rank has to render the same image size."
+    # Every camera travels as one row of its matrices, position and fields of view, padded to the most cameras.
+    rows = torch.cat([world_view_transform.reshape(n_cameras, 16), proj_mat.reshape(n_cameras, 16),
+                      cam_pos.reshape(n_cameras, 3), fovy[:, None], fovx[:, None]], dim=1).float()
+    padded = rows.new_zeros((max(size[0] for size in all_sizes), rows.shape[1]))
+    padded[:n_cameras] = rows
+    gathered = [torch.empty_like(padded) for _ in range(world_size)]
+    dist.all_gather(gathered, padded, group=group)
+    rows = torch.cat([camera_rows[:size[0]] for camera_rows, size in zip(gathered, all_sizes)])
+    first = sum(size[0] for size in all_sizes[:rank])
+    cameras = (rows[:, :16].view(-1, 4, 4), rows[:, 16:32].view(-1, 4, 4), rows[:, 32:35].contiguous(),
+               rows[:, 35].contiguous(), rows[:, 36].contiguous())
+    return cameras, (first, first + n_cameras)
+
+
+def exchange_rows(rows, send_counts, recv_counts, group=None):
+    """all_to_all of tensors that need no gradient, like the counts and the tile rectangles."""
+    received = rows.new_empty((sum(recv_counts),) + rows.shape[1:])
+    dist.all_to_all_single(received, rows.contiguous(), recv_counts, send_counts, group=group)
+    return received
+
+
+def project_splats(xyz_ws, rotations, scales, sh_coeffs, active_sh, world_view_transform, proj_mat, cam_pos,
+                   fovy, fovx, render_grid):
+    """Runs the vertex shader over the local Gaussians, returns the rect_tile_space, radii, xyz_vs, inv_cov_vs and rgb."""
+    with profile_stage("vertex_shader", xyz_ws.device):
+        if xyz_ws.device.type == "cpu":
+            _, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = vertex_shader_torch(xyz_ws, rotations, scales,
+                                                                                     sh_coeffs, active_sh,
+                                                                                     world_view_transform, proj_mat,
+                                                                                     cam_pos, fovy, fovx, render_grid)
+        else:
+            _, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = VertexShader.apply(
+                xyz_ws, rotations, scales, sh_coeffs, active_sh, world_view_transform, proj_mat, cam_pos,
+                fovy, fovx, render_grid, None, xyz_ws.new_zeros((1, 1)), False,
+                torch.zeros((1,), dtype=torch.int32, device=xyz_ws.device), False)
+    return rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb
+
+
+def band_tile_shader(xyz_vs, rect_tile_space, camera_idx, band_start, band_end, n_cameras, render_grid):
+    """Generates, sorts and ranges the keys of the received splats within the tile rows [band_start, band_end)."""
+    with torch.no_grad():
+        n_splats = xyz_vs.shape[0]
+        device = xyz_vs.device
+        n_tiles = n_cameras * render_grid.grid_height * render_grid.grid_width
+        with profile_stage("generate_keys", device):
+            rect = rect_tile_space.to(torch.int32)
+            rect[:, 1].clamp_(min=band_start)
+            rect[:, 3].clamp_(max=band_end)
+            tiles_touched = ((rect[:, 2] - rect[:, 0]) * (rect[:, 3] - rect[:, 1]).clamp_min(0)).to(torch.int32)
+            # Entry c * M + j holds received splat j seen from camera c, like compacted splats.
+            entries = camera_idx.to(torch.int64) * n_splats + torch.arange(n_splats, device=device)
+            if device.type == "cpu":
+                unsorted_keys, unsorted_gauss_idx = generate_keys_torch(xyz_vs, rect, tiles_touched,
+                                                                        max(n_splats, 1), render_grid,
+                                                                        splat_idx=entries)
+            else:
+                index_buffer_offset = torch.cumsum(tiles_touched, dim=0, dtype=torch.int32)
+                n_keys = int(index_buffer_offset[-1]) if n_splats > 0 else 0
+                unsorted_keys = torch.empty((n_keys,), dtype=torch.int64, device=device)
+                unsorted_gauss_idx = torch.empty((n_keys,), dtype=torch.int32, device=device)
+                slang_modules.tile_shader.generate_keys(xyz_vs=xyz_vs,
+                                                        rect_tile_space=rect.contiguous(),
+                                                        index_buffer_offset=index_buffer_offset,
+                                                        out_unsorted_keys=unsorted_keys,
+                                                        out_unsorted_gauss_idx=unsorted_gauss_idx,
+                                                        inv_cov_vs=torch.zeros((1, 2, 2), device=device),
+                                                        opacity=torch.zeros((1, 1), device=device),
+                                                        n_points=max(n_splats, 1),
+                                                        image_height=render_grid.image_height,
+                                                        image_width=render_grid.image_width,
+                                                        grid_height=render_grid.grid_height,
+                                                        grid_width=render_grid.grid_width,
+                                                        tile_height=render_grid.tile_height,
+                                                        tile_width=render_grid.tile_width,
+                                                        tight_tile_bounds=False,
+                                                        splat_idx=entries.to(torch.int32),
+                                                        compacted=True).launchRaw(
+                    blockSize=(256, 1, 1),
+                    gridSize=(max(math.ceil(n_splats / 256), 1), 1, 1))
+        with profile_stage("sort_by_keys", device):
+            _, end_bit = depth_key_layout(n_tiles, None)
+            sorted_keys, sorted_gauss_idx = full_sort(unsorted_keys, unsorted_gauss_idx, end_bit)
+        with profile_stage("compute_tile_ranges", device):
+            if device.type == "cpu":
+                tile_ranges = compute_tile_ranges_torch(sorted_keys, n_cameras, render_grid)
+            else:
+                tile_ranges = torch.zeros((n_tiles, 2), dtype=torch.int32, device=device)
+                slang_modules.tile_shader.compute_tile_ranges(sorted_keys=sorted_keys,
+                                                              out_tile_ranges=tile_ranges).launchRaw(
+                    blockSize=(256, 1, 1),
+                    gridSize=(max(math.ceil(sorted_keys.shape[0] / 256), 1), 1, 1))
+    return sorted_gauss_idx, tile_ranges
+
+
+def render_alpha_blend_tiles_distributed(xyz_ws, rotations, scales, opacity,
+                                         sh_coeffs, active_sh,
+                                         world_view_transform, proj_mat, cam_pos,
+                                         fovy, fovx, height, width, tile_size=16, group=None,
+                                         balance="keys", grad_reduction="atomic", render_depth=False,
+                                         background=None, local_cameras=False):
+    """Renders the local shard of the Gaussians together with the shards of the other ranks.
+
+    Takes the arguments of render_alpha_blend_tiles_slang_raw, with xyz_ws,
+    rotations, scales, opacity and sh_coeffs holding the Gaussians of this
+    rank, and the same single or batched cameras on every rank. It has to be
+    called by every rank of the process group.
+
+    With local_cameras, every rank passes its own cameras instead, which are
+    gathered and rendered together, and gets back the images of its own
+    cameras, batched. The gradients of the images are summed over the ranks,
+    so the loss of every rank covers its own cameras, like in gsplat.
+
+    Returns:
+      The render package of render_alpha_blend_tiles_slang_raw with the full
+      'render', 'alpha' and, with render_depth, 'depth' and 'expected_depth'
+      on every rank. 'viewspace_points' and 'radii' describe the local
+      Gaussians, for the cameras of this rank with local_cameras. 'load_balance' lists the tile 'rows', 'n_splats_sent',
+      'n_splats_received' and 'n_keys' of every rank, and the 'key_imbalance',
+      the largest number of keys of a rank over the mean.
+    """
+    assert balance in BALANCE_MODES, f"Unknown balance {balance}, available: {BALANCE_MODES}"
+    world_size = dist.get_world_size(group)
+    rank = dist.get_rank(group)
+
+    batched = world_view_transform.dim() == 3 or local_cameras
+    if world_view_transform.dim() == 2:
+        world_view_transform = world_view_transform[None]
+        proj_mat = proj_mat[None]
+        cam_pos = cam_pos[None]
+    n_cameras = world_view_transform.shape[0]
+    n_points = xyz_ws.shape[0]
+    device = xyz_ws.device
+    fovy = torch.as_tensor(fovy, dtype=torch.float, device=device).reshape(-1).expand(n_cameras).contiguous()
+    fovx = torch.as_tensor(fovx, dtype=torch.float, device=device).reshape(-1).expand(n_cameras).contiguous()
+    camera_range = (0, n_cameras)
+    if local_cameras:
+        (world_view_transform, proj_mat, cam_pos, fovy, fovx), camera_range = gather_cameras(
+            world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width, group)
+        n_cameras = world_view_transform.shape[0]
+    first, last = camera_range
+    tile_height, tile_width = tile_size_hw(tile_size)
+    render_grid = RenderGrid(height, width, tile_height=tile_height, tile_width=tile_width)
+    alpha_blend_fn = AlphaBlendTiledRenderTorch.apply if device.type == "cpu" else AlphaBlendTiledRender.apply
+
+    rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = project_splats(xyz_ws, rotations, scales, sh_coeffs, active_sh,
+                                                                     world_view_transform, proj_mat, cam_pos,
+                                                                     fovy, fovx, render_grid)
+
+    with torch.no_grad():
+        if balance == "keys":
+            row_costs = row_key_histogram(rect_tile_space, radii, render_grid.grid_height)
+            dist.all_reduce(row_costs, group=group)
+        else:
+            row_costs = torch.ones((render_grid.grid_height,), dtype=torch.int64, device=device)
+        bands = tile_row_bands(row_costs, world_size)
+        # Every visible splat goes to the ranks whose band its tile rectangle overlaps, grouped by rank.
+        overlaps = ((radii.reshape(1, -1) > 0) &
+                    (rect_tile_space[None, :, 1] < bands[1:, None]) & (rect_tile_space[None, :, 3] > bands[:-1, None]))
+        destination, send_idx = overlaps.nonzero(as_tuple=True)
+        send_counts = torch.bincount(destination, minlength=world_size)
+        recv_counts = torch.empty_like(send_counts)
+        dist.all_to_all_single(recv_counts, send_counts, group=group)
+        send_counts, recv_counts = send_counts.tolist(), recv_counts.tolist()
+
+    viewspace_points = xyz_vs.view(n_cameras, n_points, 3) if batched else xyz_vs
+    splat_points = viewspace_points
+    if local_cameras:
+        # Only the points of this rank's cameras are returned, the splats are built through them.
+        viewspace_points = splat_points[first:last]
+        splat_points = torch.cat([splat_points[:first], viewspace_points, splat_points[last:]])
+    with profile_stage("exchange_splats", device):
+        # Entry c * N + i blends the opacity of Gaussian i.
+        splat_opacity = opacity.reshape(-1, 1).repeat(n_cameras, 1)
+        splats = torch.cat([splat_points.reshape(-1, 3), inv_cov_vs.reshape(-1, 4).float(), splat_opacity,
+                            rgb.float()], dim=1)
+        received = SplatExchange.apply(splats[send_idx], send_counts, recv_counts, group)
+        meta = torch.cat([(send_idx // n_points)[:, None], rect_tile_space[send_idx].to(torch.int64)], dim=1)
+        received_meta = exchange_rows(meta, send_counts, recv_counts, group)
+    recv_xyz_vs, recv_inv_cov_vs, recv_opacity, recv_rgb = (t.contiguous() for t in
+                                                             received.split(SPLAT_SIZES, dim=1))
+    recv_inv_cov_vs = recv_inv_cov_vs.view(-1, 2, 2)
+
+    band_start, band_end = int(bands[rank]), int(bands[rank + 1])
+    sorted_gauss_idx, tile_ranges = band_tile_shader(recv_xyz_vs, received_meta[:, 1:], received_meta[:, 0],
+                                                     band_start, band_end, n_cameras, render_grid)
+    output_img, output_depth = alpha_blend_fn(sorted_gauss_idx, tile_ranges, recv_xyz_vs, recv_inv_cov_vs,
+                                              recv_opacity, recv_rgb, render_grid, None, grad_reduction, None,
+                                              render_depth)
+
+    with profile_stage("gather_bands", device):
+        pixel_rows = torch.arange(n_cameras * height, device=device) % height
+        band_mask = ((pixel_rows >= band_start * tile_height) &
+                     (pixel_rows < band_end * tile_height)).to(output_img.dtype)
+        output_img = BandGather.apply(output_img, band_mask[:, None, None], group, local_cameras)
+        if output_depth is not None:
+            output_depth = BandGather.apply(output_depth, band_mask[:, None], group, local_cameras)
+        output_img = output_img[first * height:last * height]
+        if output_depth is not None:
+            output_depth = output_depth[first * height:last * height]
+
+    with torch.no_grad():
+        load = torch.tensor([band_start, band_end, len(send_idx), recv_xyz_vs.shape[0], sorted_gauss_idx.shape[0]],
+                            dtype=torch.int64, device=device)
+        loads = [torch.empty_like(load) for _ in range(world_size)]
+        dist.all_gather(loads, load, group=group)
+        loads = torch.stack(loads).tolist()
+    n_keys = [l[4] for l in loads]
+    load_balance = {'rows': [(l[0], l[1]) for l in loads],
+                    'n_splats_sent': [l[2] for l in loads],
+                    'n_splats_received': [l[3] for l in loads],
+                    'n_keys': n_keys,
+                    'key_imbalance': max(n_keys) * world_size / max(sum(n_keys), 1)}
+    record_frame_counters(sorted_gauss_idx, tile_ranges, radii)
+
+    # retain_grad fails if called with torch.no_grad() under evaluation
+    if viewspace_points.requires_grad:
+        viewspace_points.retain_grad()
+    radii = radii.view(n_cameras, n_points)[first:last]
+    render_pkg = {name: image if batched else image[0]
+                  for name, image in blend_outputs(output_img, output_depth, render_grid, background).items()}
+    render_pkg.update({
+        'viewspace_points': viewspace_points,
+        'visibility_filter': radii > 0 if batched else radii[0] > 0,
+        'radii': radii if batched else radii[0],
+        'load_balance': load_balance,
+    })
+    return render_pkg
@@ -0,0 +1,258 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Level-of-detail hierarchy that renders distant regions with merged Gaussians.
+
+    lod = LODHierarchy(xyz_ws, rotations, scales, opacity, sh_coeffs)
+    render_pkg = lod.render(world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width, threshold=8.0)
+
+The hierarchy is a GaussianOctree whose every node also holds one Gaussian
+that stands for all the Gaussians below it. The merged Gaussian matches the
+first two moments of its Gaussians, weighted by opacity times the area
+s0 s1 + s1 s2 + s0 s2 of their ellipsoid: the weighted mean of the means, and
+the weighted mean of the covariances plus the spread of the means, with the
+scales and rotation read from its eigendecomposition. Its SH coefficients are
+the weighted mean of theirs. Its opacity spreads their weight over its own
+area, at most the opacity of all of them stacked.
+
+A render walks the tree from the root like GaussianOctree.query, dropping
+the nodes no camera sees. The projected size of a node is the 3 sigma
+diameter in pixels of its merged Gaussian, placed at the nearest point of a
+sphere that bounds everything below the node, the largest over the cameras.
+The cut renders the first node on every path whose size is below threshold,
+and the Gaussians of the leaves that are still larger. To avoid popping, a
+node whose size is in the top blend fraction below threshold fades into its
+children: it is rendered with its opacity times 1 - t and its children, the
+next level of merged Gaussians or the Gaussians of a leaf, with their
+opacity times t, t going linearly from 0 to 1 over that band. The merged
+Gaussians of the children of an octree node are usually about half its
+size, so with blend <= 0.5 they enter the cut without a fade of their own.
+
+The hierarchy is built once, without gradients, for rendering a trained scene.
+"""
+
+import torch
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid, tile_size_hw
+from slang_gaussian_rasterization.internal.spatial_index import GaussianOctree, boxes_visible
+from slang_gaussian_rasterization.internal.tile_shader_torch import EPS, NEAR_Z, get_covariance_from_quat_scales
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw
+
+
+def rotation_matrix_to_quaternion(rotation_matrix):
+    """Converts rotation matrices [K, 3, 3] into unit quaternions [K, 4] in the (r, x, y, z) convention."""
+    m = rotation_matrix
+    m00, m01, m02 = m[:, 0, 0], m[:, 0, 1], m[:, 0, 2]
+    m10, m11, m12 = m[:, 1, 0], m[:, 1, 1], m[:, 1, 2]
+    m20, m21, m22 = m[:, 2, 0], m[:, 2, 1], m[:, 2, 2]
+    # Every row is the quaternion scaled by 4 times one of its components, use the best conditioned one.
+    candidates = torch.stack([
+        torch.stack([1 + m00 + m11 + m22, m21 - m12, m02 - m20, m10 - m01], dim=1),
+        torch.stack([m21 - m12, 1 + m00 - m11 - m22, m01 + m10, m02 + m20], dim=1),
+        torch.stack([m02 - m20, m01 + m10, 1 - m00 + m11 - m22, m12 + m21], dim=1),
+        torch.stack([m10 - m01, m02 + m20, m12 + m21, 1 - m00 - m11 + m22], dim=1),
+    ], dim=1)
+    best = torch.stack([1 + m00 + m11 + m22, 1 + m00 - m11 - m22, 1 - m00 + m11 - m22, 1 - m00 - m11 + m22],
+                       dim=1).argmax(dim=1)
+    quaternions = candidates[torch.arange(m.shape[0], device=m.device), best]
+    return torch.nn.functional.normalize(quaternions, dim=1)
+
+
+def merge_gaussians(index, n_groups, xyz_ws, rotations, scales, opacity, sh_coeffs):
+    """Merges the Gaussians of every group into one Gaussian by moment matching.
+
+    Args:
+      index: The group [N] of every Gaussian, in [0, n_groups).
+      n_groups: The number of groups, every group must hold a Gaussian.
+      xyz_ws, rotations, scales, opacity, sh_coeffs: The Gaussians, [N, 3], [N, 4], [N, 3], [N, 1] and [N, K, 3].
+
+    Returns:
+      The merged xyz_ws, rotations, scales, opacity and sh_coeffs of the groups.
+    """
+    scales = torch.abs(scales)
+    area = scales[:, 0] * scales[:, 1] + scales[:, 1] * scales[:, 2] + scales[:, 0] * scales[:, 2]
+    weight = opacity[:, 0] * area + EPS
+    total = xyz_ws.new_zeros((n_groups,)).index_add_(0, index, weight)
+    xyz_merged = xyz_ws.new_zeros((n_groups, 3)).index_add_(0, index, weight[:, None] * xyz_ws) / total[:, None]
+    # The spread is taken around the merged means, which keeps it accurate far from the origin.
+    offset = xyz_ws - xyz_merged[index]
+    cov = get_covariance_from_quat_scales(torch.nn.functional.normalize(rotations, dim=1), scales)
+    cov = cov + offset[:, :, None] * offset[:, None, :]
+    cov_merged = xyz_ws.new_zeros((n_groups, 3, 3)).index_add_(0, index, weight[:, None, None] * cov)
+    cov_merged = cov_merged / total[:, None, None]
+
+    eigenvalues, eigenvectors = torch.linalg.eigh(cov_merged)
+    scales_merged = torch.sqrt(torch.clamp_min(eigenvalues, EPS * EPS))
+    # Flip an axis of the reflections so that the eigenvectors form a rotation.
+    handedness = torch.sign(torch.linalg.det(eigenvectors))
+    eigenvectors = torch.cat([eigenvectors[:, :, :2], eigenvectors[:, :, 2:] * handedness[:, None, None]], dim=2)
+    rotations_merged = rotation_matrix_to_quaternion(eigenvectors)
+
+    area_merged = (scales_merged[:, 0] * scales_merged[:, 1] + scales_merged[:, 1] * scales_merged[:, 2] +
+                   scales_merged[:, 0] * scales_merged[:, 2])
+    log_transmittance = xyz_ws.new_zeros((n_groups,)).index_add_(
+        0, index, torch.log1p(-torch.clamp_max(opacity[:, 0], 1.0 - EPS)))
+    opacity_merged = torch.minimum(total / torch.clamp_min(area_merged, EPS), 1.0 - torch.exp(log_transmittance))
+    sh_merged = sh_coeffs.new_zeros((n_groups,) + sh_coeffs.shape[1:]).index_add_(
+        0, index, weight[:, None, None].to(sh_coeffs.dtype) * sh_coeffs) / total[:, None, None].to(sh_coeffs.dtype)
+    return xyz_merged, rotations_merged, scales_merged, opacity_merged[:, None], sh_merged
+
+
+class LODHierarchy():
+    """Octree of merged Gaussians over N Gaussians.
+
+    Args:
+      xyz_ws, rotations, scales, opacity, sh_coeffs: The Gaussians in the layout of
+        render_alpha_blend_tiles_slang_raw, [N, 3], [N, 4], [N, 3], [N, 1] and [N, K, 3].
+      leaf_size: Targeted mean number of Gaussians per leaf, see GaussianOctree.
+      max_depth: Upper limit of the depth, see GaussianOctree.
+    """
+    def __init__(self, xyz_ws, rotations, scales, opacity, sh_coeffs, leaf_size=16, max_depth=16):
+        with torch.no_grad():
+            self.gaussians = tuple(t.detach() for t in (xyz_ws, rotations, scales, opacity.reshape(-1, 1),
+                                                         sh_coeffs))
+            self.octree = GaussianOctree(xyz_ws, rotations, scales, leaf_size=leaf_size, max_depth=max_depth)
+            self.depth = self.octree.depth
+            sorted_gaussians = [t[self.octree.order] for t in self.gaussians]
+            self.levels = []
+            for level in range(self.depth + 1):
+                self.levels.append(merge_gaussians(self.octree.point_node[level],
+                                                   self.octree.level_codes[level].shape[0], *sorted_gaussians))
+
+            # The bound scale of a node covers the Gaussians and the merged Gaussians of its whole subtree.
+            self.bound_scale = [None] * (self.depth + 1)
+            for level in reversed(range(self.depth + 1)):
+                bound_scale = torch.maximum(self.octree.max_scale[level], self.levels[level][2].amax(dim=1))
+                if level < self.depth:
+                    bound_scale = bound_scale.scatter_reduce(0, self.octree.level_parents[level],
+                                                             self.bound_scale[level + 1], "amax")
+                self.bound_scale[level] = bound_scale
+
+    @property
+    def n_nodes(self):
+        return sum(level[0].shape[0] for level in self.levels)
+
+    def _children(self, level, node_idx):
+        """Returns the children of the nodes, indices into the next level or into the sorted Gaussians of the
+        leaves, and the position in node_idx of the parent of every child."""
+        ranges = self.octree.level_children[level] if level < self.depth else self.octree.leaf_points
+        first, counts = ranges[node_idx, 0], ranges[node_idx, 1]
+        parent = torch.repeat_interleave(torch.arange(node_idx.shape[0], device=node_idx.device), counts)
+        offsets = torch.cumsum(counts, 0) - counts
+        return first[parent] + torch.arange(parent.shape[0], device=node_idx.device) - offsets[parent], parent
+
+    def _projected_size(self, level, node_idx, world_view_transform, proj_mat, fovy, fovx, render_grid):
+        """Returns the largest projected size in pixels of the merged Gaussians of the nodes over the cameras that
+        see them, -1 if none."""
+        n_cameras = world_view_transform.shape[0]
+        cam_idx = torch.arange(n_cameras, device=node_idx.device).repeat(node_idx.shape[0])
+        pair_node = node_idx.repeat_interleave(n_cameras)
+        box_min, box_max = self.octree.box_min[level][pair_node], self.octree.box_max[level][pair_node]
+        bound_scale = self.bound_scale[level][pair_node]
+        visible = boxes_visible(box_min, box_max, bound_scale, cam_idx, world_view_transform, proj_mat,
+                                fovy, fovx, render_grid)
+        radius = 0.5 * torch.linalg.norm(box_max - box_min, dim=1) + 3.0 * bound_scale
+        center = torch.cat([0.5 * (box_min + box_max), torch.ones_like(box_min[:, :1])], dim=1)
+        z = (world_view_transform[cam_idx, 2] * center).sum(dim=1)
+        focal = torch.maximum(render_grid.image_width / (2.0 * torch.tan(fovx[cam_idx] / 2.0)),
+                              render_grid.image_height / (2.0 * torch.tan(fovy[cam_idx] / 2.0)))
+        merged_scale = self.levels[level][2][pair_node].amax(dim=1)
+        size = 6.0 * merged_scale * focal / torch.clamp_min(z - radius, NEAR_Z)
+        size = torch.where(visible, size, -torch.ones_like(size))
+        return size.view(-1, n_cameras).amax(dim=1)
+
+    def cut(self, world_view_transform, proj_mat, fovy, fovx, render_grid, threshold=8.0, blend=0.5):
+        """Picks the Gaussians that render the C cameras at the projected size threshold in pixels.
+
+        A threshold of 0 picks every Gaussian of the scene the cameras can see.
+
+        Returns:
+          The xyz_ws, rotations, scales, opacity and sh_coeffs of the cut, and the number of merged Gaussians
+          picked at every level, under 'level_counts', and of Gaussians of the scene, under 'n_leaf_gaussians'.
+        """
+        assert threshold >= 0.0, "The threshold must not be negative."
+        assert 0.0 <= blend <= 1.0, "blend must be in [0, 1]."
+        with torch.no_grad():
+            device = self.octree.order.device
+            parts = []
+
+            def pick(gaussians, idx, fade=None):
+                picked = [t[idx] for t in gaussians]
+                if fade is not None:
+                    picked[3] = picked[3] * fade[:, None]
+                parts.append(picked)
+                return idx.shape[0]
+
+            def pick_children(level, node_idx, fade):
+                child_idx, parent = self._children(level, node_idx)
+                if level < self.depth:
+                    return pick(self.levels[level + 1], child_idx, fade[parent]), 0
+                return 0, pick(self.gaussians, self.octree.order[child_idx], fade[parent])
+
+            level_counts = [0] * (self.depth + 1)
+            n_leaf_gaussians = 0
+            node_idx = torch.zeros(1, dtype=torch.int64, device=device)
+            for level in range(self.depth + 1):
+                size = self._projected_size(level, node_idx, world_view_transform, proj_mat, fovy, fovx,
+                                            render_grid)
+                node_idx, size = node_idx[size >= 0], size[size >= 0]
+                selected = size < threshold
+                if blend > 0.0:
+                    fade = torch.clamp((size[selected] - (1.0 - blend) * threshold) / (blend * threshold), 0.0, 1.0)
+                else:
+                    fade = torch.zeros_like(size[selected])
+                level_counts[level] += pick(self.levels[level], node_idx[selected], 1.0 - fade)
+                n_nodes, n_gaussians = pick_children(level, node_idx[selected][fade > 0], fade[fade > 0])
+                if level < self.depth:
+                    level_counts[level + 1] += n_nodes
+                n_leaf_gaussians += n_gaussians
+
+                expand = node_idx[~selected]
+                if level < self.depth:
+                    node_idx, _ = self._children(level, expand)
+                else:
+                    n_leaf_gaussians += pick(self.gaussians, self.octree.order[self._children(level, expand)[0]])
+
+            gaussians = [torch.cat(tensors) for tensors in zip(*parts)]
+            if gaussians[0].shape[0] == 0:
+                # The root bounds every Gaussian of the hierarchy, none of which can reach the image.
+                gaussians = [t[:1] for t in self.levels[0]]
+            return gaussians, {'level_counts': level_counts, 'n_leaf_gaussians': n_leaf_gaussians}
+
+    def render(self, world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width, threshold=8.0, blend=0.5,
+               active_sh=None, tile_size=16, **render_kwargs):
+        """Renders the cut of the cameras with render_alpha_blend_tiles_slang_raw.
+
+        Takes the cameras of render_alpha_blend_tiles_slang_raw and passes render_kwargs on to it. active_sh
+        defaults to the degree of the SH coefficients.
+
+        Returns:
+          Its render package, with the counts of cut under 'lod_stats'.
+        """
+        batched = world_view_transform.dim() == 3
+        n_cameras = world_view_transform.shape[0] if batched else 1
+        device = world_view_transform.device
+        fovy_batch = torch.as_tensor(fovy, dtype=torch.float, device=device).reshape(-1).expand(n_cameras)
+        fovx_batch = torch.as_tensor(fovx, dtype=torch.float, device=device).reshape(-1).expand(n_cameras)
+        tile_height, tile_width = tile_size_hw(tile_size)
+        render_grid = RenderGrid(height, width, tile_height=tile_height, tile_width=tile_width)
+        gaussians, lod_stats = self.cut(world_view_transform if batched else world_view_transform[None],
+                                        proj_mat if batched else proj_mat[None], fovy_batch, fovx_batch,
+                                        render_grid, threshold, blend)
+        if active_sh is None:
+            active_sh = int(round(self.gaussians[4].shape[1] ** 0.5)) - 1
+        render_pkg = render_alpha_blend_tiles_slang_raw(*gaussians, active_sh, world_view_transform, proj_mat,
+                                                        cam_pos, fovy, fovx, height, width, tile_size=tile_size,
+                                                        **render_kwargs)
+        lod_stats['n_gaussians'] = gaussians[0].shape[0]
+        render_pkg['lod_stats'] = lod_stats
+        return render_pkg
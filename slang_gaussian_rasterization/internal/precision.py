@@ -0,0 +1,115 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reduced precision storage of the spherical harmonics and of the 2D splat buffers.
+
+The spherical harmonics are stored in the dtype of sh_coeffs, and the
+inv_cov_vs and rgb buffers that the vertex shader hands to the blend in
+splat_dtype, each one of torch.float32, torch.float16 or torch.bfloat16. The
+kernels read and write the raw 16 bits of the reduced formats through int16
+views and convert them to float32, so all arithmetic and all gradient
+accumulation stays in float32. xyz_vs always stays float32, it holds the pixel
+position of the splats.
+
+The gradients of reduced precision tensors are accumulated in float32 buffers
+and cast to the storage dtype when they are handed back to autograd.
+bfloat16 has the range of float32, float16 flushes gradients below about 6e-8
+to zero, so bfloat16 is the better choice for training.
+"""
+
+import math
+import torch
+
+STORAGE_FORMATS = {torch.float32: 0, torch.float16: 1, torch.bfloat16: 2}
+
+
+def storage_format(dtype):
+    """Returns the STORAGE_* constant of the kernels for a storage dtype."""
+    assert dtype in STORAGE_FORMATS, (f"Unsupported storage dtype {dtype}, available: {list(STORAGE_FORMATS)}")
+    return STORAGE_FORMATS[dtype]
+
+
+def is_reduced(tensor):
+    return tensor.dtype != torch.float32
+
+
+def storage_bits(tensor, shape):
+    """Returns the int16 raw bits of a reduced precision tensor in the given shape, or a placeholder."""
+    if not is_reduced(tensor):
+        return torch.zeros((1,) * len(shape), dtype=torch.int16, device=tensor.device)
+    return tensor.detach().contiguous().view(torch.int16).reshape(shape)
+
+
+def float_view(tensor, shape):
+    """Returns a float32 tensor for the TensorView that a reduced precision tensor bypasses, or the tensor itself."""
+    if not is_reduced(tensor):
+        return tensor
+    return torch.zeros((1,) * len(shape), dtype=torch.float, device=tensor.device)
+
+
+def float_grad_pair(tensor, grad, shape):
+    """Returns the (primal, gradient) pair of a DiffTensorView, placeholders for a reduced precision tensor."""
+    if not is_reduced(tensor):
+        return (tensor, grad)
+    return (float_view(tensor, shape), float_view(tensor, shape))
+
+
+def splat_bytes(n_splats, splat_dtype):
+    """Returns the bytes of the inv_cov_vs and rgb buffers of n_splats splats."""
+    return n_splats * 7 * torch.finfo(splat_dtype).bits // 8
+
+
+def _psnr(image, reference):
+    mse = float(torch.mean((image - reference) ** 2))
+    return math.inf if mse == 0 else 10 * math.log10(1.0 / mse)
+
+
+def precision_report(render_fn, params, dtypes=(torch.float16, torch.bfloat16)):
+    """Compares renders and gradients with reduced precision storage to the float32 ones.
+
+    Args:
+      render_fn: Called as render_fn(params, splat_dtype) with the parameter dict, in which
+                 sh_coeffs is already cast to the storage dtype, returns the render package.
+      params: Dict of the float32 Gaussian parameter tensors, including 'sh_coeffs'.
+      dtypes: The reduced storage dtypes to compare.
+
+    Returns:
+      {dtype name: {'image_max_abs_error', 'psnr', 'grad_rel_error': {name: error}, 'bytes_saved'}}.
+    """
+    def run(dtype):
+        leaves = {name: tensor.detach().clone().requires_grad_(True) for name, tensor in params.items()}
+        inputs = dict(leaves)
+        inputs['sh_coeffs'] = leaves['sh_coeffs'].to(dtype)
+        render_pkg = render_fn(inputs, dtype)
+        image = render_pkg['render']
+        image.sum().backward()
+        grads = {name: leaf.grad for name, leaf in leaves.items() if leaf.grad is not None}
+        n_splats = render_pkg['radii'].numel()
+        return image.detach().float(), grads, n_splats
+
+    reference_image, reference_grads, n_splats = run(torch.float32)
+    report = {}
+    for dtype in dtypes:
+        image, grads, _ = run(dtype)
+        grad_rel_error = {}
+        for name, reference in reference_grads.items():
+            grad_rel_error[name] = float(torch.linalg.norm(grads[name] - reference) /
+                                         torch.linalg.norm(reference).clamp_min(1e-12))
+        sh_bytes = params['sh_coeffs'].numel() * (4 - torch.finfo(dtype).bits // 8)
+        report[str(dtype).replace("torch.", "")] = {
+            'image_max_abs_error': float((image - reference_image).abs().max()),
+            'psnr': _psnr(image, reference_image),
+            'grad_rel_error': grad_rel_error,
+            'bytes_saved': sh_bytes + splat_bytes(n_splats, torch.float32) - splat_bytes(n_splats, dtype),
+        }
+    return report
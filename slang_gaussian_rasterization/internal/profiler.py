@@ -0,0 +1,244 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Opt-in per-stage timings and counters of the render pipeline.
+
+    with RenderProfiler() as profiler:
+        render_pkg = render_alpha_blend_tiles_slang_raw(...)
+        render_pkg['render'].sum().backward()
+    print(profiler.summary())
+    profiler.save_chrome_trace("render_trace.json")
+
+Every stage records its host wall time and, on CUDA, its GPU time measured
+with CUDA events, together with the bytes of the buffers it allocated. The
+counters describe the workload of the frame: duplicated keys, tile list
+lengths and contributors per pixel. Without an active profiler the hooks
+below do nothing.
+"""
+
+import collections
+import contextlib
+import json
+import threading
+import time
+import torch
+
+_state = threading.local()
+
+
+def active_profiler():
+    """Returns the innermost RenderProfiler entered on this thread, or None."""
+    stack = getattr(_state, "stack", None)
+    return stack[-1] if stack else None
+
+
+class RenderProfiler():
+    """Collects the stages and counters of every frame rendered while it is active."""
+    def __init__(self):
+        self.stages = []
+        self.counters = collections.defaultdict(list)
+        self._counter_times = collections.defaultdict(list)
+        self._open_stages = []
+        self._origin = time.perf_counter()
+        self._cuda_origin = None
+
+    def __enter__(self):
+        if not hasattr(_state, "stack"):
+            _state.stack = []
+        _state.stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _state.stack.remove(self)
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name, device):
+        """Times the enclosed block as one stage of the pipeline."""
+        record = {'name': name, 'bytes_allocated': 0}
+        use_cuda = torch.device(device).type == "cuda"
+        if use_cuda:
+            if self._cuda_origin is None:
+                self._cuda_origin = torch.cuda.Event(enable_timing=True)
+                self._cuda_origin.record()
+            record['cuda_events'] = (torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True))
+            record['cuda_events'][0].record()
+        record['wall_start'] = time.perf_counter()
+        self._open_stages.append(record)
+        try:
+            yield record
+        finally:
+            self._open_stages.pop()
+            if use_cuda:
+                record['cuda_events'][1].record()
+            record['wall_end'] = time.perf_counter()
+            self.stages.append(record)
+
+    def allocated(self, nbytes):
+        if self._open_stages:
+            self._open_stages[-1]['bytes_allocated'] += nbytes
+
+    def count(self, name, value):
+        self.counters[name].append(value)
+        self._counter_times[name].append(time.perf_counter())
+
+    def _resolve(self):
+        """Turns the CUDA events into milliseconds, waits for the GPU once."""
+        if any('cuda_events' in stage for stage in self.stages):
+            torch.cuda.synchronize()
+        for stage in self.stages:
+            events = stage.pop('cuda_events', None)
+            if events is not None:
+                stage['gpu_start_ms'] = self._cuda_origin.elapsed_time(events[0])
+                stage['gpu_ms'] = events[0].elapsed_time(events[1])
+
+    def summary(self):
+        """Returns the per-stage totals and the counters as a dict."""
+        self._resolve()
+        stages = {}
+        for stage in self.stages:
+            total = stages.setdefault(stage['name'], {'calls': 0, 'wall_ms': 0.0, 'bytes_allocated': 0})
+            total['calls'] += 1
+            total['wall_ms'] += 1000.0 * (stage['wall_end'] - stage['wall_start'])
+            total['bytes_allocated'] += stage['bytes_allocated']
+            if 'gpu_ms' in stage:
+                total['gpu_ms'] = total.get('gpu_ms', 0.0) + stage['gpu_ms']
+        return {'stages': stages, 'counters': dict(self.counters)}
+
+    def chrome_trace(self):
+        """Returns the stages as a trace in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        self._resolve()
+        events = []
+        for stage in self.stages:
+            args = {'bytes_allocated': stage['bytes_allocated']}
+            events.append({'name': stage['name'], 'ph': 'X', 'pid': 0, 'tid': 'host', 'args': args,
+                           'ts': 1e6 * (stage['wall_start'] - self._origin),
+                           'dur': 1e6 * (stage['wall_end'] - stage['wall_start'])})
+            if 'gpu_ms' in stage:
+                events.append({'name': stage['name'], 'ph': 'X', 'pid': 0, 'tid': 'gpu', 'args': args,
+                               'ts': 1e3 * stage['gpu_start_ms'], 'dur': 1e3 * stage['gpu_ms']})
+        for name, values in self.counters.items():
+            for value, recorded in zip(values, self._counter_times[name]):
+                if isinstance(value, (int, float)):
+                    events.append({'name': name, 'ph': 'C', 'pid': 0, 'ts': 1e6 * (recorded - self._origin),
+                                   'args': {name: value}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def profile_stage(name, device, profiler=None):
+    """Times the block as a stage of the given or the active profiler, does nothing without one."""
+    profiler = profiler or active_profiler()
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name, device)
+
+
+def record_allocation(nbytes, profiler=None):
+    profiler = profiler or active_profiler()
+    if profiler is not None:
+        profiler.allocated(nbytes)
+
+
+def tile_length_histogram(tile_ranges):
+    """Counts the tiles per power-of-two bucket of their list length: '0', '1', '2-3', '4-7', ..."""
+    lengths = (tile_ranges[:, 1] - tile_ranges[:, 0]).to(torch.int64)
+    buckets = torch.where(lengths > 0, torch.floor(torch.log2(lengths.clamp_min(1).double())).long() + 1, 0)
+    histogram = {}
+    for bucket, count in enumerate(torch.bincount(buckets).tolist()):
+        if count == 0:
+            continue
+        label = str(bucket) if bucket < 2 else f"{1 << (bucket - 1)}-{(1 << bucket) - 1}"
+        histogram[label] = count
+    return histogram
+
+
+def record_frame_counters(sorted_gauss_idx, tile_ranges, radii, profiler=None):
+    """Records the workload counters of a frame after its keys were sorted."""
+    profiler = profiler or active_profiler()
+    if profiler is None:
+        return
+    lengths = (tile_ranges[:, 1] - tile_ranges[:, 0]).float()
+    profiler.count('n_splats', radii.numel())
+    profiler.count('n_visible_splats', int((radii > 0).sum()))
+    profiler.count('n_keys', sorted_gauss_idx.shape[0])
+    profiler.count('mean_tile_list_length', float(lengths.mean()))
+    profiler.count('max_tile_list_length', int(lengths.max()))
+    profiler.count('tile_list_length_histogram', tile_length_histogram(tile_ranges))
+
+
+def record_cull_counters(splat_idx, n_splats, profiler=None):
+    """Records how many camera and Gaussian pairs the frustum culling pre-pass kept."""
+    profiler = profiler or active_profiler()
+    if profiler is None:
+        return
+    profiler.count('n_splats_after_culling', splat_idx.shape[0])
+    profiler.count('n_culled_splats', n_splats - splat_idx.shape[0])
+
+
+def record_temporal_sort_counters(stats, profiler=None):
+    """Records how much of the previous frame's sorted order a TemporalSort reused."""
+    profiler = profiler or active_profiler()
+    if profiler is None:
+        return
+    profiler.count('n_keys_reused', stats['n_keys_reused'])
+    profiler.count('n_splats_reused', stats['n_splats_reused'])
+    profiler.count('temporal_full_sort', int(stats['full_sort']))
+
+
+def record_recompute_counters(n_bytes_recomputed, profiler=None):
+    """Records the bytes of the tensors that the low-memory mode recomputes instead of keeping for backward."""
+    profiler = profiler or active_profiler()
+    if profiler is None:
+        return
+    profiler.count('n_bytes_recomputed', n_bytes_recomputed)
+
+
+def record_contributor_counters(n_contributors, profiler=None):
+    """Records how many splats the pixels of a frame blended before they stopped."""
+    profiler = profiler or active_profiler()
+    if profiler is None:
+        return
+    profiler.count('mean_n_contributors', float(n_contributors.float().mean()))
+    profiler.count('max_n_contributors', int(n_contributors.max()))
+
+
+# Global memory bwd_alpha_blend reads per list entry: its sorted_gauss_idx and the 11 floats of the splat.
+BWD_BYTES_PER_SPLAT = 4 + 4 * (3 + 3 + 1 + 4)
+
+
+def backward_skip_stats(tile_ranges, tile_n_contributors, render_grid):
+    """Counts the shared memory rounds of the backward blend and those skipped past each tile's n_contributors.
+
+    Returns a dict with the rounds of the full lists, the skipped rounds and the bytes they would have loaded.
+    """
+    block_size = render_grid.tile_height * render_grid.tile_width
+    lengths = (tile_ranges[:, 1] - tile_ranges[:, 0]).to(torch.int64)
+    live_lengths = torch.minimum(lengths, tile_n_contributors.to(torch.int64))
+    n_rounds = int(((lengths + block_size - 1) // block_size).sum())
+    n_live_rounds = int(((live_lengths + block_size - 1) // block_size).sum())
+    return {'n_bwd_rounds': n_rounds,
+            'n_bwd_rounds_skipped': n_rounds - n_live_rounds,
+            'bwd_bytes_skipped': int((lengths - live_lengths).sum()) * BWD_BYTES_PER_SPLAT}
+
+
+def record_backward_skip_counters(tile_ranges, tile_n_contributors, render_grid, profiler=None):
+    """Records the rounds and bytes the backward blend skipped, see backward_skip_stats."""
+    profiler = profiler or active_profiler()
+    if profiler is None:
+        return
+    for name, value in backward_skip_stats(tile_ranges, tile_n_contributors, render_grid).items():
+        profiler.count(name, value)
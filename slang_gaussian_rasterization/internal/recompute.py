@@ -0,0 +1,80 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Low-memory training that recomputes the projected splats in the backward pass.
+
+    render_pkg = render_alpha_blend_tiles_slang_raw(..., low_memory=True)
+
+By default the autograd graph of a render keeps every per-splat output of
+the vertex shader (tiles touched, tile rectangles, radii, view-space means,
+conics and colors) and the sorted tile lists until the backward pass. With
+low_memory, VertexShader only keeps its inputs, and the blend only keeps the
+opacities, the image and the contributor counts: a TileShaderRecompute runs
+the vertex and tile shader again, outside of autograd and without a
+RenderWorkspace, right before the backward blend, and keeps the vertex
+shader outputs until the backward pass of VertexShader takes them. On the
+PyTorch reference the vertex shader is checkpointed instead, so autograd
+runs it again for its own backward pass. Every kernel of the forward pass
+is deterministic, so the recomputed tensors are bitwise equal to the
+forward ones and so are the gradients, as long as the reduction of the
+backward blend is deterministic itself (grad_reduction="deterministic" or
+the PyTorch reference). The price is one more vertex pass, key generation
+and sort per frame.
+"""
+
+import torch
+
+
+class TileShaderRecompute():
+    """Runs the vertex and tile shader of a render again for its backward blend.
+
+    Args:
+      tile_shader_fn: The vertex_and_tile_shader of the backend the forward pass used.
+      args, kwargs: The arguments the forward pass called it with.
+      vertex_shader_fn: Optional function that only runs the vertex shader of tile_shader_fn with
+        these arguments, like tile_shader_slang.vertex_shader_outputs. The backward passes of the
+        blend and of the vertex shader then share one run of it.
+    """
+    def __init__(self, tile_shader_fn, *args, vertex_shader_fn=None, **kwargs):
+        self.tile_shader_fn = tile_shader_fn
+        self.vertex_shader_fn = vertex_shader_fn
+        self.args = args
+        self.kwargs = kwargs
+        self._vertex_outputs = None
+
+    def outputs(self):
+        """Returns the (sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, rgb) of the forward pass."""
+        kwargs = self.kwargs
+        if self.vertex_shader_fn is not None:
+            # Kept until the backward pass of the vertex shader takes them.
+            self._vertex_outputs = self.vertex_outputs()
+            kwargs = dict(kwargs, vertex_outputs=self._vertex_outputs)
+        with torch.no_grad():
+            sorted_gauss_idx, tile_ranges, _, xyz_vs, inv_cov_vs, rgb, _ = self.tile_shader_fn(*self.args, **kwargs)
+        return sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, rgb
+
+    def vertex_outputs(self):
+        """Returns the (tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb) of the vertex shader.
+
+        Takes the outputs that the last call of outputs() kept, and only runs vertex_shader_fn without them.
+        """
+        vertex_outputs, self._vertex_outputs = self._vertex_outputs, None
+        if vertex_outputs is None:
+            with torch.no_grad():
+                vertex_outputs = self.vertex_shader_fn(*self.args, **self.kwargs)
+        return vertex_outputs
+
+
+def recomputed_bytes(*tensors):
+    """Returns the bytes of the tensors that the low-memory mode does not keep for the backward pass."""
+    return sum(t.nbytes for t in tensors if t is not None)
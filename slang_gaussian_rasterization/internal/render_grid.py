@@ -22,3 +22,11 @@ class RenderGrid():
     self.tile_width = tile_width
     self.grid_height = math.ceil(image_height / tile_height)
     self.grid_width = math.ceil(image_width  / tile_width)
+
+
+def tile_size_hw(tile_size):
+  """Returns (tile_height, tile_width) of a square tile_size or of a (tile_height, tile_width) pair."""
+  if isinstance(tile_size, int):
+    return tile_size, tile_size
+  tile_height, tile_width = tile_size
+  return int(tile_height), int(tile_width)
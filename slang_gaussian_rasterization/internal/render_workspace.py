@@ -0,0 +1,113 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import torch
+from slang_gaussian_rasterization.internal.profiler import record_allocation
+
+
+class RenderWorkspace():
+  """Grow-only buffers reused by every frame rendered with the same RenderGrid.
+
+  Each named buffer is a flat tensor that is only re-allocated when a frame
+  needs more elements than it holds, and only the prefix a frame uses is
+  zeroed. Buffers are shrunk, or evicted when unused, every `shrink_interval`
+  frames if their capacity exceeds `shrink_ratio` times the largest request
+  seen in that window.
+
+  The tensors returned by a render are views into the workspace, they stay
+  valid until the next frame is rendered with the same workspace.
+
+  Every buffer lives on the device of the tensors it is requested for, so one
+  workspace serves the CUDA kernels and the CPU reference alike. `device` is
+  only the default for requests that do not name one.
+  """
+  def __init__(self, render_grid, device=None, growth_factor=1.25, shrink_interval=100, shrink_ratio=2.0):
+    self.render_grid = render_grid
+    self.device = None if device is None else torch.device(device)
+    self.growth_factor = growth_factor
+    self.shrink_interval = shrink_interval
+    self.shrink_ratio = shrink_ratio
+
+    self.frame = 0
+    self.n_allocations = 0
+    self.bytes_zeroed = 0
+    self._buffers = {}
+    self._peak_numel = {}
+
+  def matches(self, render_grid):
+    return ((self.render_grid.image_height, self.render_grid.image_width,
+             self.render_grid.tile_height, self.render_grid.tile_width) ==
+            (render_grid.image_height, render_grid.image_width,
+             render_grid.tile_height, render_grid.tile_width))
+
+  @property
+  def allocated_bytes(self):
+    return sum(buf.numel() * buf.element_size() for buf in self._buffers.values())
+
+  def _allocate(self, name, capacity, dtype, device):
+    self._buffers[name] = torch.empty((capacity,), device=device, dtype=dtype)
+    self.n_allocations += 1
+    record_allocation(self._buffers[name].nbytes)
+
+  def buffer(self, name, shape, dtype, device=None, zero=True):
+    """Returns a [shape] view of the named buffer on device, growing it if it is too small."""
+    device = torch.device(device) if device is not None else self.device
+    assert device is not None, "The RenderWorkspace has no default device, pass the device of the buffer."
+    numel = math.prod(shape)
+    buf = self._buffers.get(name)
+    if buf is None or buf.dtype != dtype or buf.device != device:
+      self._allocate(name, numel, dtype, device)
+    elif buf.numel() < numel:
+      self._allocate(name, max(numel, math.ceil(buf.numel() * self.growth_factor)), dtype, device)
+    self._peak_numel[name] = max(self._peak_numel.get(name, 0), numel)
+
+    view = self._buffers[name][:numel].view(shape)
+    if zero:
+      view.zero_()
+      self.bytes_zeroed += numel * view.element_size()
+    return view
+
+  def next_frame(self):
+    """Marks the start of a frame and applies the shrink/eviction policy at the end of each window."""
+    self.frame += 1
+    if self.frame % self.shrink_interval != 0:
+      return
+    for name, buf in list(self._buffers.items()):
+      peak = self._peak_numel.get(name, 0)
+      if peak == 0:
+        del self._buffers[name]
+      elif buf.numel() > self.shrink_ratio * peak:
+        self._allocate(name, math.ceil(peak * self.growth_factor), buf.dtype, buf.device)
+    self._peak_numel = {}
+
+  def release(self):
+    """Frees every buffer, the next frame allocates them again."""
+    self._buffers = {}
+    self._peak_numel = {}
+
+  def stats(self):
+    return {'frame': self.frame,
+            'n_allocations': self.n_allocations,
+            'allocated_bytes': self.allocated_bytes,
+            'bytes_zeroed': self.bytes_zeroed}
+
+
+def allocate_buffer(workspace, name, shape, dtype, device, zero=True):
+  """Takes the buffer from the workspace if there is one, otherwise allocates a tensor, zeroed if zero is set."""
+  if workspace is None:
+    buf = (torch.zeros if zero else torch.empty)(shape, device=device, dtype=dtype)
+    record_allocation(buf.nbytes)
+    return buf
+  return workspace.buffer(name, shape, dtype, device, zero=zero)
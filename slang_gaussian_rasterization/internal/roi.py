@@ -0,0 +1,84 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Rendering of a region of interest, for losses on crops or masked regions.
+
+The region is either a pixel rectangle (x_min, y_min, x_max, y_max), shared by
+all cameras, or a bool mask of the tiles, [grid_height, grid_width] or one per
+camera [C, grid_height, grid_width]. The keys of the tiles outside of it are
+dropped right after they are generated, so the sort and the blend only see
+the selected tiles, and tiles without keys end the blend right away. Splats
+that keep no key get a zero radius, so visibility_filter only holds the splats
+the region shows. A rectangle renders the crop, a mask renders the full image
+with the tiles outside of it left empty.
+"""
+
+import math
+import torch
+from slang_gaussian_rasterization.internal.depth_keys import key_tile_ids
+
+
+def is_tile_mask(roi):
+    return isinstance(roi, torch.Tensor) and roi.dtype == torch.bool
+
+
+def roi_rect(roi, render_grid):
+    """Returns the pixel rectangle of roi as ints, asserting that it lies in the image."""
+    x_min, y_min, x_max, y_max = (int(v) for v in roi)
+    assert 0 <= x_min < x_max <= render_grid.image_width and 0 <= y_min < y_max <= render_grid.image_height, (
+        f"The region of interest {roi} is empty or exceeds the {render_grid.image_width}x"
+        f"{render_grid.image_height} image.")
+    return x_min, y_min, x_max, y_max
+
+
+def roi_tile_mask(roi, render_grid, n_cameras, device):
+    """Returns the selected tiles of the C cameras as a bool mask [C * T]."""
+    grid_shape = (render_grid.grid_height, render_grid.grid_width)
+    if is_tile_mask(roi):
+        assert tuple(roi.shape[-2:]) == grid_shape and roi.dim() in (2, 3), (
+            f"The tile mask must be [grid_height, grid_width] or [C, grid_height, grid_width] with a "
+            f"{grid_shape} grid, got {tuple(roi.shape)}.")
+        mask = roi.to(device).reshape(-1, grid_shape[0] * grid_shape[1])
+        return mask.expand(n_cameras, -1).reshape(-1)
+    x_min, y_min, x_max, y_max = roi_rect(roi, render_grid)
+    mask = torch.zeros(grid_shape, dtype=torch.bool, device=device)
+    mask[y_min // render_grid.tile_height:math.ceil(y_max / render_grid.tile_height),
+         x_min // render_grid.tile_width:math.ceil(x_max / render_grid.tile_width)] = True
+    return mask.reshape(-1).repeat(n_cameras)
+
+
+def select_roi_keys(unsorted_keys, unsorted_gauss_idx, radii, tile_mask, depth_bits=None):
+    """Drops the keys of the tiles outside tile_mask and the radii of the splats left without keys.
+
+    Args:
+      unsorted_keys, unsorted_gauss_idx: The generated keys and their splats.
+      radii: The radii of the splats [M].
+      tile_mask: The selected tiles [C * T].
+      depth_bits: The depth bits of 32-bit compact keys, None for 64-bit keys.
+
+    Returns:
+      The keys, splat indices and radii of the region.
+    """
+    keep = tile_mask[key_tile_ids(unsorted_keys, depth_bits)]
+    unsorted_keys, unsorted_gauss_idx = unsorted_keys[keep], unsorted_gauss_idx[keep]
+    has_keys = torch.zeros(radii.shape, dtype=torch.bool, device=radii.device)
+    has_keys[unsorted_gauss_idx.long()] = True
+    return unsorted_keys, unsorted_gauss_idx, torch.where(has_keys, radii, torch.zeros_like(radii))
+
+
+def crop_to_roi(image, roi, render_grid):
+    """Crops the [..., H, W] render to a rectangle roi, renders of a tile mask are returned whole."""
+    if roi is None or is_tile_mask(roi):
+        return image
+    x_min, y_min, x_max, y_max = roi_rect(roi, render_grid)
+    return image[..., y_min:y_max, x_min:x_max]
@@ -0,0 +1,252 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Content-hashed on-disk cache of the compiled Slang modules and the CUB sort extension.
+
+Every module gets an entry directory named after a hash of its sources, its
+defines, the torch, CUDA and slangtorch versions and the GPU architecture, so
+an entry never goes stale and entries of different versions or GPUs live side
+by side. If
+$SLANG_GAUSSIAN_RASTERIZATION_CACHE_DIR is set, it is the only cache directory.
+Otherwise new entries go to ~/.cache/slang_gaussian_rasterization, and
+entries are also looked up in the `_prebuilt_shader_cache` directory inside
+the package, which setup.py fills when SLANG_GAUSSIAN_RASTERIZATION_PREBUILD=1
+and which may be read-only.
+
+The CUB extension is imported straight from a read-only entry. slangtorch
+builds next to the sources it loads and writes lock and metadata files there,
+so a Slang module is loaded by the absolute path of its source inside the
+entry, and a read-only Slang entry is first copied to the writable cache.
+
+Command line:
+
+    python -m slang_gaussian_rasterization.internal.shader_cache warm [--cache-dir DIR]
+    python -m slang_gaussian_rasterization.internal.shader_cache verify [--cache-dir DIR]
+    python -m slang_gaussian_rasterization.internal.shader_cache import-time [--repeats N]
+"""
+
+import argparse
+import glob
+import hashlib
+import importlib.machinery
+import importlib.metadata
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import torch
+import torch.utils.cpp_extension
+
+CACHE_DIR_ENV = "SLANG_GAUSSIAN_RASTERIZATION_CACHE_DIR"
+PREBUILT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "_prebuilt_shader_cache")
+USER_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "slang_gaussian_rasterization")
+SHADERS_PATH = os.path.join(os.path.dirname(__file__), "slang")
+SORT_BY_KEYS_SOURCE = os.path.join(os.path.dirname(__file__), "sort_by_keys", "sort_by_keys.cu")
+MANIFEST = "manifest.json"
+
+# One module is loaded at a time. Threads that ask for a module another thread is loading wait for
+# it and share the loaded module.
+_lock = threading.RLock()
+_loaded = {}
+
+
+def cache_dirs():
+    """Returns the directories searched for entries, the first one receives new entries."""
+    if os.environ.get(CACHE_DIR_ENV):
+        return [os.environ[CACHE_DIR_ENV]]
+    return [USER_CACHE_DIR, PREBUILT_CACHE_DIR]
+
+
+def _version(package):
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def cuda_arch():
+    """Returns the GPU architectures the modules are compiled for, like torch.utils.cpp_extension picks them."""
+    if os.environ.get("TORCH_CUDA_ARCH_LIST"):
+        return os.environ["TORCH_CUDA_ARCH_LIST"]
+    if torch.cuda.is_available():
+        major, minor = torch.cuda.get_device_capability()
+        return f"{major}.{minor}"
+    return None
+
+
+def module_key(name, sources, defines=None):
+    """Hashes everything the compiled module depends on, returns (key, inputs)."""
+    inputs = {'name': name,
+              'defines': sorted((defines or {}).items()),
+              'torch': torch.__version__,
+              'cuda': torch.version.cuda,
+              'arch': cuda_arch(),
+              'slangtorch': _version("slangtorch")}
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode())
+    for source in sorted(sources):
+        digest.update(os.path.basename(source).encode())
+        with open(source, "rb") as f:
+            digest.update(f.read())
+    return f"{name}-{digest.hexdigest()[:16]}", inputs
+
+
+def slang_sources():
+    # The modules import each other, so every .slang file is part of every key.
+    return sorted(glob.glob(os.path.join(SHADERS_PATH, "*.slang")))
+
+
+def find_entry(key):
+    """Returns the directory of the complete entry for key, or None."""
+    for cache_dir in cache_dirs():
+        entry = os.path.join(cache_dir, key)
+        if os.path.exists(os.path.join(entry, MANIFEST)):
+            return entry
+    return None
+
+
+def _writable_entry(key):
+    entry = os.path.join(cache_dirs()[0], key)
+    os.makedirs(entry, exist_ok=True)
+    return entry
+
+
+def _write_manifest(entry, inputs, build_seconds):
+    with open(os.path.join(entry, MANIFEST), "w") as f:
+        json.dump({'inputs': inputs, 'build_seconds': build_seconds}, f, indent=2)
+
+
+def load_slang_module(name, defines=None):
+    """Loads the slangtorch module of internal/slang/<name>.slang, compiling it only if no entry has it."""
+    import slangtorch
+    with _lock:
+        key, inputs = module_key(name, slang_sources(), defines)
+        if key in _loaded:
+            return _loaded[key]
+        entry = find_entry(key)
+        if entry is not None and not os.access(entry, os.W_OK):
+            writable = os.path.join(cache_dirs()[0], key)
+            if not os.path.exists(os.path.join(writable, MANIFEST)):
+                shutil.copytree(entry, writable, dirs_exist_ok=True)
+            entry = writable
+        built = entry is None
+        if built:
+            entry = _writable_entry(key)
+            for source in slang_sources():
+                shutil.copy2(source, entry)
+        start = time.perf_counter()
+        # slangtorch builds next to the source, so loading the copy in the entry keeps the build there.
+        module = slangtorch.loadModule(os.path.join(entry, f"{name}.slang"), defines=defines or {})
+        if built:
+            _write_manifest(entry, inputs, time.perf_counter() - start)
+        _loaded[key] = module
+        return module
+
+
+def load_cub_extension():
+    """Loads the CUB radix sort extension, building it with torch.utils.cpp_extension only if no entry has it."""
+    with _lock:
+        key, inputs = module_key("sort_by_keys", [SORT_BY_KEYS_SOURCE])
+        if key in _loaded:
+            return _loaded[key]
+        entry = find_entry(key)
+        if entry is not None:
+            library = glob.glob(os.path.join(entry, "sort_by_keys*.so")) + glob.glob(os.path.join(entry, "sort_by_keys*.pyd"))
+            if library:
+                loader = importlib.machinery.ExtensionFileLoader("sort_by_keys", library[0])
+                spec = importlib.util.spec_from_file_location("sort_by_keys", library[0], loader=loader)
+                module = importlib.util.module_from_spec(spec)
+                loader.exec_module(module)
+                _loaded[key] = module
+                return module
+        entry = _writable_entry(key)
+        start = time.perf_counter()
+        module = torch.utils.cpp_extension.load(name="sort_by_keys", sources=[SORT_BY_KEYS_SOURCE],
+                                                build_directory=entry)
+        _write_manifest(entry, inputs, time.perf_counter() - start)
+        _loaded[key] = module
+        return module
+
+
+def cached_modules():
+    """Lists the (name, defines) of every Slang module the renderer can load."""
+    from slang_gaussian_rasterization.internal.slang.slang_modules import (GRAD_REDUCTIONS, TILE_SIZES_HW,
+                                                                           alpha_blend_defines)
+    modules = [("vertex_shader", None), ("tile_shader", None)]
+    for tile_height, tile_width in TILE_SIZES_HW:
+        for grad_reduction in GRAD_REDUCTIONS:
+            modules.append(("alphablend_shader", alpha_blend_defines(tile_height, tile_width, grad_reduction)))
+    return modules
+
+
+def warm():
+    """Compiles every module that has no entry yet, returns the seconds each load took."""
+    timings = {}
+    for name, defines in cached_modules():
+        start = time.perf_counter()
+        load_slang_module(name, defines)
+        timings[module_key(name, slang_sources(), defines)[0]] = time.perf_counter() - start
+    start = time.perf_counter()
+    load_cub_extension()
+    timings[module_key("sort_by_keys", [SORT_BY_KEYS_SOURCE])[0]] = time.perf_counter() - start
+    return timings
+
+
+def verify():
+    """Returns {key: entry directory or None} for every module, without compiling anything."""
+    keys = [module_key(name, slang_sources(), defines)[0] for name, defines in cached_modules()]
+    keys.append(module_key("sort_by_keys", [SORT_BY_KEYS_SOURCE])[0])
+    return {key: find_entry(key) for key in keys}
+
+
+def import_time(repeats=5, modules=("slang_gaussian_rasterization.api.inria_3dgs",
+                                    "slang_gaussian_rasterization.api.gsplat_3dgs")):
+    """Measures the import time of the API modules in fresh interpreters, after torch is imported."""
+    script = ("import time, torch; start = time.perf_counter(); " +
+              "".join(f"import {module}; " for module in modules) +
+              "print(time.perf_counter() - start)")
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True)
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    timings.sort()
+    return {'repeats': repeats, 'min_s': timings[0], 'median_s': timings[len(timings) // 2], 'max_s': timings[-1]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm or verify the compiled shader cache.")
+    parser.add_argument("command", choices=["warm", "verify", "import-time"])
+    parser.add_argument("--cache-dir", help=f"Cache directory to use instead of the defaults, sets ${CACHE_DIR_ENV}.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh interpreters import-time measures.")
+    args = parser.parse_args(argv)
+    if args.cache_dir:
+        os.environ[CACHE_DIR_ENV] = os.path.abspath(args.cache_dir)
+
+    if args.command == "warm":
+        for key, seconds in warm().items():
+            print(f"{key}: {seconds:.2f}s")
+    elif args.command == "verify":
+        entries = verify()
+        for key, entry in entries.items():
+            print(f"{key}: {entry or 'missing'}")
+        return 0 if all(entries.values()) else 1
+    else:
+        print(json.dumps(import_time(args.repeats), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,16 +12,57 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import slangtorch
 import os
+from slang_gaussian_rasterization.internal import shader_cache
 
 shaders_path = os.path.dirname(__file__)
 
-TILE_SIZES_HW = [(4,4), (8,8), (16,16)]
+# The (tile_height, tile_width) sizes of the alpha blend shaders, a block runs one thread per pixel of a tile.
+TILE_SIZES_HW = [(4,4), (8,8), (16,16), (8,16), (16,8), (8,32), (32,8)]
 
-vertex_shader = slangtorch.loadModule(os.path.join(shaders_path, "vertex_shader.slang"))
-tile_shader = slangtorch.loadModule(os.path.join(shaders_path, "tile_shader.slang"))
-alpha_blend_shaders = {}
-for tile_height, tile_width in TILE_SIZES_HW:
-  alpha_blend_shaders[(tile_height, tile_width)] = slangtorch.loadModule(os.path.join(shaders_path, "alphablend_shader.slang"), 
-                                                                         defines={"PYTHON_TILE_HEIGHT": tile_height, "PYTHON_TILE_WIDTH": tile_width})
+# The grad_reduction values of GRAD_REDUCTION_MODES in alphablend_tiled_slang.py, each compiled into its own
+# alpha blend shader.
+GRAD_REDUCTIONS = [0, 1, 2]
+
+# The modules are compiled, or loaded from the shader cache, when first used, so importing
+# the package neither needs slangtorch nor a GPU.
+_module_names = ["vertex_shader", "tile_shader"]
+
+
+def alpha_blend_defines(tile_height, tile_width, grad_reduction=0):
+  return {"PYTHON_TILE_HEIGHT": tile_height, "PYTHON_TILE_WIDTH": tile_width,
+          "PYTHON_GRAD_REDUCTION": grad_reduction}
+
+
+class AlphaBlendShaders():
+  """The alpha blend shader of every tile size in TILE_SIZES_HW and grad_reduction, each loaded on first use.
+
+  Shaders are looked up by (tile_height, tile_width) or (tile_height, tile_width, grad_reduction), grad_reduction
+  being a value of GRAD_REDUCTION_MODES in alphablend_tiled_slang.py. Without it, the atomic mode is used, which
+  reserves no shared memory for the gradient reduction.
+  """
+  def __init__(self):
+    self._modules = {}
+
+  def __contains__(self, tile_size_hw):
+    return tuple(tile_size_hw) in TILE_SIZES_HW
+
+  def __getitem__(self, key):
+    key = tuple(key) if len(key) > 2 else (*key, 0)
+    if key not in self._modules:
+      self._modules[key] = shader_cache.load_slang_module("alphablend_shader", defines=alpha_blend_defines(*key))
+    return self._modules[key]
+
+  def keys(self):
+    return list(TILE_SIZES_HW)
+
+
+alpha_blend_shaders = AlphaBlendShaders()
+
+
+def __getattr__(name):
+  if name in _module_names:
+    module = shader_cache.load_slang_module(name)
+    globals()[name] = module
+    return module
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
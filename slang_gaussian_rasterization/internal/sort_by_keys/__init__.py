@@ -1,7 +1,12 @@
-import os
 import torch
+from slang_gaussian_rasterization.internal import shader_cache
 
-root_path = os.path.dirname(__file__)
 
-sort_by_keys_cub = torch.utils.cpp_extension.load(name="sort_by_keys", 
-                                                  sources=[os.path.join(root_path, "sort_by_keys.cu")])
+def __getattr__(name):
+  # The CUB extension is only needed, and can only be built, on machines with CUDA. It is
+  # built, or loaded from the shader cache, when first used.
+  if name == "sort_by_keys_cub":
+    module = shader_cache.load_cub_extension() if torch.cuda.is_available() else None
+    globals()[name] = module
+    return module
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,54 +6,101 @@
 
 namespace extension_cpp {
 
-  std::tuple<torch::Tensor, torch::Tensor>
-  sort_by_keys(
-    const at::Tensor keys,
-    const at::Tensor values,
-    const int highest_tile_id_msb)
+  // 64-bit keys hold (tile_id << 32) | float_bits(z), 32-bit compact keys hold (tile_id << depth_bits) | quantized_z.
+  // Compact keys are sorted as unsigned integers so that all 32 bits can be used.
+  template <typename KeyT>
+  size_t temp_storage_bytes_for(const int64_t n_items)
   {
-    TORCH_CHECK(keys.sizes() == values.sizes());
-    TORCH_CHECK(keys.dtype() == torch::kLong);
-    TORCH_CHECK(values.dtype() == torch::kInt32);
-    TORCH_INTERNAL_ASSERT(keys.device().type() == at::DeviceType::CUDA);
-    TORCH_INTERNAL_ASSERT(values.device().type() == at::DeviceType::CUDA);
+    size_t temp_storage_bytes = 0;
+    cub::DeviceRadixSort::SortPairs(
+      nullptr, temp_storage_bytes,
+      (const KeyT*)nullptr, (KeyT*)nullptr,
+      (const int32_t*)nullptr, (int32_t*)nullptr,
+      n_items);
+    return temp_storage_bytes;
+  }
 
-    at::Tensor keys_sorted = torch::empty(keys.sizes(), keys.options());
-    at::Tensor values_sorted = torch::empty(values.sizes(), values.options());
+  int64_t sort_by_keys_temp_storage_bytes(const int64_t n_items, const bool compact_keys)
+  {
+    return compact_keys ? temp_storage_bytes_for<uint32_t>(n_items) : temp_storage_bytes_for<int64_t>(n_items);
+  }
 
+  template <typename KeyT>
+  void sort_pairs(
+    const at::Tensor keys,
+    const at::Tensor values,
+    at::Tensor keys_sorted,
+    at::Tensor values_sorted,
+    at::Tensor temp_storage,
+    const int end_bit)
+  {
     at::Tensor keys_contig = keys.contiguous();
     at::Tensor values_contig = values.contiguous();
-    at::Tensor keys_sorted_contig = keys_sorted.contiguous();
-    at::Tensor values_sorted_contig = values_sorted.contiguous();
 
-    const int64_t* keys_ptr = keys_contig.data_ptr<int64_t>();
+    const KeyT* keys_ptr = (const KeyT*)keys_contig.data_ptr();
     const int32_t* values_ptr = values_contig.data_ptr<int32_t>();
-    int64_t* keys_sorted_ptr = keys_sorted_contig.data_ptr<int64_t>();
-    int32_t* values_sorted_ptr = values_sorted_contig.data_ptr<int32_t>();
+    KeyT* keys_sorted_ptr = (KeyT*)keys_sorted.data_ptr();
+    int32_t* values_sorted_ptr = values_sorted.data_ptr<int32_t>();
+
+    size_t temp_storage_bytes = temp_storage_bytes_for<KeyT>(keys.sizes()[0]);
+    TORCH_CHECK(temp_storage.numel() >= (int64_t)temp_storage_bytes);
 
-    void     *d_temp_storage = nullptr;
-    size_t   temp_storage_bytes = 0;
     cub::DeviceRadixSort::SortPairs(
-      d_temp_storage, temp_storage_bytes,
+      temp_storage.data_ptr(), temp_storage_bytes,
       keys_ptr, keys_sorted_ptr,
       values_ptr, values_sorted_ptr,
-      keys.sizes()[0]);
+      keys.sizes()[0], 0, end_bit);
+  }
 
-    cudaMalloc(&d_temp_storage, temp_storage_bytes);
+  void sort_by_keys_out(
+    const at::Tensor keys,
+    const at::Tensor values,
+    at::Tensor keys_sorted,
+    at::Tensor values_sorted,
+    at::Tensor temp_storage,
+    const int end_bit)
+  {
+    TORCH_CHECK(keys.sizes() == values.sizes());
+    TORCH_CHECK(keys_sorted.sizes() == keys.sizes());
+    TORCH_CHECK(values_sorted.sizes() == values.sizes());
+    TORCH_CHECK(keys.dtype() == torch::kLong || keys.dtype() == torch::kInt32);
+    TORCH_CHECK(keys_sorted.dtype() == keys.dtype());
+    TORCH_CHECK(values.dtype() == torch::kInt32);
+    TORCH_CHECK(values_sorted.dtype() == torch::kInt32);
+    TORCH_CHECK(temp_storage.dtype() == torch::kUInt8);
+    TORCH_CHECK(keys_sorted.is_contiguous() && values_sorted.is_contiguous() && temp_storage.is_contiguous());
+    TORCH_CHECK(end_bit <= 8 * (int)keys.element_size());
+    TORCH_INTERNAL_ASSERT(keys.device().type() == at::DeviceType::CUDA);
+    TORCH_INTERNAL_ASSERT(values.device().type() == at::DeviceType::CUDA);
 
-    cub::DeviceRadixSort::SortPairs(
-      d_temp_storage, temp_storage_bytes,
-      keys_ptr, keys_sorted_ptr,
-      values_ptr, values_sorted_ptr,
-      keys.sizes()[0], 0, 32 + highest_tile_id_msb);
+    if (keys.dtype() == torch::kInt32)
+      sort_pairs<uint32_t>(keys, values, keys_sorted, values_sorted, temp_storage, end_bit);
+    else
+      sort_pairs<int64_t>(keys, values, keys_sorted, values_sorted, temp_storage, end_bit);
+  }
+
+  std::tuple<torch::Tensor, torch::Tensor>
+  sort_by_keys(
+    const at::Tensor keys,
+    const at::Tensor values,
+    const int end_bit)
+  {
+    at::Tensor keys_sorted = torch::empty(keys.sizes(), keys.options());
+    at::Tensor values_sorted = torch::empty(values.sizes(), values.options());
+
+    // The temporary storage goes through the caching allocator instead of a cudaMalloc/cudaFree per call.
+    at::Tensor temp_storage = torch::empty({sort_by_keys_temp_storage_bytes(keys.sizes()[0], keys.dtype() == torch::kInt32)},
+                                           keys.options().dtype(torch::kUInt8));
 
-    cudaFree(d_temp_storage);
+    sort_by_keys_out(keys, values, keys_sorted, values_sorted, temp_storage, end_bit);
 
-    return std::make_tuple(keys_sorted_contig, values_sorted_contig);
+    return std::make_tuple(keys_sorted, values_sorted);
   }
 
   PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
     m.def("sort_by_keys", &sort_by_keys);
+    m.def("sort_by_keys_out", &sort_by_keys_out);
+    m.def("sort_by_keys_temp_storage_bytes", &sort_by_keys_temp_storage_bytes);
   }
 
 }
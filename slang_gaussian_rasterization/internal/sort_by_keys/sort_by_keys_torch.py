@@ -1,7 +1,28 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
 import torch
 
 def sort_by_keys_torch(keys, values):
-  """Sorts a values tensor by a corresponding keys tensor."""
-  sorted_keys, idxs = torch.sort(keys)
+  """Sorts a values tensor by a corresponding keys tensor.
+
+  The sort is stable so that ties are resolved in the same order as the
+  CUB radix sort used on the GPU.
+  """
+  # 32-bit compact keys may use the sign bit, they are ordered as unsigned integers like on the GPU.
+  order_keys = keys.to(torch.int64) & 0xFFFFFFFF if keys.dtype == torch.int32 else keys
+  _, idxs = torch.sort(order_keys, stable=True)
+  sorted_keys = keys[idxs]
   sorted_val = values[idxs]
   return sorted_keys, sorted_val
@@ -0,0 +1,92 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sparse gradients for the rows of the Gaussians that a frame actually rendered.
+
+The gradients are torch.sparse_coo tensors with one row per Gaussian with a
+non-zero radius in any camera, in the format torch.optim.SparseAdam and
+nn.Embedding(sparse=True) use. They reach the parameters unchanged when the
+Gaussian tensors are leaves or go through operations with sparse support such
+as torch.exp, but not through torch.sigmoid or torch.nn.functional.normalize,
+whose backward passes have no sparse kernels. sparse_row_grad only makes the
+gradient of the former sparse and hands the others a dense gradient.
+"""
+
+import torch
+
+# The grad_fn of the operations whose backward pass accepts a sparse gradient.
+SPARSE_GRAD_FNS = ("ExpBackward0", "CloneBackward0")
+
+
+def visible_gaussian_rows(radii, n_points, splat_idx=None):
+    """Returns the sorted indices of the Gaussians with a non-zero radius in any camera.
+
+    Args:
+      radii: The radii of the splats, [C * N] or compacted to [M] by frustum culling.
+      n_points: The number N of Gaussians.
+      splat_idx: The c * N + i entries of the compacted radii, None if they are not compacted.
+    """
+    visible = torch.nonzero(radii.reshape(-1) > 0).flatten()
+    if splat_idx is not None:
+        visible = splat_idx.long()[visible]
+    return torch.unique(visible % n_points)
+
+
+def sparse_rows(rows, values, shape):
+    """Wraps the gradient values of the given rows into a coalesced sparse tensor of the full shape."""
+    return torch.sparse_coo_tensor(rows[None], values, shape, is_coalesced=True, check_invariants=False)
+
+
+class SparseRowGrad(torch.autograd.Function):
+    """Identity whose backward keeps the gradient of the rows set with set_sparse_rows, as a sparse tensor.
+
+    The rows are only known once the vertex shader ran, so they are attached to
+    the node of the output afterwards. Gradients that already arrive sparse pass through.
+    """
+    @staticmethod
+    def forward(ctx, tensor):
+        ctx.rows = None
+        return tensor.view_as(tensor)
+
+    @staticmethod
+    def backward(ctx, grad):
+        if grad.is_sparse or ctx.rows is None:
+            return grad
+        return sparse_rows(ctx.rows, grad[ctx.rows], grad.shape)
+
+
+def set_sparse_rows(tensor, rows):
+    """Sets the rows that the SparseRowGrad producing tensor keeps the gradient of."""
+    if isinstance(tensor.grad_fn, SparseRowGrad._backward_cls):
+        tensor.grad_fn.rows = rows
+
+
+class DenseGrad(torch.autograd.Function):
+    """Identity whose backward turns a sparse gradient into a dense one, for producers without sparse support."""
+    @staticmethod
+    def forward(ctx, tensor):
+        return tensor.view_as(tensor)
+
+    @staticmethod
+    def backward(ctx, grad):
+        return grad.to_dense() if grad.is_sparse else grad
+
+
+def supports_sparse_grad(tensor):
+    """Returns whether a sparse gradient of tensor reaches the parameters it was computed from."""
+    return tensor.grad_fn is None or type(tensor.grad_fn).__name__ in SPARSE_GRAD_FNS
+
+
+def sparse_row_grad(tensor):
+    """Wraps tensor in a SparseRowGrad if its producer supports sparse gradients, in a DenseGrad otherwise."""
+    return SparseRowGrad.apply(tensor) if supports_sparse_grad(tensor) else DenseGrad.apply(tensor)
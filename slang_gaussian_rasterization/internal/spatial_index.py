@@ -0,0 +1,228 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Octree over the Gaussian means for picking the candidate Gaussians of each camera.
+
+    octree = GaussianOctree(xyz_ws, rotations, scales)
+    render_pkg = render_alpha_blend_tiles_slang_raw(..., spatial_index=octree)
+    ...
+    optimizer.step()
+    octree.refit(xyz_ws, rotations, scales)
+
+The Gaussians are sorted along the Morton code of their cell in a uniform
+2^depth grid over the scene, so every node of the octree owns a contiguous
+range of that order. Each node stores the bounding box of its means and the
+largest extent of a splat below it, its largest scale stretched by the
+rotation matrix of its quaternion. A query walks the tree level by level,
+only testing the children of visible nodes, and returns the c * N + i
+entries of the Gaussians in visible leaves in the format of frustum_cull.
+The node test bounds the pixel radius of every splat below the node like
+splat_radius_bound in utils.slang, so a query never drops a splat the
+vertex shader would keep, whether the quaternions are normalized or not.
+
+Everything is written with torch operations and runs on CPU tensors too.
+"""
+
+import math
+import torch
+from slang_gaussian_rasterization.internal.tile_shader_torch import EPS, NEAR_Z, COV_2D_DILATION, ndc2pix
+
+
+def morton_codes(cells, depth):
+    """Interleaves the bits of the integer cell coordinates [N, 3] into Morton codes [N]."""
+    codes = torch.zeros(cells.shape[0], dtype=torch.int64, device=cells.device)
+    for bit in range(depth):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+def box_corners(box_min, box_max):
+    """Returns the 8 corners [K, 8, 3] of the axis aligned boxes [K, 3]."""
+    select = torch.tensor([[(i >> axis) & 1 for axis in range(3)] for i in range(8)],
+                          dtype=torch.bool, device=box_min.device)
+    return torch.where(select[None], box_max[:, None, :], box_min[:, None, :])
+
+
+def splat_extents(rotations, scales):
+    """Returns the largest scale of every Gaussian [N] stretched like in splat_radius_bound of utils.slang.
+
+    The rotation matrix of a quaternion q that is not normalized stretches by up to |1 - |q|^2| + |q|^2.
+    """
+    rotation_norm = (rotations * rotations).sum(dim=1)
+    return torch.abs(scales).amax(dim=1) * (torch.abs(1.0 - rotation_norm) + rotation_norm)
+
+
+def boxes_visible(box_min, box_max, max_scale, cam_idx, world_view_transform, proj_mat, fovy, fovx, render_grid):
+    """Tests (camera, box) pairs, True if a splat in the box can touch the camera's tile grid.
+
+    Takes the bounds [K, 3] of the boxes, the largest extent [K] of the splats in them, see splat_extents,
+    and the camera cam_idx [K] of every pair.
+    """
+    corners = box_corners(box_min, box_max)
+    view_transform = world_view_transform[cam_idx]
+    full_proj_transform = proj_mat[cam_idx] @ view_transform
+    homogeneous = torch.cat([corners, torch.ones_like(corners[..., :1])], dim=-1)
+    p_view = homogeneous @ view_transform.transpose(-1, -2)
+    p_proj = homogeneous @ full_proj_transform.transpose(-1, -2)
+    z_min = p_view[..., 2].amin(dim=1)
+    z_max = p_view[..., 2].amax(dim=1)
+    in_front = z_min > NEAR_Z
+
+    # Projections are linear-fractional, so over a box in front of the camera their extremes are at the corners.
+    w = torch.where(in_front[:, None], p_proj[..., 3] + EPS, torch.ones_like(p_proj[..., 3]))
+    pix_x = ndc2pix(p_proj[..., 0] / w, render_grid.image_width)
+    pix_y = ndc2pix(p_proj[..., 1] / w, render_grid.image_height)
+
+    tan_half_fovx = torch.tan(fovx[cam_idx] / 2.0)
+    tan_half_fovy = torch.tan(fovy[cam_idx] / 2.0)
+    h_x = render_grid.image_width / (2.0 * tan_half_fovx)
+    h_y = render_grid.image_height / (2.0 * tan_half_fovy)
+    z_near = torch.where(in_front, z_min, torch.ones_like(z_min))
+    jacobian_sq = (h_x * h_x * (1.0 + 1.69 * tan_half_fovx * tan_half_fovx) +
+                   h_y * h_y * (1.0 + 1.69 * tan_half_fovy * tan_half_fovy)) / (z_near * z_near)
+    radius = torch.ceil(3.0 * torch.sqrt(jacobian_sq * max_scale * max_scale + 2 * COV_2D_DILATION + 0.1 ** 0.5)) + 1.0
+
+    grid_w = render_grid.grid_width * render_grid.tile_width
+    grid_h = render_grid.grid_height * render_grid.tile_height
+    overlaps = ((pix_x.amax(dim=1) + radius > 0) & (pix_x.amin(dim=1) - radius < grid_w) &
+                (pix_y.amax(dim=1) + radius > 0) & (pix_y.amin(dim=1) - radius < grid_h))
+    # Boxes crossing the near plane can not be bounded on screen and stay candidates.
+    return (z_max > NEAR_Z) & (~in_front | overlaps)
+
+
+class GaussianOctree():
+    """Linear octree over the means of N Gaussians.
+
+    Args:
+      xyz_ws: World-space means [N, 3].
+      rotations: Quaternions [N, 4], normalized or not.
+      scales: Scales [N, 3]. With the rotations they give the extent of the Gaussians in the node bounds.
+      leaf_size: Targeted mean number of Gaussians per leaf, picks the depth of the tree.
+      max_depth: Upper limit of the depth, at most 20 so that the Morton codes fit 64 bits.
+    """
+    def __init__(self, xyz_ws, rotations, scales, leaf_size=256, max_depth=10):
+        assert 0 < max_depth <= 20, "max_depth must be in [1, 20]."
+        self.leaf_size = leaf_size
+        self.max_depth = max_depth
+        self.build(xyz_ws, rotations, scales)
+
+    def build(self, xyz_ws, rotations, scales):
+        """Sorts the Gaussians into a new tree, needed whenever their number or order changed."""
+        with torch.no_grad():
+            xyz_ws = xyz_ws.detach()
+            n_points = xyz_ws.shape[0]
+            assert n_points > 0, "Can not build an octree without Gaussians."
+            self.n_points = n_points
+            self.depth = min(self.max_depth, max(1, math.ceil(math.log(max(n_points / self.leaf_size, 1.0), 8))))
+
+            scene_min = xyz_ws.min(dim=0).values
+            scene_extent = torch.clamp_min((xyz_ws.max(dim=0).values - scene_min).max(), EPS)
+            n_cells = 1 << self.depth
+            cells = torch.clamp(((xyz_ws - scene_min) / scene_extent * n_cells).long(), 0, n_cells - 1)
+            codes, self.order = torch.sort(morton_codes(cells, self.depth), stable=True)
+
+            # Level l holds the distinct prefixes code >> 3 * (depth - l) of the sorted codes.
+            self.level_codes = []
+            self.level_parents = []
+            self.point_node = []
+            for level in range(self.depth + 1):
+                node_codes, point_node = torch.unique_consecutive(codes >> (3 * (self.depth - level)),
+                                                                  return_inverse=True)
+                self.level_codes.append(node_codes)
+                self.point_node.append(point_node)
+            for level in range(1, self.depth + 1):
+                parents = torch.searchsorted(self.level_codes[level - 1], self.level_codes[level] >> 3)
+                self.level_parents.append(parents)
+            # The children of a node are contiguous in the next level, as are the points of a leaf.
+            self.level_children = []
+            for level in range(self.depth):
+                n_nodes = self.level_codes[level].shape[0]
+                counts = torch.bincount(self.level_parents[level], minlength=n_nodes)
+                self.level_children.append(torch.stack([torch.cumsum(counts, 0) - counts, counts], dim=1))
+            leaf_counts = torch.bincount(self.point_node[self.depth], minlength=self.level_codes[self.depth].shape[0])
+            self.leaf_points = torch.stack([torch.cumsum(leaf_counts, 0) - leaf_counts, leaf_counts], dim=1)
+        self.refit(xyz_ws, rotations, scales)
+
+    def refit(self, xyz_ws, rotations, scales):
+        """Recomputes the node bounds after the Gaussians moved, turned or changed their scales.
+
+        Keeps the tree and only takes O(N) scatter reductions. If the number
+        of Gaussians changed, e.g. after densification, the tree is rebuilt.
+        Gaussians that moved far from their cell keep the tree correct, but
+        its bounds get looser until the next build.
+        """
+        assert rotations.shape[-1] == 4 and scales.shape[-1] == 3, "Pass the rotations before the scales."
+        if xyz_ws.shape[0] != self.n_points:
+            self.build(xyz_ws, rotations, scales)
+            return
+        with torch.no_grad():
+            xyz_sorted = xyz_ws.detach()[self.order]
+            extent_sorted = splat_extents(rotations.detach(), scales.detach())[self.order]
+            self.box_min, self.box_max, self.max_scale = [], [], []
+            for level in range(self.depth + 1):
+                n_nodes = self.level_codes[level].shape[0]
+                index = self.point_node[level]
+                self.box_min.append(xyz_sorted.new_full((n_nodes, 3), torch.inf).scatter_reduce(
+                    0, index[:, None].expand(-1, 3), xyz_sorted, "amin"))
+                self.box_max.append(xyz_sorted.new_full((n_nodes, 3), -torch.inf).scatter_reduce(
+                    0, index[:, None].expand(-1, 3), xyz_sorted, "amax"))
+                self.max_scale.append(extent_sorted.new_zeros((n_nodes,)).scatter_reduce(
+                    0, index, extent_sorted, "amax"))
+
+    def to(self, device):
+        """Moves the tree to the device of the tensors it is queried with."""
+        for name, value in vars(self).items():
+            if isinstance(value, torch.Tensor):
+                setattr(self, name, value.to(device))
+            elif isinstance(value, list):
+                setattr(self, name, [t.to(device) for t in value])
+        return self
+
+    def _visible(self, cam_idx, level, node_idx, world_view_transform, proj_mat, fovy, fovx, render_grid):
+        """Tests the (camera, node) pairs, True if a splat below the node can touch the camera's tile grid."""
+        return boxes_visible(self.box_min[level][node_idx], self.box_max[level][node_idx],
+                             self.max_scale[level][node_idx], cam_idx, world_view_transform, proj_mat,
+                             fovy, fovx, render_grid)
+
+    def query(self, world_view_transform, proj_mat, fovy, fovx, render_grid):
+        """Lists the candidate Gaussians of the C cameras.
+
+        Args:
+          world_view_transform: The World to View-Space transformations [C, 4, 4].
+          proj_mat: The projection matrices [C, 4, 4].
+          fovy: The vertical fields of view in radians [C].
+          fovx: The horizontal fields of view in radians [C].
+          render_grid: The RenderGrid the cameras render.
+
+        Returns:
+          splat_idx: The sorted c * N + i entries of the Gaussians in visible leaves as an int32 tensor [M].
+        """
+        with torch.no_grad():
+            device = self.order.device
+            n_cameras = world_view_transform.shape[0]
+            cam_idx = torch.arange(n_cameras, device=device)
+            node_idx = torch.zeros(n_cameras, dtype=torch.int64, device=device)
+            for level in range(self.depth + 1):
+                visible = self._visible(cam_idx, level, node_idx, world_view_transform, proj_mat,
+                                        fovy, fovx, render_grid)
+                cam_idx, node_idx = cam_idx[visible], node_idx[visible]
+                ranges = self.level_children[level] if level < self.depth else self.leaf_points
+                first, counts = ranges[node_idx, 0], ranges[node_idx, 1]
+                offsets = torch.cumsum(counts, 0) - counts
+                cam_idx = torch.repeat_interleave(cam_idx, counts)
+                local = torch.arange(cam_idx.shape[0], device=device) - torch.repeat_interleave(offsets, counts)
+                node_idx = torch.repeat_interleave(first, counts) + local
+            # After the leaves node_idx points into the sorted order of the Gaussians.
+            entries = cam_idx * self.n_points + self.order[node_idx]
+            return torch.sort(entries).values.to(torch.int32)
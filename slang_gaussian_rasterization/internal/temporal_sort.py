@@ -0,0 +1,217 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Reuse of the previous frame's tile/depth sort along smooth camera paths.
+
+    temporal_sort = TemporalSort()
+    for camera in path:
+        render_pkg = render_alpha_blend_tiles_slang_raw(..., temporal_sort=temporal_sort)
+
+Between two close cameras, most splats keep both their depth order and the
+tiles they touch. TemporalSort keeps the order of the previous frame at two
+levels: the splats sorted by depth, and the sorted (tile, splat) pairs. Each
+frame it first repairs the depth order, which gives every visible splat a
+unique depth rank, then keys every pair as (tile_id << 32) | rank. The pairs
+of splats whose tile rectangle did not change are taken over from the
+previous frame in their old order, only the pairs of the other splats are new.
+
+Both levels are repaired the same way. Pairs of neighbours that are out of
+order are dropped from the reused sequence until it is sorted, which keeps
+the bulk of it in place. The dropped and new items are sorted on their own
+and merged into it with a binary search. When too many items are out of
+place, the frame falls back to a full sort. Ties in depth are broken by the
+c * N + i entry of the splats, like the stable full sort does, so the order
+is exactly the one of the regular pipeline.
+
+The repair runs as torch operations on the device of the tensors.
+"""
+
+import torch
+from slang_gaussian_rasterization.internal import sort_by_keys
+from slang_gaussian_rasterization.internal.sort_by_keys.sort_by_keys_torch import sort_by_keys_torch
+
+
+def repair_order(keys, guess, max_passes, max_repair_fraction):
+    """Sorts unique keys, reusing a guessed order of most of them.
+
+    Args:
+      keys: The unique int64 keys of the current items [K].
+      guess: Indices into keys in the order of the previous frame [G], items missing from it are new.
+      max_passes: Passes that drop out-of-order neighbours before giving up.
+      max_repair_fraction: Largest fraction of the K items that may be dropped or new.
+
+    Returns:
+      (order, n_reused): The indices that sort keys and how many of them kept their
+      place in the guess, or None if the guess is too far from the order.
+    """
+    n_items = keys.shape[0]
+    max_displaced = max_repair_fraction * n_items
+    kept = guess
+    for repair_pass in range(max_passes + 1):
+        seq = keys[kept]
+        descent = seq[:-1] > seq[1:]
+        if not bool(descent.any()):
+            break
+        if repair_pass == max_passes:
+            return None
+        drop = torch.zeros_like(kept, dtype=torch.bool)
+        drop[:-1] |= descent
+        drop[1:] |= descent
+        kept = kept[~drop]
+        if n_items - kept.shape[0] > max_displaced:
+            return None
+    if n_items - kept.shape[0] > max_displaced:
+        return None
+
+    is_kept = torch.zeros((n_items,), dtype=torch.bool, device=keys.device)
+    is_kept[kept] = True
+    displaced = torch.nonzero(~is_kept).flatten()
+    displaced_keys, displaced_order = torch.sort(keys[displaced])
+    displaced = displaced[displaced_order]
+    kept_keys = keys[kept]
+
+    # The keys are unique, so every item lands after the items of the other sequence below it.
+    order = torch.empty((n_items,), dtype=torch.int64, device=keys.device)
+    order[torch.arange(kept.shape[0], device=keys.device) + torch.searchsorted(displaced_keys, kept_keys)] = kept
+    order[torch.arange(displaced.shape[0], device=keys.device) + torch.searchsorted(kept_keys, displaced_keys)] = displaced
+    return order, kept.shape[0]
+
+
+def full_sort(keys, values, end_bit):
+    """Sorts the (key, value) pairs with the CUB radix sort on the GPU and the reference on the CPU."""
+    if keys.device.type == "cpu":
+        return sort_by_keys_torch(keys, values)
+    return sort_by_keys.sort_by_keys_cub.sort_by_keys(keys, values, end_bit)
+
+
+class TemporalSort():
+    """Keeps the sorted order of the last frame and repairs it for the next one.
+
+    Args:
+      max_repair_fraction: Largest fraction of the splats, and of the pairs, that may be
+                           out of place before a frame falls back to a full sort.
+      max_repair_passes: Passes that drop out-of-order neighbours before the repair gives up.
+    """
+    def __init__(self, max_repair_fraction=0.25, max_repair_passes=8):
+        self.max_repair_fraction = max_repair_fraction
+        self.max_repair_passes = max_repair_passes
+        self.n_frames = 0
+        self.n_full_sorts = 0
+        self.last_stats = None
+        self.reset()
+
+    def reset(self):
+        """Forgets the previous frame, the next frame is sorted from scratch."""
+        self._layout = None
+        self._depth_entries = None
+        self._pair_tiles = None
+        self._pair_entries = None
+        self._rects = None
+        self._touched = None
+
+    def _per_entry(self, values, entries, n_entries):
+        out = values.new_zeros((n_entries,) + values.shape[1:])
+        out[entries] = values
+        return out
+
+    def sort(self, unsorted_keys, unsorted_gauss_idx, xyz_vs, rect_tile_space, tiles_touched,
+             n_entries, n_tiles, end_bit, splat_idx=None):
+        """Sorts the 64-bit (tile_id << 32 | float_bits(z)) keys of a frame.
+
+        Args:
+          unsorted_keys: The exact 64-bit keys emitted by generate_keys [M].
+          unsorted_gauss_idx: The splat of every key [M].
+          xyz_vs, rect_tile_space, tiles_touched: The vertex shader outputs of the splats.
+          n_entries: The number C * N of camera and Gaussian pairs.
+          n_tiles: The number of tiles over all cameras.
+          end_bit: The number of low key bits a full radix sort has to look at.
+          splat_idx: The c * N + i entries of compacted splats, None if they are not compacted.
+
+        Returns:
+          The sorted (tile_id << 32 | depth rank) keys and the sorted splat indices. The tile
+          ids are unchanged, so the tile ranges are computed from the keys as usual.
+        """
+        with torch.no_grad():
+            device = unsorted_keys.device
+            n_splats = tiles_touched.shape[0]
+            entries = (torch.arange(n_splats, device=device) if splat_idx is None else splat_idx.long())
+            layout = (n_entries, n_tiles)
+            if layout != self._layout:
+                self.reset()
+                self._layout = layout
+
+            # Level 1, the depth order of the splats that have keys.
+            visible = torch.nonzero(tiles_touched > 0).flatten()
+            depth = xyz_vs[:, 2].detach().contiguous().view(torch.int32).to(torch.int64)
+            splat_keys = (depth[visible] << 32) | entries[visible]
+            repaired = None
+            if self._depth_entries is not None:
+                position = torch.full((n_entries,), -1, dtype=torch.int64, device=device)
+                position[entries[visible]] = torch.arange(visible.shape[0], device=device)
+                guess = position[self._depth_entries]
+                repaired = repair_order(splat_keys, guess[guess >= 0], self.max_repair_passes,
+                                        self.max_repair_fraction)
+            if repaired is None:
+                depth_order, n_splats_reused = torch.sort(splat_keys).indices, 0
+            else:
+                depth_order, n_splats_reused = repaired
+            rank = torch.zeros((n_splats,), dtype=torch.int64, device=device)
+            rank[visible[depth_order]] = torch.arange(visible.shape[0], device=device)
+
+            # Level 2, the (tile, splat) pairs, keyed by the depth rank so that every key is unique.
+            gauss_idx = unsorted_gauss_idx.long()
+            pair_keys = ((unsorted_keys >> 32) << 32) | rank[gauss_idx]
+            rects = self._per_entry(rect_tile_space, entries, n_entries)
+            touched = self._per_entry(tiles_touched, entries, n_entries)
+            repaired = None
+            if self._pair_tiles is not None:
+                unchanged = (rects == self._rects).all(dim=1) & (touched == self._touched)
+                reused = unchanged[self._pair_entries]
+                splat_of_entry = torch.full((n_entries,), -1, dtype=torch.int64, device=device)
+                splat_of_entry[entries] = torch.arange(n_splats, device=device)
+                reused_gauss_idx = splat_of_entry[self._pair_entries[reused]]
+                reused_keys = (self._pair_tiles[reused] << 32) | rank[reused_gauss_idx]
+                new = ~unchanged[entries[gauss_idx]]
+                candidate_keys = torch.cat([reused_keys, pair_keys[new]])
+                candidate_gauss_idx = torch.cat([reused_gauss_idx, gauss_idx[new]])
+                repaired = repair_order(candidate_keys, torch.arange(reused_keys.shape[0], device=device),
+                                        self.max_repair_passes, self.max_repair_fraction)
+            if repaired is None:
+                sorted_keys, sorted_gauss_idx = full_sort(pair_keys, unsorted_gauss_idx, end_bit)
+                n_keys_reused = 0
+                self.n_full_sorts += 1
+            else:
+                pair_order, n_keys_reused = repaired
+                sorted_keys = candidate_keys[pair_order]
+                sorted_gauss_idx = candidate_gauss_idx[pair_order].to(torch.int32)
+
+            self._depth_entries = entries[visible[depth_order]]
+            self._pair_tiles = sorted_keys >> 32
+            self._pair_entries = entries[sorted_gauss_idx.long()]
+            self._rects = rects
+            self._touched = touched
+            self.n_frames += 1
+            self.last_stats = {'n_splats': visible.shape[0],
+                               'n_splats_reused': n_splats_reused,
+                               'n_keys': sorted_keys.shape[0],
+                               'n_keys_reused': n_keys_reused,
+                               'full_sort': repaired is None}
+        return sorted_keys, sorted_gauss_idx
+
+    def stats(self):
+        """Returns the counters of the last frame and how many frames needed a full sort."""
+        stats = dict(self.last_stats or {})
+        stats.update({'n_frames': self.n_frames, 'n_full_sorts': self.n_full_sorts})
+        if self.last_stats and self.last_stats['n_keys'] > 0:
+            stats['key_reuse_fraction'] = self.last_stats['n_keys_reused'] / self.last_stats['n_keys']
+        return stats
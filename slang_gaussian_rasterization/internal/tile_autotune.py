@@ -0,0 +1,223 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Automatic choice of the tile size from the statistics of a scene.
+
+    autotuner = TileAutotuner()
+    tile_size = autotuner.tile_size(xyz_ws, rotations, scales, opacity, sh_coeffs, active_sh,
+                                    world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width)
+    render_pkg = render_alpha_blend_tiles_slang_raw(..., tile_size=tile_size)
+
+Small tiles give every splat more keys, which costs key generation, sort
+and shared memory loads. Large tiles make every pixel of a tile walk splats
+that only cover other pixels of it. Where the balance lies depends on the
+footprint of the splats, the resolution and N.
+
+The "heuristic" mode projects the splats with the conservative 3 sigma bound
+of frustum_cull, on at most max_stat_splats of them, and counts for every
+candidate the keys their tile rectangles produce and the pixel evaluations
+of the blend, keys times tile area, with blocks below a warp counted as a
+full warp. The cost of a candidate is these counts weighted with
+KEY_COST, PIXEL_COST and TILE_COST. The "timed" mode renders the scene with
+every candidate instead, with the backward pass if trial_backward is set,
+and keeps the fastest. Either way the decision is cached per key, by default
+the resolution and the power of two bucket of N, or the scene_key passed in.
+"""
+
+import math
+import time
+import torch
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid, tile_size_hw
+from slang_gaussian_rasterization.internal.slang.slang_modules import TILE_SIZES_HW
+from slang_gaussian_rasterization.internal.tile_shader_torch import (EPS, NEAR_Z, get_rectangle_tile_space, ndc2pix,
+                                                                     splat_radius_bound, transform_points)
+
+# Relative costs of the heuristic: a key (key generation, sort and shared memory load), the
+# evaluation of a splat at a pixel, and a tile (block launch and output write).
+KEY_COST = 24.0
+PIXEL_COST = 1.0
+TILE_COST = 64.0
+WARP_SIZE = 32
+
+
+def projected_footprints(xyz_ws, rotations, scales, world_view_transform, proj_mat, fovy, fovx, height, width,
+                         max_splats=None):
+    """Returns the pixel positions [M, 2] and radius bounds [M] of the camera and Gaussian pairs in front of the cameras.
+
+    Takes batched [C, 4, 4] cameras. With max_splats, an evenly strided subset of the Gaussians is projected.
+    """
+    with torch.no_grad():
+        n_points = xyz_ws.shape[0]
+        stride = max(1, math.ceil(n_points / max_splats)) if max_splats else 1
+        xyz_ws, rotations, scales = (t.detach()[::stride].float() for t in (xyz_ws, rotations, scales))
+        p_proj = transform_points(xyz_ws, proj_mat @ world_view_transform)
+        p_view = transform_points(xyz_ws, world_view_transform)
+        in_front = p_view[..., 2] > NEAR_Z
+        xy_ndc = p_proj[..., :2] / (p_proj[..., 3:4] + EPS)
+        t = p_view[..., :3] / (p_view[..., 3:4] + EPS)
+        t = torch.where(in_front[..., None], t, torch.ones_like(t))
+        radius = splat_radius_bound(t, scales.abs().amax(dim=1), (rotations * rotations).sum(dim=1),
+                                    fovy, fovx, height, width).flatten()
+        pixelspace_xy = torch.stack([ndc2pix(xy_ndc[..., 0], width), ndc2pix(xy_ndc[..., 1], height)],
+                                    dim=-1).flatten(0, 1)
+    in_front = in_front.flatten()
+    return pixelspace_xy[in_front], radius[in_front], stride
+
+
+def radii_histogram(radius):
+    """Counts the splats per power-of-two bucket of their pixel radius: '0', '1', '2-3', '4-7', ..."""
+    radius = radius.to(torch.int64)
+    buckets = torch.where(radius > 0, torch.floor(torch.log2(radius.clamp_min(1).double())).long() + 1, 0)
+    histogram = {}
+    for bucket, count in zip(*torch.unique(buckets, return_counts=True)):
+        bucket = int(bucket)
+        label = "0" if bucket == 0 else (str(1 << (bucket - 1)) if bucket == 1
+                                         else f"{1 << (bucket - 1)}-{(1 << bucket) - 1}")
+        histogram[label] = int(count)
+    return histogram
+
+
+def estimate_tile_costs(pixelspace_xy, radius, height, width, n_cameras, candidates, stride=1):
+    """Estimates the keys, the blend work and the relative cost of every candidate tile size.
+
+    Returns:
+      {(tile_height, tile_width): {'n_keys', 'pixel_evaluations', 'n_tiles', 'cost'}}.
+    """
+    estimates = {}
+    for tile_height, tile_width in candidates:
+        render_grid = RenderGrid(height, width, tile_height=tile_height, tile_width=tile_width)
+        rect = get_rectangle_tile_space(pixelspace_xy, radius, render_grid).to(torch.int64)
+        n_keys = int(((rect[:, 2] - rect[:, 0]) * (rect[:, 3] - rect[:, 1])).sum()) * stride
+        tile_area = tile_height * tile_width
+        # Blocks of fewer threads than a warp still occupy a whole warp.
+        block_threads = math.ceil(tile_area / WARP_SIZE) * WARP_SIZE
+        n_tiles = n_cameras * render_grid.grid_height * render_grid.grid_width
+        pixel_evaluations = n_keys * block_threads
+        estimates[(tile_height, tile_width)] = {
+            'n_keys': n_keys,
+            'pixel_evaluations': pixel_evaluations,
+            'n_tiles': n_tiles,
+            'cost': KEY_COST * n_keys + PIXEL_COST * pixel_evaluations + TILE_COST * n_tiles * block_threads / WARP_SIZE,
+        }
+    return estimates
+
+
+class TileAutotuner():
+    """Picks and caches the tile size of every (resolution, scene) key.
+
+    Args:
+      mode: "heuristic" estimates the cost of every candidate from the projected splats,
+            "timed" renders the scene with every candidate and keeps the fastest.
+      candidates: The (tile_height, tile_width) sizes to choose from, by default every size in TILE_SIZES_HW.
+      max_stat_splats: The most Gaussians the heuristic projects, larger scenes are subsampled.
+      trial_repeats: Timed renders per candidate, the fastest one counts.
+      trial_backward: Include the backward pass in the timed renders.
+    """
+    def __init__(self, mode="heuristic", candidates=None, max_stat_splats=100000, trial_repeats=3,
+                 trial_backward=True):
+        assert mode in ("heuristic", "timed"), f"Unknown autotuner mode {mode}, available: heuristic, timed"
+        self.mode = mode
+        self.candidates = [tile_size_hw(c) for c in (candidates or TILE_SIZES_HW)]
+        self.max_stat_splats = max_stat_splats
+        self.trial_repeats = trial_repeats
+        self.trial_backward = trial_backward
+        self.decisions = {}
+
+    def cache_key(self, n_points, height, width, scene_key=None):
+        scene = scene_key if scene_key is not None else f"n{1 << max(n_points - 1, 0).bit_length()}"
+        return (height, width, scene)
+
+    def tile_size(self, xyz_ws, rotations, scales, opacity, sh_coeffs, active_sh,
+                  world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width, scene_key=None):
+        """Returns the (tile_height, tile_width) for the scene and cameras, deciding on the first call of its key.
+
+        Takes the arguments of render_alpha_blend_tiles_slang_raw, with a single or a batch of cameras.
+        """
+        key = self.cache_key(xyz_ws.shape[0], height, width, scene_key)
+        if key not in self.decisions:
+            if self.mode == "heuristic":
+                self.decisions[key] = self._heuristic(xyz_ws, rotations, scales, world_view_transform, proj_mat,
+                                                      fovy, fovx, height, width)
+            else:
+                self.decisions[key] = self._timed(xyz_ws, rotations, scales, opacity, sh_coeffs, active_sh,
+                                                  world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width)
+        return self.decisions[key]['tile_size']
+
+    def _batched_cameras(self, world_view_transform, proj_mat, fovy, fovx, device):
+        if world_view_transform.dim() == 2:
+            world_view_transform, proj_mat = world_view_transform[None], proj_mat[None]
+        n_cameras = world_view_transform.shape[0]
+        fovy = torch.as_tensor(fovy, dtype=torch.float, device=device).reshape(-1).expand(n_cameras)
+        fovx = torch.as_tensor(fovx, dtype=torch.float, device=device).reshape(-1).expand(n_cameras)
+        return world_view_transform, proj_mat, fovy, fovx
+
+    def _heuristic(self, xyz_ws, rotations, scales, world_view_transform, proj_mat, fovy, fovx, height, width):
+        world_view_transform, proj_mat, fovy, fovx = self._batched_cameras(world_view_transform, proj_mat,
+                                                                           fovy, fovx, xyz_ws.device)
+        pixelspace_xy, radius, stride = projected_footprints(xyz_ws, rotations, scales, world_view_transform,
+                                                             proj_mat, fovy, fovx, height, width,
+                                                             self.max_stat_splats)
+        estimates = estimate_tile_costs(pixelspace_xy, radius, height, width, world_view_transform.shape[0],
+                                        self.candidates, stride)
+        return {'tile_size': min(estimates, key=lambda c: estimates[c]['cost']),
+                'estimates': estimates,
+                'radii_histogram': radii_histogram(radius)}
+
+    def _timed(self, xyz_ws, rotations, scales, opacity, sh_coeffs, active_sh,
+               world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width):
+        from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw
+        use_cuda = xyz_ws.device.type == "cuda"
+        inputs = [t.detach().requires_grad_(self.trial_backward) for t in (xyz_ws, rotations, scales, opacity,
+                                                                           sh_coeffs)]
+        times_ms = {}
+        for candidate in self.candidates:
+            trials = []
+            # The first render of a size loads its shader, it is not timed.
+            for trial in range(self.trial_repeats + 1):
+                if use_cuda:
+                    torch.cuda.synchronize()
+                start = time.perf_counter()
+                with torch.set_grad_enabled(self.trial_backward):
+                    render_pkg = render_alpha_blend_tiles_slang_raw(*inputs, active_sh, world_view_transform,
+                                                                    proj_mat, cam_pos, fovy, fovx, height, width,
+                                                                    tile_size=candidate)
+                    if self.trial_backward:
+                        render_pkg['render'].sum().backward()
+                if use_cuda:
+                    torch.cuda.synchronize()
+                if trial > 0:
+                    trials.append(1000.0 * (time.perf_counter() - start))
+            times_ms[candidate] = min(trials)
+        return {'tile_size': min(times_ms, key=times_ms.get), 'times_ms': times_ms}
+
+
+_default_autotuner = None
+
+
+def resolve_tile_size(tile_size, xyz_ws, rotations, scales, opacity, sh_coeffs, active_sh,
+                      world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width):
+    """Turns the tile_size argument of the API wrappers into a tile size.
+
+    A TileAutotuner picks the size, "auto" uses a shared heuristic TileAutotuner,
+    and sizes are returned as they are.
+    """
+    global _default_autotuner
+    if isinstance(tile_size, str):
+        assert tile_size == "auto", f"Unknown tile_size {tile_size}, use an int, a pair, 'auto' or a TileAutotuner."
+        if _default_autotuner is None:
+            _default_autotuner = TileAutotuner()
+        tile_size = _default_autotuner
+    if isinstance(tile_size, TileAutotuner):
+        return tile_size.tile_size(xyz_ws, rotations, scales, opacity, sh_coeffs, active_sh,
+                                   world_view_transform, proj_mat, cam_pos, fovy, fovx, height, width)
+    return tile_size
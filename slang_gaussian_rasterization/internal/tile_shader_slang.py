@@ -15,7 +15,144 @@
 import torch
 import slang_gaussian_rasterization.internal.slang.slang_modules as slang_modules
 import math
-from slang_gaussian_rasterization.internal.sort_by_keys import sort_by_keys_cub
+from slang_gaussian_rasterization.internal import sort_by_keys
+from slang_gaussian_rasterization.internal.render_workspace import allocate_buffer
+from slang_gaussian_rasterization.internal.depth_keys import depth_key_layout, visible_depth_range
+from slang_gaussian_rasterization.internal.profiler import (active_profiler, profile_stage, record_allocation,
+                                                            record_temporal_sort_counters)
+from slang_gaussian_rasterization.internal.sparse_grad import visible_gaussian_rows, sparse_rows
+from slang_gaussian_rasterization.internal.roi import select_roi_keys
+from slang_gaussian_rasterization.internal.precision import (float_grad_pair, float_view, is_reduced, storage_bits,
+                                                             storage_format)
+
+def frustum_cull(xyz_ws,
+                 rotations,
+                 scales,
+                 opacity,
+                 world_view_transform,
+                 proj_mat,
+                 cam_pos,
+                 fovy,
+                 fovx,
+                 render_grid,
+                 min_opacity=0.0,
+                 min_radius=0.0,
+                 splat_idx=None):
+    """
+    Culling pre-pass that lists the camera and Gaussian pairs which can touch the image.
+
+    Tests each mean against the near plane and a conservative bound of its 3 sigma
+    radius, from the largest scale, against the tile grid of each camera, so no splat
+    that the vertex shader would keep is dropped. min_opacity and min_radius (in pixels,
+    against the bound) additionally drop faint and tiny splats, which changes the image.
+    If splat_idx is given, e.g. the candidates of a GaussianOctree, only its entries are tested.
+
+    Returns:
+      splat_idx: The sorted c * N + i entries of the surviving pairs as an int32 tensor [M].
+    """
+    compacted = splat_idx is not None
+    candidates = splat_idx if compacted else torch.zeros((1,), dtype=torch.int32, device=xyz_ws.device)
+    n_splats = splat_idx.shape[0] if compacted else xyz_ws.shape[0] * world_view_transform.shape[0]
+    with profile_stage("frustum_cull", xyz_ws.device):
+      visible = torch.empty((n_splats,), dtype=torch.int32, device=xyz_ws.device)
+      slang_modules.vertex_shader.frustum_cull(xyz_ws=xyz_ws.detach(),
+                                               rotations=rotations.detach(),
+                                               scales=scales.detach(),
+                                               opacity=opacity.detach().reshape(-1, 1),
+                                               world_view_transform=world_view_transform,
+                                               proj_mat=proj_mat,
+                                               cam_pos=cam_pos,
+                                               fovy=fovy,
+                                               fovx=fovx,
+                                               out_visible=visible,
+                                               image_height=render_grid.image_height,
+                                               image_width=render_grid.image_width,
+                                               grid_height=render_grid.grid_height,
+                                               grid_width=render_grid.grid_width,
+                                               tile_height=render_grid.tile_height,
+                                               tile_width=render_grid.tile_width,
+                                               min_opacity=min_opacity,
+                                               min_radius=min_radius,
+                                               splat_idx=candidates,
+                                               compacted=compacted).launchRaw(
+              blockSize=(256, 1, 1),
+              gridSize=(math.ceil(n_splats/256), 1, 1)
+      )
+      splat_idx = torch.nonzero(visible).flatten().to(torch.int32)
+      if compacted:
+        splat_idx = candidates[splat_idx]
+      record_allocation(visible.nbytes + splat_idx.nbytes)
+    return splat_idx
+
+
+def balanced_key_candidates(xyz_vs, rect_tile_space, tiles_touched, index_buffer_offset, inv_cov_vs, opacity,
+                            n_points, render_grid, tight_tile_bounds, splat_idx, compacted):
+    """
+    Lists the candidate tiles of the load-balanced key kernels.
+
+    Without tight tile bounds every tile of a splat's rectangle gets a key, so the candidates are
+    the keys themselves and laid out by index_buffer_offset. With tight tile bounds the candidates
+    are all rectangle tiles, mark_overlapped_tiles tests them with one thread each, and the indices
+    of the overlapped ones, in order, tell every key its candidate.
+
+    Returns:
+      candidate_offset: The inclusive cumsum of the candidates per splat [M].
+      key_candidates: The candidate of every key with tight tile bounds, otherwise a placeholder.
+    """
+    if not tight_tile_bounds:
+      return index_buffer_offset, torch.zeros((1,), dtype=torch.int32, device=xyz_vs.device)
+    rect_areas = ((rect_tile_space[:, 2] - rect_tile_space[:, 0]) *
+                  (rect_tile_space[:, 3] - rect_tile_space[:, 1]))
+    candidate_offset = torch.cumsum(rect_areas, dim=0, dtype=torch.int32)
+    n_candidates = int(candidate_offset[-1])
+    overlapped = torch.empty((n_candidates,), dtype=torch.int32, device=xyz_vs.device)
+    slang_modules.tile_shader.mark_overlapped_tiles(xyz_vs=xyz_vs,
+                                                    rect_tile_space=rect_tile_space,
+                                                    tiles_touched=tiles_touched,
+                                                    candidate_offset=candidate_offset,
+                                                    out_overlapped=overlapped,
+                                                    inv_cov_vs=inv_cov_vs,
+                                                    opacity=opacity,
+                                                    n_points=n_points,
+                                                    image_height=render_grid.image_height,
+                                                    image_width=render_grid.image_width,
+                                                    tile_height=render_grid.tile_height,
+                                                    tile_width=render_grid.tile_width,
+                                                    splat_idx=splat_idx,
+                                                    compacted=compacted).launchRaw(
+          blockSize=(256, 1, 1),
+          gridSize=(math.ceil(n_candidates/256), 1, 1)
+    )
+    key_candidates = torch.nonzero(overlapped).flatten().to(torch.int32)
+    record_allocation(candidate_offset.nbytes + overlapped.nbytes + key_candidates.nbytes)
+    return candidate_offset, key_candidates
+
+
+def vertex_shader_inputs(xyz_ws, opacity, tight_tile_bounds, splat_idx):
+    """Returns the (opacity, splat_idx, compacted) arguments of the vertex shader kernels."""
+    assert opacity is not None or not tight_tile_bounds, "tight_tile_bounds needs the opacities."
+    # The kernels only read the opacities with tight tile bounds.
+    opacity = opacity.detach().reshape(-1, 1) if tight_tile_bounds else xyz_ws.new_zeros((1, 1))
+    compacted = splat_idx is not None
+    if not compacted:
+      splat_idx = torch.zeros((1,), dtype=torch.int32, device=xyz_ws.device)
+    return opacity, splat_idx, compacted
+
+
+def vertex_shader_outputs(xyz_ws, rotations, scales, sh_coeffs, active_sh, world_view_transform, proj_mat, cam_pos,
+                          fovy, fovx, render_grid, opacity=None, tight_tile_bounds=False, splat_idx=None,
+                          splat_dtype=torch.float, **tile_shader_kwargs):
+    """Runs only the vertex shader of vertex_and_tile_shader, outside of autograd and without a workspace.
+
+    Takes the arguments of vertex_and_tile_shader and ignores the ones of the tile shader. Returns the
+    (tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb) that its vertex_outputs takes.
+    """
+    opacity, splat_idx, compacted = vertex_shader_inputs(xyz_ws, opacity, tight_tile_bounds, splat_idx)
+    with torch.no_grad():
+      return run_vertex_shader(xyz_ws, rotations, scales, sh_coeffs, active_sh, world_view_transform, proj_mat,
+                               cam_pos, fovy, fovx, render_grid, None, opacity, tight_tile_bounds, splat_idx,
+                               compacted, splat_dtype=splat_dtype)
+
 
 def vertex_and_tile_shader(xyz_ws,
                            rotations,
@@ -27,7 +164,20 @@ def vertex_and_tile_shader(xyz_ws,
                            cam_pos,
                            fovy,
                            fovx,
-                           render_grid):
+                           render_grid,
+                           workspace=None,
+                           depth_bits=None,
+                           opacity=None,
+                           tight_tile_bounds=False,
+                           splat_idx=None,
+                           sparse_grad=False,
+                           balanced_keys=False,
+                           inference=False,
+                           temporal_sort=None,
+                           splat_dtype=torch.float,
+                           tile_mask=None,
+                           recompute_vertex=None,
+                           vertex_outputs=None):
     """
     Vertex and Tile Shader for 3D Gaussian Splatting.
 
@@ -38,67 +188,309 @@ def vertex_and_tile_shader(xyz_ws,
       sh_coeffs: Tensor with the spherical harmonic coefficient which describe with 16 values for each color 
                  the view-dependent emission of each Gaussian [N, 16, 3].
       active_sh: The number of the first active spherical harmonic coefficients, rendering ignores the rest.
-      world_view_transform: The World to View-Space Camera transformation.
-      proj_mat: The View to Screen-Space(Projection) Matrix, transforms the primitives to the Normalized Device Coordinate System.
-      cam_pos: The camera position, could be de-ducted from the world_view_transform, but we pass it seperately for convenience.
-      fovy: The vertical Field of View in radians.
-      fovx: The horizontal Field of View in radians.
+      world_view_transform: The World to View-Space Camera transformations of the C cameras [C, 4, 4].
+      proj_mat: The View to Screen-Space(Projection) Matrices, transform the primitives to the Normalized Device Coordinate System [C, 4, 4].
+      cam_pos: The camera positions, could be de-ducted from the world_view_transform, but we pass them seperately for convenience [C, 3].
+      fovy: The vertical Fields of View in radians [C].
+      fovx: The horizontal Fields of View in radians [C].
       render_grid: Describes the resolution of the image and the tiling resoluting.
+      workspace: Optional RenderWorkspace whose buffers are reused instead of allocating new ones.
+      depth_bits: If set, the depth in the sort keys is quantized to this many bits between the nearest
+                  and farthest visible splat, and the keys are packed into 32 bits when the tile ids fit.
+      opacity: Tensor with the opacities of the Gaussians [N, 1], only read with tight_tile_bounds.
+      tight_tile_bounds: Only emit keys for the tiles that the ellipse on which a splat's alpha drops
+                         to 1/255 overlaps, instead of every tile of its 3 sigma bounding square.
+      splat_idx: Optional int32 list of the c * N + i entries that survived frustum_cull [M]. The
+                 vertex and key passes then only run over these and the per-splat outputs are
+                 compacted to [M], with entry j holding splat_idx[j].
+      sparse_grad: Return the gradients of xyz_ws, rotations, scales and sh_coeffs as sparse tensors
+                   holding the rows of the Gaussians with a non-zero radius, see sparse_grad.py.
+      balanced_keys: Generate the keys with one thread per key instead of one thread per splat, which
+                     keeps splats covering many tiles from stalling their warp. The keys are identical.
+      inference: Run vertex_shader_inference outside of autograd, for rendering without gradients.
+      temporal_sort: Optional TemporalSort that repairs the sorted order of the previous frame instead of
+                     sorting all keys again, see temporal_sort.py. The sorted order is the same.
+      splat_dtype: The storage dtype of inv_cov_vs and rgb, torch.float, torch.float16 or torch.bfloat16.
+                   sh_coeffs are read in their own dtype, see precision.py.
+      tile_mask: Optional bool mask of the tiles to render [C * T]. The keys of the other tiles are dropped
+                 before the sort and the splats left without keys get a zero radius, see roi.py.
+      recompute_vertex: Optional TileShaderRecompute of this call. The vertex shader then keeps only its inputs
+                        for its backward pass and takes its outputs from the recompute there, see recompute.py.
+      vertex_outputs: Optional (tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb) of the vertex
+                      shader for these arguments, see vertex_shader_outputs. The keys are generated for them
+                      without running the vertex shader again.
    
     Returns:
+      The per-splat outputs are laid out camera by camera, entry c * N + i holds Gaussian i seen from camera c.
       sorted_gauss_idx: A list of indices that describe the sorted order with which all tiles should rendered the Gaussians. [M, 1]
-      tile_ranges: Describes the range of Gaussians in the sorted_gauss_idx that are relevant for each tile. [T, 2]
-      radii: The radius of the bounding circle that bounds the 3 standard deviations of the Gaussian ellipsoid. [N, 1]
-      xyz_vs: Tensor with view-space(vs) coordinates of Gaussian means [N, 3].
-      inv_cov_vs: Tensor with the inverted covariance in view-space of the Gaussians [N, 2, 2].
-      rgb: Tensor with the rgb color of the Gaussians evaluated for that corresponding camera.
+      tile_ranges: Describes the range of Gaussians in the sorted_gauss_idx that are relevant for each tile of each camera. [C * T, 2]
+      radii: The radius of the bounding circle that bounds the 3 standard deviations of the Gaussian ellipsoid. [C * N, 1]
+      xyz_vs: Tensor with view-space(vs) coordinates of Gaussian means [C * N, 3].
+      inv_cov_vs: Tensor with the inverted covariance in view-space of the Gaussians [C * N, 2, 2].
+      rgb: Tensor with the rgb color of the Gaussians evaluated for that corresponding camera [C * N, 3].
+      n_keys_saved: With tight_tile_bounds, the number of keys of the 3 sigma squares that were not emitted
+                    as a 0-dim tensor, otherwise None.
     """
     n_points = xyz_ws.shape[0]
-    tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = VertexShader.apply(xyz_ws, 
-                                                                                        rotations,
-                                                                                        scales,
-                                                                                        sh_coeffs,
-                                                                                        active_sh,
-                                                                                        world_view_transform,
-                                                                                        proj_mat,
-                                                                                        cam_pos,
-                                                                                        fovy,
-                                                                                        fovx,
-                                                                                        render_grid)
+    n_cameras = world_view_transform.shape[0]
+    assert temporal_sort is None or (depth_bits is None and not tight_tile_bounds and tile_mask is None), (
+      "temporal_sort needs the exact depth keys and the full tile rectangles.")
+    opacity, splat_idx, compacted = vertex_shader_inputs(xyz_ws, opacity, tight_tile_bounds, splat_idx)
+    n_splats = splat_idx.shape[0] if compacted else n_cameras*n_points
+    if vertex_outputs is not None:
+      tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = vertex_outputs
+    elif inference:
+      tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = run_vertex_shader(xyz_ws, rotations, scales,
+                                                                                         sh_coeffs, active_sh,
+                                                                                         world_view_transform,
+                                                                                         proj_mat, cam_pos,
+                                                                                         fovy, fovx, render_grid,
+                                                                                         workspace, opacity,
+                                                                                         tight_tile_bounds,
+                                                                                         splat_idx, compacted,
+                                                                                         inference=True,
+                                                                                         splat_dtype=splat_dtype)
+    else:
+      tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = VertexShader.apply(xyz_ws, 
+                                                                                          rotations,
+                                                                                          scales,
+                                                                                          sh_coeffs,
+                                                                                          active_sh,
+                                                                                          world_view_transform,
+                                                                                          proj_mat,
+                                                                                          cam_pos,
+                                                                                          fovy,
+                                                                                          fovx,
+                                                                                          render_grid,
+                                                                                          workspace,
+                                                                                          opacity,
+                                                                                          tight_tile_bounds,
+                                                                                          splat_idx,
+                                                                                          compacted,
+                                                                                          sparse_grad,
+                                                                                          splat_dtype,
+                                                                                          recompute_vertex)
 
     with torch.no_grad():
-      index_buffer_offset = torch.cumsum(tiles_touched, dim=0, dtype=tiles_touched.dtype)
-      total_size_index_buffer = index_buffer_offset[-1]
-      unsorted_keys = torch.zeros((total_size_index_buffer,), 
-                                  device="cuda", 
-                                  dtype=torch.int64)
-      unsorted_gauss_idx = torch.zeros((total_size_index_buffer,), 
-                                      device="cuda", 
-                                      dtype=torch.int32)
-      slang_modules.tile_shader.generate_keys(xyz_vs=xyz_vs,
-                                              rect_tile_space=rect_tile_space,
-                                              index_buffer_offset=index_buffer_offset,
-                                              out_unsorted_keys=unsorted_keys,
-                                              out_unsorted_gauss_idx=unsorted_gauss_idx,
-                                              grid_height=render_grid.grid_height,
-                                              grid_width=render_grid.grid_width).launchRaw(
-            blockSize=(256, 1, 1),
-            gridSize=(math.ceil(n_points/256), 1, 1)
-      )    
-
-      highest_tile_id_msb = (render_grid.grid_width*render_grid.grid_height).bit_length()
-      sorted_keys, sorted_gauss_idx = sort_by_keys_cub.sort_by_keys(unsorted_keys, unsorted_gauss_idx, highest_tile_id_msb)
-
-      tile_ranges = torch.zeros((render_grid.grid_height*render_grid.grid_width, 2), 
-                                device="cuda",
-                                dtype=torch.int32)
-      slang_modules.tile_shader.compute_tile_ranges(sorted_keys=sorted_keys,
-                                                    out_tile_ranges=tile_ranges).launchRaw(
+      # The key kernels read the conics of tight tile bounds in float32.
+      key_inv_cov_vs = inv_cov_vs.float() if tight_tile_bounds else torch.zeros((1, 2, 2), device=xyz_ws.device)
+      with profile_stage("generate_keys", xyz_ws.device):
+        index_buffer_offset = torch.cumsum(tiles_touched, dim=0, dtype=tiles_touched.dtype)
+        total_size_index_buffer = int(index_buffer_offset[-1])
+        n_keys_saved = None
+        if tight_tile_bounds:
+          rect_areas = ((rect_tile_space[:, 2] - rect_tile_space[:, 0]) *
+                        (rect_tile_space[:, 3] - rect_tile_space[:, 1]))
+          n_keys_saved = rect_areas.sum() - total_size_index_buffer
+        if balanced_keys:
+          candidate_offset, key_candidates = balanced_key_candidates(xyz_vs, rect_tile_space, tiles_touched,
+                                                                     index_buffer_offset, key_inv_cov_vs, opacity,
+                                                                     n_points, render_grid, tight_tile_bounds,
+                                                                     splat_idx, compacted)
+        n_tiles = n_cameras*render_grid.grid_height*render_grid.grid_width
+        compact_keys, end_bit = depth_key_layout(n_tiles, depth_bits)
+        key_dtype = torch.int32 if compact_keys else torch.int64
+        # generate_keys writes every entry, so the workspace does not need to clear them.
+        unsorted_keys = allocate_buffer(workspace, "unsorted_keys", (total_size_index_buffer,),
+                                        key_dtype, xyz_ws.device, zero=False)
+        unsorted_gauss_idx = allocate_buffer(workspace, "unsorted_gauss_idx", (total_size_index_buffer,),
+                                             torch.int32, xyz_ws.device, zero=False)
+        if balanced_keys and compact_keys:
+          slang_modules.tile_shader.generate_compact_keys_balanced(xyz_vs=xyz_vs,
+                                                                   rect_tile_space=rect_tile_space,
+                                                                   candidate_offset=candidate_offset,
+                                                                   key_candidates=key_candidates,
+                                                                   depth_range=visible_depth_range(xyz_vs, radii),
+                                                                   out_unsorted_keys=unsorted_keys,
+                                                                   out_unsorted_gauss_idx=unsorted_gauss_idx,
+                                                                   n_points=n_points,
+                                                                   grid_height=render_grid.grid_height,
+                                                                   grid_width=render_grid.grid_width,
+                                                                   use_candidates=tight_tile_bounds,
+                                                                   depth_bits=depth_bits,
+                                                                   splat_idx=splat_idx,
+                                                                   compacted=compacted).launchRaw(
+                blockSize=(256, 1, 1),
+                gridSize=(math.ceil(total_size_index_buffer/256), 1, 1)
+          )
+        elif balanced_keys:
+          slang_modules.tile_shader.generate_keys_balanced(xyz_vs=xyz_vs,
+                                                           rect_tile_space=rect_tile_space,
+                                                           candidate_offset=candidate_offset,
+                                                           key_candidates=key_candidates,
+                                                           out_unsorted_keys=unsorted_keys,
+                                                           out_unsorted_gauss_idx=unsorted_gauss_idx,
+                                                           n_points=n_points,
+                                                           grid_height=render_grid.grid_height,
+                                                           grid_width=render_grid.grid_width,
+                                                           use_candidates=tight_tile_bounds,
+                                                           splat_idx=splat_idx,
+                                                           compacted=compacted).launchRaw(
+                blockSize=(256, 1, 1),
+                gridSize=(math.ceil(total_size_index_buffer/256), 1, 1)
+          )
+        elif compact_keys:
+          slang_modules.tile_shader.generate_compact_keys(xyz_vs=xyz_vs,
+                                                          rect_tile_space=rect_tile_space,
+                                                          index_buffer_offset=index_buffer_offset,
+                                                          depth_range=visible_depth_range(xyz_vs, radii),
+                                                          out_unsorted_keys=unsorted_keys,
+                                                          out_unsorted_gauss_idx=unsorted_gauss_idx,
+                                                          inv_cov_vs=key_inv_cov_vs,
+                                                          opacity=opacity,
+                                                          n_points=n_points,
+                                                          image_height=render_grid.image_height,
+                                                          image_width=render_grid.image_width,
+                                                          grid_height=render_grid.grid_height,
+                                                          grid_width=render_grid.grid_width,
+                                                          tile_height=render_grid.tile_height,
+                                                          tile_width=render_grid.tile_width,
+                                                          tight_tile_bounds=tight_tile_bounds,
+                                                          depth_bits=depth_bits,
+                                                          splat_idx=splat_idx,
+                                                          compacted=compacted).launchRaw(
+                blockSize=(256, 1, 1),
+                gridSize=(math.ceil(n_splats/256), 1, 1)
+          )
+        else:
+          slang_modules.tile_shader.generate_keys(xyz_vs=xyz_vs,
+                                                  rect_tile_space=rect_tile_space,
+                                                  index_buffer_offset=index_buffer_offset,
+                                                  out_unsorted_keys=unsorted_keys,
+                                                  out_unsorted_gauss_idx=unsorted_gauss_idx,
+                                                  inv_cov_vs=key_inv_cov_vs,
+                                                  opacity=opacity,
+                                                  n_points=n_points,
+                                                  image_height=render_grid.image_height,
+                                                  image_width=render_grid.image_width,
+                                                  grid_height=render_grid.grid_height,
+                                                  grid_width=render_grid.grid_width,
+                                                  tile_height=render_grid.tile_height,
+                                                  tile_width=render_grid.tile_width,
+                                                  tight_tile_bounds=tight_tile_bounds,
+                                                  splat_idx=splat_idx,
+                                                  compacted=compacted).launchRaw(
+                blockSize=(256, 1, 1),
+                gridSize=(math.ceil(n_splats/256), 1, 1)
+          )
+
+        if tile_mask is not None:
+          unsorted_keys, unsorted_gauss_idx, radii = select_roi_keys(unsorted_keys, unsorted_gauss_idx, radii,
+                                                                     tile_mask, depth_bits if compact_keys else None)
+          total_size_index_buffer = unsorted_keys.shape[0]
+
+      with profile_stage("sort_by_keys", xyz_ws.device):
+        sort_by_keys_cub = sort_by_keys.sort_by_keys_cub
+        if temporal_sort is not None:
+          sorted_keys, sorted_gauss_idx = temporal_sort.sort(unsorted_keys, unsorted_gauss_idx, xyz_vs,
+                                                             rect_tile_space, tiles_touched, n_cameras*n_points,
+                                                             n_tiles, end_bit, splat_idx if compacted else None)
+          record_temporal_sort_counters(temporal_sort.last_stats)
+        elif workspace is None:
+          sorted_keys, sorted_gauss_idx = sort_by_keys_cub.sort_by_keys(unsorted_keys, unsorted_gauss_idx, end_bit)
+          record_allocation(sorted_keys.nbytes + sorted_gauss_idx.nbytes)
+        else:
+          sorted_keys = workspace.buffer("sorted_keys", (total_size_index_buffer,), key_dtype, xyz_ws.device,
+                                         zero=False)
+          sorted_gauss_idx = workspace.buffer("sorted_gauss_idx", (total_size_index_buffer,), torch.int32,
+                                              xyz_ws.device, zero=False)
+          temp_storage = workspace.buffer("sort_temp_storage",
+                                          (sort_by_keys_cub.sort_by_keys_temp_storage_bytes(total_size_index_buffer,
+                                                                                            compact_keys),),
+                                          torch.uint8, xyz_ws.device, zero=False)
+          sort_by_keys_cub.sort_by_keys_out(unsorted_keys, unsorted_gauss_idx,
+                                            sorted_keys, sorted_gauss_idx,
+                                            temp_storage, end_bit)
+
+      with profile_stage("compute_tile_ranges", xyz_ws.device):
+        tile_ranges = allocate_buffer(workspace, "tile_ranges", (n_tiles, 2), torch.int32, xyz_ws.device)
+        if compact_keys:
+          slang_modules.tile_shader.compute_tile_ranges_compact(sorted_keys=sorted_keys,
+                                                                out_tile_ranges=tile_ranges,
+                                                                depth_bits=depth_bits).launchRaw(
+                  blockSize=(256, 1, 1),
+                  gridSize=(math.ceil(total_size_index_buffer/256), 1, 1)
+          )
+        else:
+          slang_modules.tile_shader.compute_tile_ranges(sorted_keys=sorted_keys,
+                                                        out_tile_ranges=tile_ranges).launchRaw(
+                  blockSize=(256, 1, 1),
+                  gridSize=(math.ceil(total_size_index_buffer/256), 1, 1)
+          )
+
+    return sorted_gauss_idx, tile_ranges, radii, xyz_vs, inv_cov_vs, rgb, n_keys_saved
+
+
+def vertex_storage_args(sh_coeffs, inv_cov_vs, rgb, grad_sh_coeffs=None, grad_inv_cov_vs=None, grad_rgb=None):
+    """Returns the 16-bit storage arguments of the vertex shader kernels.
+
+    The grad_* tensors are the float32 buffers of the reduced precision tensors, placeholders if not given.
+    """
+    n_splats = inv_cov_vs.shape[0]
+    return {
+        'sh_coeffs_16': storage_bits(sh_coeffs, sh_coeffs.shape),
+        'd_sh_coeffs_16': grad_sh_coeffs if grad_sh_coeffs is not None else float_view(sh_coeffs, (1, 1, 1)),
+        'sh_storage': storage_format(sh_coeffs.dtype),
+        'out_inv_cov_vs_16': storage_bits(inv_cov_vs, (n_splats, 4)),
+        'd_out_inv_cov_vs_16': grad_inv_cov_vs if grad_inv_cov_vs is not None else float_view(inv_cov_vs, (1, 1)),
+        'out_rgb_16': storage_bits(rgb, (n_splats, 3)),
+        'd_out_rgb_16': grad_rgb if grad_rgb is not None else float_view(rgb, (1, 1)),
+        'splat_storage': storage_format(inv_cov_vs.dtype),
+    }
+
+
+def run_vertex_shader(xyz_ws, rotations, scales, sh_coeffs, active_sh,
+                      world_view_transform, proj_mat, cam_pos, fovy, fovx,
+                      render_grid, workspace=None, opacity=None, tight_tile_bounds=False,
+                      splat_idx=None, compacted=False, inference=False, splat_dtype=torch.float):
+    """Allocates the per-splat outputs and launches vertex_shader, or vertex_shader_inference with inference set.
+
+    sh_coeffs are read in their own dtype and inv_cov_vs and rgb are stored in splat_dtype, see precision.py.
+    """
+    kernel = (slang_modules.vertex_shader.vertex_shader_inference if inference
+              else slang_modules.vertex_shader.vertex_shader)
+    with profile_stage("vertex_shader", xyz_ws.device):
+      n_splats = splat_idx.shape[0] if compacted else xyz_ws.shape[0] * world_view_transform.shape[0]
+      device = xyz_ws.device
+      tiles_touched = allocate_buffer(workspace, "tiles_touched", (n_splats,), torch.int32, device)
+      rect_tile_space = allocate_buffer(workspace, "rect_tile_space", (n_splats, 4), torch.int32, device)
+      radii = allocate_buffer(workspace, "radii", (n_splats,), torch.int32, device)
+    
+      xyz_vs = allocate_buffer(workspace, "xyz_vs", (n_splats, 3), torch.float, device)
+      inv_cov_vs = allocate_buffer(workspace, "inv_cov_vs", (n_splats, 2, 2), splat_dtype, device)
+      rgb = allocate_buffer(workspace, "rgb", (n_splats, 3), splat_dtype, device)
+    
+      kernel(xyz_ws=xyz_ws,
+             rotations=rotations,
+             scales=scales,
+             sh_coeffs=float_view(sh_coeffs, (1, 1, 1)),
+             active_sh=active_sh,
+             world_view_transform=world_view_transform,
+             proj_mat=proj_mat,
+             cam_pos=cam_pos,
+             out_tiles_touched=tiles_touched,
+             out_rect_tile_space=rect_tile_space,
+             out_radii=radii,
+             out_xyz_vs=xyz_vs,
+             out_inv_cov_vs=float_view(inv_cov_vs, (1, 1, 1)),
+             out_rgb=float_view(rgb, (1, 1)),
+             opacity=opacity,
+             fovy=fovy,
+             fovx=fovx,
+             image_height=render_grid.image_height,
+             image_width=render_grid.image_width,
+             grid_height=render_grid.grid_height,
+             grid_width=render_grid.grid_width,
+             tile_height=render_grid.tile_height,
+             tile_width=render_grid.tile_width,
+             tight_tile_bounds=tight_tile_bounds,
+             splat_idx=splat_idx,
+             compacted=compacted,
+             **vertex_storage_args(sh_coeffs, inv_cov_vs, rgb)).launchRaw(
               blockSize=(256, 1, 1),
-              gridSize=(math.ceil(total_size_index_buffer/256), 1, 1)
+              gridSize=(math.ceil(n_splats/256), 1, 1)
       )
-
-    return sorted_gauss_idx, tile_ranges, radii, xyz_vs, inv_cov_vs, rgb
+    return tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb
 
 
 class VertexShader(torch.autograd.Function):
@@ -108,102 +500,121 @@ class VertexShader(torch.autograd.Function):
                 sh_coeffs, active_sh,
                 world_view_transform, proj_mat, cam_pos,
                 fovy, fovx,
-                render_grid, device="cuda"):
-      n_points = xyz_ws.shape[0]
-      tiles_touched = torch.zeros((n_points), 
-                                  device="cuda", 
-                                  dtype=torch.int32)
-      rect_tile_space = torch.zeros((n_points, 4), 
-                                    device="cuda", 
-                                    dtype=torch.int32)
-      radii = torch.zeros((n_points),
-                          device="cuda",
-                          dtype=torch.int32)
-      
-      xyz_vs = torch.zeros((n_points, 3),
-                          device="cuda",
-                          dtype=torch.float)
-      inv_cov_vs = torch.zeros((n_points, 2, 2),
-                                device="cuda",
-                                dtype=torch.float)
-      rgb = torch.zeros((n_points, 3),
-                        device="cuda",
-                        dtype=torch.float)
-      
-      slang_modules.vertex_shader.vertex_shader(xyz_ws=xyz_ws,
-                                                rotations=rotations,
-                                                scales=scales,
-                                                sh_coeffs=sh_coeffs,
-                                                active_sh=active_sh,
-                                                world_view_transform=world_view_transform,
-                                                proj_mat=proj_mat,
-                                                cam_pos=cam_pos,
-                                                out_tiles_touched=tiles_touched,
-                                                out_rect_tile_space=rect_tile_space,
-                                                out_radii=radii,
-                                                out_xyz_vs=xyz_vs,
-                                                out_inv_cov_vs=inv_cov_vs,
-                                                out_rgb=rgb,
-                                                fovy=fovy,
-                                                fovx=fovx,
-                                                image_height=render_grid.image_height,
-                                                image_width=render_grid.image_width,
-                                                grid_height=render_grid.grid_height,
-                                                grid_width=render_grid.grid_width,
-                                                tile_height=render_grid.tile_height,
-                                                tile_width=render_grid.tile_width).launchRaw(
-              blockSize=(256, 1, 1),
-              gridSize=(math.ceil(n_points/256), 1, 1)
-      )
+                render_grid, workspace=None,
+                opacity=None, tight_tile_bounds=False,
+                splat_idx=None, compacted=False, sparse_grad=False, splat_dtype=torch.float, recompute=None):
+      tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = run_vertex_shader(xyz_ws, rotations, scales,
+                                                                                         sh_coeffs, active_sh,
+                                                                                         world_view_transform,
+                                                                                         proj_mat, cam_pos,
+                                                                                         fovy, fovx, render_grid,
+                                                                                         workspace, opacity,
+                                                                                         tight_tile_bounds,
+                                                                                         splat_idx, compacted,
+                                                                                         splat_dtype=splat_dtype)
 
-      ctx.save_for_backward(xyz_ws, rotations, scales, sh_coeffs, world_view_transform, proj_mat, cam_pos,
-                            tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb)
+      if recompute is not None:
+        # The outputs are recomputed from the inputs before the backward pass, see recompute.py.
+        ctx.save_for_backward(xyz_ws, rotations, scales, sh_coeffs, world_view_transform, proj_mat, cam_pos,
+                              None, None, None, None, None, None, opacity, splat_idx)
+      else:
+        ctx.save_for_backward(xyz_ws, rotations, scales, sh_coeffs, world_view_transform, proj_mat, cam_pos,
+                              tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb, opacity, splat_idx)
       ctx.render_grid = render_grid
       ctx.fovy = fovy
       ctx.fovx = fovx
       ctx.active_sh = active_sh
+      ctx.tight_tile_bounds = tight_tile_bounds
+      ctx.compacted = compacted
+      ctx.sparse_grad = sparse_grad
+      ctx.recompute = recompute
+      ctx.profiler = active_profiler()
 
       return tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb
     
     @staticmethod
     def backward(ctx, grad_tiles_touched, grad_rect_tile_space, grad_radii, grad_xyz_vs, grad_inv_cov_vs, grad_rgb):
         (xyz_ws, rotations, scales, sh_coeffs, world_view_transform, proj_mat, cam_pos,
-         tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb) = ctx.saved_tensors
+         tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb, opacity, splat_idx) = ctx.saved_tensors
         render_grid = ctx.render_grid
         fovy = ctx.fovy
         fovx = ctx.fovx
         active_sh = ctx.active_sh
+        if ctx.recompute is not None:
+            # The backward blend already ran the vertex shader again, its outputs are shared.
+            with profile_stage("recompute", xyz_ws.device, ctx.profiler):
+                tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = ctx.recompute.vertex_outputs()
 
+        # The backward pass only runs over the splats that survived culling, the atomic gradient
+        # accumulation scatters them back to the full N Gaussians.
         n_points = xyz_ws.shape[0]
+        n_splats = splat_idx.shape[0] if ctx.compacted else n_points * world_view_transform.shape[0]
+        compacted = ctx.compacted
+        if ctx.sparse_grad:
+            # Only the rendered Gaussians get a gradient row: the kernel reads and writes
+            # compacted copies of them, and the splats that were not rendered are marked -1.
+            rows = visible_gaussian_rows(radii, n_points, splat_idx if compacted else None)
+            row_of_gaussian = torch.full((n_points,), -1, dtype=torch.int64, device=xyz_ws.device)
+            row_of_gaussian[rows] = torch.arange(rows.shape[0], device=xyz_ws.device)
+            entries = splat_idx.long() if compacted else torch.arange(n_splats, device=xyz_ws.device)
+            splat_idx = torch.where(radii.reshape(-1) > 0,
+                                    (entries // n_points) * rows.shape[0] + row_of_gaussian[entries % n_points],
+                                    -1).to(torch.int32)
+            compacted = True
+            full_shapes = [t.shape for t in (xyz_ws, rotations, scales, sh_coeffs)]
+            xyz_ws, rotations, scales, sh_coeffs = (t[rows] for t in (xyz_ws, rotations, scales, sh_coeffs))
+            if ctx.tight_tile_bounds:
+                opacity = opacity[rows]
 
-        grad_xyz_ws = torch.zeros_like(xyz_ws)
-        grad_rotations = torch.zeros_like(rotations)
-        grad_scales = torch.zeros_like(scales)
-        grad_sh_coeffs = torch.zeros_like(sh_coeffs)
-
-        slang_modules.vertex_shader.vertex_shader.bwd(xyz_ws=(xyz_ws, grad_xyz_ws),
-                                                      rotations=(rotations, grad_rotations),
-                                                      scales=(scales, grad_scales),
-                                                      sh_coeffs=(sh_coeffs, grad_sh_coeffs),
-                                                      active_sh=active_sh,
-                                                      world_view_transform=world_view_transform,
-                                                      proj_mat=proj_mat,
-                                                      cam_pos=cam_pos,
-                                                      out_tiles_touched=tiles_touched,
-                                                      out_rect_tile_space=rect_tile_space,
-                                                      out_radii=radii,
-                                                      out_xyz_vs=(xyz_vs, grad_xyz_vs),
-                                                      out_inv_cov_vs=(inv_cov_vs, grad_inv_cov_vs),
-                                                      out_rgb=(rgb, grad_rgb),
-                                                      fovy=fovy,
-                                                      fovx=fovx,
-                                                      image_height=render_grid.image_height,
-                                                      image_width=render_grid.image_width,
-                                                      grid_height=render_grid.grid_height,
-                                                      grid_width=render_grid.grid_width,
-                                                      tile_height=render_grid.tile_height,
-                                                      tile_width=render_grid.tile_width).launchRaw(
-              blockSize=(256, 1, 1),
-              gridSize=(math.ceil(n_points/256), 1, 1)
-        )
-        return grad_xyz_ws, grad_rotations, grad_scales, grad_sh_coeffs, None, None, None, None, None, None, None
\ No newline at end of file
+        with profile_stage("vertex_shader.bwd", xyz_ws.device, ctx.profiler):
+            grad_xyz_ws = torch.zeros_like(xyz_ws)
+            grad_rotations = torch.zeros_like(rotations)
+            grad_scales = torch.zeros_like(scales)
+            # The gradients of reduced precision tensors are accumulated in float32.
+            grad_sh_coeffs = torch.zeros(sh_coeffs.shape, dtype=torch.float, device=sh_coeffs.device)
+            record_allocation(grad_xyz_ws.nbytes + grad_rotations.nbytes + grad_scales.nbytes + grad_sh_coeffs.nbytes,
+                              ctx.profiler)
+            n_grad_splats = inv_cov_vs.shape[0]
+            storage_args = vertex_storage_args(
+                sh_coeffs, inv_cov_vs, rgb,
+                grad_sh_coeffs=grad_sh_coeffs if is_reduced(sh_coeffs) else None,
+                grad_inv_cov_vs=(grad_inv_cov_vs.float().reshape(n_grad_splats, 4).contiguous()
+                                 if is_reduced(inv_cov_vs) else None),
+                grad_rgb=grad_rgb.float().contiguous() if is_reduced(rgb) else None)
+
+            slang_modules.vertex_shader.vertex_shader.bwd(xyz_ws=(xyz_ws, grad_xyz_ws),
+                                                          rotations=(rotations, grad_rotations),
+                                                          scales=(scales, grad_scales),
+                                                          sh_coeffs=float_grad_pair(sh_coeffs, grad_sh_coeffs,
+                                                                                    (1, 1, 1)),
+                                                          active_sh=active_sh,
+                                                          world_view_transform=world_view_transform,
+                                                          proj_mat=proj_mat,
+                                                          cam_pos=cam_pos,
+                                                          out_tiles_touched=tiles_touched,
+                                                          out_rect_tile_space=rect_tile_space,
+                                                          out_radii=radii,
+                                                          out_xyz_vs=(xyz_vs, grad_xyz_vs),
+                                                          out_inv_cov_vs=float_grad_pair(inv_cov_vs, grad_inv_cov_vs,
+                                                                                         (1, 1, 1)),
+                                                          out_rgb=float_grad_pair(rgb, grad_rgb, (1, 1)),
+                                                          opacity=opacity,
+                                                          fovy=fovy,
+                                                          fovx=fovx,
+                                                          image_height=render_grid.image_height,
+                                                          image_width=render_grid.image_width,
+                                                          grid_height=render_grid.grid_height,
+                                                          grid_width=render_grid.grid_width,
+                                                          tile_height=render_grid.tile_height,
+                                                          tile_width=render_grid.tile_width,
+                                                          tight_tile_bounds=ctx.tight_tile_bounds,
+                                                          splat_idx=splat_idx,
+                                                          compacted=compacted,
+                                                          **storage_args).launchRaw(
+                  blockSize=(256, 1, 1),
+                  gridSize=(math.ceil(n_splats/256), 1, 1)
+            )
+        grads = (grad_xyz_ws, grad_rotations, grad_scales, grad_sh_coeffs.to(sh_coeffs.dtype))
+        if ctx.sparse_grad:
+            grads = tuple(sparse_rows(rows, grad, shape) for grad, shape in zip(grads, full_shapes))
+        return grads + (None, None, None, None, None, None, None, None, None, None, None, None, None, None, None)
\ No newline at end of file
@@ -0,0 +1,553 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pure PyTorch reference of the vertex and tile shaders.
+
+Mirrors vertex_shader.slang, tile_shader.slang and spherical_harmonics.slang
+with batched tensor operations, so the pipeline runs on any device torch
+supports including the CPU. Gradients are provided by torch autograd.
+"""
+
+import torch
+import torch.utils.checkpoint
+from slang_gaussian_rasterization.internal.sort_by_keys.sort_by_keys_torch import sort_by_keys_torch
+from slang_gaussian_rasterization.internal.render_workspace import allocate_buffer
+from slang_gaussian_rasterization.internal.profiler import profile_stage, record_allocation, record_temporal_sort_counters
+from slang_gaussian_rasterization.internal.depth_keys import (depth_key_layout, visible_depth_range, quantize_depth_torch,
+                                                              key_tile_ids)
+from slang_gaussian_rasterization.internal.roi import select_roi_keys
+
+SH_C0 = 0.28209479177387814
+SH_C1 = 0.4886025119029199
+SH_C2 = [1.0925484305920792,
+         -1.0925484305920792,
+         0.31539156525252005,
+         -1.0925484305920792,
+         0.5462742152960396]
+SH_C3 = [-0.5900435899266435,
+         2.890611442640554,
+         -0.4570457994644658,
+         0.3731763325901154,
+         -0.4570457994644658,
+         1.445305721320277,
+         -0.5900435899266435]
+
+EPS = 1e-7
+NEAR_Z = 0.2
+COV_2D_DILATION = 0.3
+
+
+def ndc2pix(v, S):
+    return ((v + 1.0) * S - 1.0) * 0.5
+
+
+def transform_points(xyz, transf_matrix):
+    """Applies [C, 4, 4] transformations to [N, 3] points, returns homogeneous points [C, N, 4]."""
+    return torch.cat([xyz, torch.ones_like(xyz[:, :1])], dim=1) @ transf_matrix.transpose(-1, -2)
+
+
+def compute_color_from_sh_coeffs(sh_coeffs, xyz_ws, cam_pos, active_sh):
+    """Evaluates the view-dependent color [C, N, 3] of the Gaussians, see spherical_harmonics.slang."""
+    direction = xyz_ws[None, :, :] - cam_pos[:, None, :]
+    direction = direction / torch.linalg.vector_norm(direction, dim=-1, keepdim=True)
+    x, y, z = direction[..., 0:1], direction[..., 1:2], direction[..., 2:3]
+
+    rgb = (SH_C0 * sh_coeffs[:, 0]).expand_as(direction)
+    if active_sh > 0:
+        rgb = rgb - SH_C1 * y * sh_coeffs[:, 1] + SH_C1 * z * sh_coeffs[:, 2] - SH_C1 * x * sh_coeffs[:, 3]
+        if active_sh > 1:
+            xx, yy, zz = x * x, y * y, z * z
+            xy, yz, xz = x * y, y * z, x * z
+            rgb = (rgb +
+                   SH_C2[0] * xy * sh_coeffs[:, 4] +
+                   SH_C2[1] * yz * sh_coeffs[:, 5] +
+                   SH_C2[2] * (2.0 * zz - xx - yy) * sh_coeffs[:, 6] +
+                   SH_C2[3] * xz * sh_coeffs[:, 7] +
+                   SH_C2[4] * (xx - yy) * sh_coeffs[:, 8])
+            if active_sh > 2:
+                rgb = (rgb +
+                       SH_C3[0] * y * (3.0 * xx - yy) * sh_coeffs[:, 9] +
+                       SH_C3[1] * xy * z * sh_coeffs[:, 10] +
+                       SH_C3[2] * y * (4.0 * zz - xx - yy) * sh_coeffs[:, 11] +
+                       SH_C3[3] * z * (2.0 * zz - 3.0 * xx - 3.0 * yy) * sh_coeffs[:, 12] +
+                       SH_C3[4] * x * (4.0 * zz - xx - yy) * sh_coeffs[:, 13] +
+                       SH_C3[5] * z * (xx - yy) * sh_coeffs[:, 14] +
+                       SH_C3[6] * x * (xx - 3.0 * yy) * sh_coeffs[:, 15])
+
+    rgb = rgb + 0.5
+    return torch.clamp_min(rgb, 0.0)
+
+
+def get_covariance_from_quat_scales(q, s):
+    """Builds the world-space covariances [N, 3, 3] from quaternions [N, 4] and scales [N, 3]."""
+    r, x, y, z = q.unbind(dim=1)
+    rotation_matrix = torch.stack([
+        1 - 2 * (y * y + z * z), 2 * (x * y - r * z), 2 * (x * z + r * y),
+        2 * (x * y + r * z), 1 - 2 * (x * x + z * z), 2 * (y * z - r * x),
+        2 * (x * z - r * y), 2 * (y * z + r * x), 1 - 2 * (x * x + y * y)
+    ], dim=1).view(-1, 3, 3)
+    L = rotation_matrix * s[:, None, :]
+    return L @ L.transpose(1, 2)
+
+
+def covariance_3d_to_2d(xyz_ws, cov_ws, world_view_transform, fovy, fovx, image_height, image_width, in_front):
+    """Projects the world-space covariances [N, 3, 3] to the screen of the C cameras, returns [C, N, 2, 2]."""
+    tan_half_fovx = torch.tan(fovx / 2.0)[:, None]
+    tan_half_fovy = torch.tan(fovy / 2.0)[:, None]
+    h_x = image_width / (2.0 * tan_half_fovx)
+    h_y = image_height / (2.0 * tan_half_fovy)
+
+    t_hom = transform_points(xyz_ws, world_view_transform)
+    t = t_hom[..., :3] / (t_hom[..., 3:4] + EPS)
+    # Guard the points behind the camera so that their masked-out gradients do not turn into NaNs.
+    t_z = torch.where(in_front, t[..., 2], torch.ones_like(t[..., 2]))
+
+    limx = 1.3 * tan_half_fovx
+    limy = 1.3 * tan_half_fovy
+    t_x = torch.maximum(torch.minimum(t[..., 0] / t_z, limx), -limx) * t_z
+    t_y = torch.maximum(torch.minimum(t[..., 1] / t_z, limy), -limy) * t_z
+
+    zeros = torch.zeros_like(t_z)
+    J = torch.stack([h_x / t_z, zeros, -(h_x * t_x) / (t_z * t_z),
+                     zeros, h_y / t_z, -(h_y * t_y) / (t_z * t_z)], dim=-1).view(t_z.shape + (2, 3))
+    R = world_view_transform[:, None, :3, :3]
+    T = J @ R
+    cov_vs = T @ cov_ws[None] @ T.transpose(-1, -2)
+    return cov_vs + COV_2D_DILATION * torch.eye(2, device=cov_vs.device, dtype=cov_vs.dtype)
+
+
+def splat_radius(cov_vs, det):
+    mid = 0.5 * (cov_vs[:, 0, 0] + cov_vs[:, 1, 1])
+    eigen_val_1 = mid + torch.sqrt(torch.clamp_min(mid * mid - det, 0.1))
+    eigen_val_2 = mid - torch.sqrt(torch.clamp_min(mid * mid - det, 0.1))
+    return torch.ceil(3.0 * torch.sqrt(torch.maximum(eigen_val_1, eigen_val_2)))
+
+
+def get_rectangle_tile_space(pixelspace_xy, radius, render_grid):
+    """Returns the [min_x, min_y, max_x, max_y] tile rectangle [N, 4] touched by each splat."""
+    tile_size = pixelspace_xy.new_tensor([render_grid.tile_width, render_grid.tile_height])
+    grid_size = pixelspace_xy.new_tensor([render_grid.grid_width, render_grid.grid_height])
+    rect_min = torch.floor(torch.clamp((pixelspace_xy - radius[:, None]) / tile_size, min=0).minimum(grid_size))
+    rect_max = torch.ceil(torch.clamp((pixelspace_xy + radius[:, None]) / tile_size, min=0).minimum(grid_size))
+    return torch.cat([rect_min, rect_max], dim=1).to(torch.int32)
+
+
+def opacity_power_cutoff(opacity):
+    """See opacity_power_cutoff in utils.slang."""
+    return 2.0 * torch.log(255.0 * opacity)
+
+
+def edge_min_power(a, b, c, x, y_min, y_max):
+    y = torch.minimum(torch.maximum(-b * x / c, y_min), y_max)
+    return a * x * x + 2.0 * b * x * y + c * y * y
+
+
+def ellipse_overlaps_tile(center, conic, power_cutoff, tile_x, tile_y, render_grid):
+    """Vectorized ellipse_overlaps_tile of utils.slang, every argument holds one entry per tested tile."""
+    box_min_x = tile_x * render_grid.tile_width - center[:, 0]
+    box_min_y = tile_y * render_grid.tile_height - center[:, 1]
+    box_max_x = box_min_x + (render_grid.tile_width - 1)
+    box_max_y = box_min_y + (render_grid.tile_height - 1)
+    inside = (box_min_x <= 0) & (box_min_y <= 0) & (box_max_x >= 0) & (box_max_y >= 0)
+
+    a = conic[:, 0, 0]
+    b = 0.5 * (conic[:, 0, 1] + conic[:, 1, 0])
+    c = conic[:, 1, 1]
+    min_power = torch.minimum(torch.minimum(edge_min_power(a, b, c, box_min_x, box_min_y, box_max_y),
+                                            edge_min_power(a, b, c, box_max_x, box_min_y, box_max_y)),
+                              torch.minimum(edge_min_power(c, b, a, box_min_y, box_min_x, box_max_x),
+                                            edge_min_power(c, b, a, box_max_y, box_min_x, box_max_x)))
+    return (power_cutoff >= 0) & (inside | (min_power <= power_cutoff))
+
+
+def expand_rect_tiles(rect_tile_space, n_tiles):
+    """Lists the first n_tiles tiles of every rectangle row-major, returns their (splat index, tile_x, tile_y)."""
+    n_tiles = n_tiles.to(torch.int64)
+    device = rect_tile_space.device
+    splat_idx = torch.repeat_interleave(torch.arange(rect_tile_space.shape[0], device=device), n_tiles)
+    index_buffer_start = torch.cumsum(n_tiles, dim=0) - n_tiles
+    local_idx = torch.arange(splat_idx.shape[0], device=device) - index_buffer_start[splat_idx]
+
+    rect = rect_tile_space[splat_idx].to(torch.int64)
+    rect_width = rect[:, 2] - rect[:, 0]
+    tile_x = rect[:, 0] + local_idx % rect_width
+    tile_y = rect[:, 1] + local_idx // rect_width
+    return splat_idx, tile_x, tile_y
+
+
+def tight_tile_overlap(xyz_vs, inv_cov_vs, opacity, rect_tile_space, n_points, render_grid, entry_idx=None):
+    """Expands the rectangles like expand_rect_tiles, but only keeps the tiles that the 1/255 alpha ellipse overlaps."""
+    rect_areas = (rect_tile_space[:, 2] - rect_tile_space[:, 0]) * (rect_tile_space[:, 3] - rect_tile_space[:, 1])
+    splat_idx, tile_x, tile_y = expand_rect_tiles(rect_tile_space, rect_areas)
+    center = torch.stack([ndc2pix(xyz_vs[:, 0], render_grid.image_width),
+                          ndc2pix(xyz_vs[:, 1], render_grid.image_height)], dim=1)
+    entry = splat_idx if entry_idx is None else entry_idx.long()[splat_idx]
+    power_cutoff = opacity_power_cutoff(opacity.reshape(-1))[entry % n_points]
+    overlaps = ellipse_overlaps_tile(center[splat_idx], inv_cov_vs[splat_idx], power_cutoff,
+                                     tile_x, tile_y, render_grid)
+    return splat_idx[overlaps], tile_x[overlaps], tile_y[overlaps]
+
+
+def candidate_tiles(candidates, candidate_offset, rect_tile_space):
+    """See candidate_tile in tile_shader.slang, maps candidates to their (splat index, tile_x, tile_y) by binary search."""
+    candidate_offset = candidate_offset.to(torch.int64)
+    splat_idx = torch.searchsorted(candidate_offset, candidates, right=True)
+    local_idx = candidates - torch.where(splat_idx > 0, candidate_offset[(splat_idx - 1).clamp_min(0)], 0)
+    rect = rect_tile_space[splat_idx].to(torch.int64)
+    rect_width = rect[:, 2] - rect[:, 0]
+    return splat_idx, rect[:, 0] + local_idx % rect_width, rect[:, 1] + local_idx // rect_width
+
+
+def balanced_key_tiles(xyz_vs, inv_cov_vs, opacity, rect_tile_space, tiles_touched, n_points, render_grid,
+                       tight_tile_bounds=False, splat_idx=None):
+    """Key expansion of the load-balanced kernels, see balanced_key_candidates in tile_shader_slang.py.
+
+    Lists the same (splat index, tile_x, tile_y) of every key as the per-splat
+    expansion, but derives them from the key or candidate index alone.
+    """
+    device = rect_tile_space.device
+    if not tight_tile_bounds:
+        candidate_offset = torch.cumsum(tiles_touched.to(torch.int64), dim=0)
+        key_candidates = torch.arange(int(candidate_offset[-1]), device=device)
+        return candidate_tiles(key_candidates, candidate_offset, rect_tile_space)
+
+    rect_areas = (rect_tile_space[:, 2] - rect_tile_space[:, 0]) * (rect_tile_space[:, 3] - rect_tile_space[:, 1])
+    candidate_offset = torch.cumsum(rect_areas.to(torch.int64), dim=0)
+    gauss_idx, tile_x, tile_y = candidate_tiles(torch.arange(int(candidate_offset[-1]), device=device),
+                                                candidate_offset, rect_tile_space)
+    center = torch.stack([ndc2pix(xyz_vs[:, 0], render_grid.image_width),
+                          ndc2pix(xyz_vs[:, 1], render_grid.image_height)], dim=1)
+    entry = gauss_idx if splat_idx is None else splat_idx.long()[gauss_idx]
+    power_cutoff = opacity_power_cutoff(opacity.reshape(-1))[entry % n_points]
+    overlapped = (tiles_touched[gauss_idx] > 0) & ellipse_overlaps_tile(center[gauss_idx], inv_cov_vs[gauss_idx],
+                                                                         power_cutoff, tile_x, tile_y, render_grid)
+    key_candidates = torch.nonzero(overlapped).flatten()
+    return gauss_idx[key_candidates], tile_x[key_candidates], tile_y[key_candidates]
+
+
+def vertex_shader_torch(xyz_ws, rotations, scales, sh_coeffs, active_sh,
+                        world_view_transform, proj_mat, cam_pos,
+                        fovy, fovx, render_grid, opacity=None, tight_tile_bounds=False, splat_dtype=torch.float):
+    """Vectorized equivalent of the vertex_shader kernel.
+
+    Takes batched cameras ([C, 4, 4] transforms, [C, 3] positions and [C]
+    fields of view) and returns the same [C * N] tensors as
+    VertexShader.forward. Gaussians rejected by the kernel (behind the near
+    plane, degenerate or outside the grid) keep zeros in every output and
+    receive no gradient. With tight_tile_bounds, tiles_touched only counts
+    the tiles the 1/255 alpha ellipse overlaps while rect_tile_space keeps
+    the 3 sigma square. sh_coeffs may be stored in 16 bits, inv_cov_vs and
+    rgb are returned in splat_dtype.
+    """
+    image_height = render_grid.image_height
+    image_width = render_grid.image_width
+
+    full_proj_transform = proj_mat @ world_view_transform
+    p_proj = transform_points(xyz_ws, full_proj_transform)
+    p_view = transform_points(xyz_ws, world_view_transform)
+    z_vs = p_view[..., 2]
+    in_front = z_vs > NEAR_Z
+    w_proj = torch.where(in_front, p_proj[..., 3] + EPS, torch.ones_like(p_proj[..., 3]))
+    xy_ndc = (p_proj[..., :2] / w_proj[..., None]).flatten(0, 1)
+
+    n_coeffs = (active_sh + 1) ** 2
+    rgb = compute_color_from_sh_coeffs(sh_coeffs[:, :n_coeffs].float(), xyz_ws, cam_pos, active_sh).flatten(0, 1)
+    cov_ws = get_covariance_from_quat_scales(rotations, scales)
+    cov_vs = covariance_3d_to_2d(xyz_ws, cov_ws, world_view_transform,
+                                 fovy, fovx, image_height, image_width, in_front).flatten(0, 1)
+    z_vs = z_vs.flatten(0, 1)
+    in_front = in_front.flatten(0, 1)
+
+    det = cov_vs[:, 0, 0] * cov_vs[:, 1, 1] - cov_vs[:, 0, 1] * cov_vs[:, 1, 0]
+    with torch.no_grad():
+        visible = in_front & (det != 0)
+        radius = torch.where(visible, splat_radius(cov_vs, det), torch.zeros_like(det))
+        pixelspace_xy = torch.stack([ndc2pix(xy_ndc[:, 0], image_width),
+                                     ndc2pix(xy_ndc[:, 1], image_height)], dim=1)
+        pixelspace_xy = torch.where(visible[:, None], pixelspace_xy, torch.zeros_like(pixelspace_xy))
+        rect_tile_space = get_rectangle_tile_space(pixelspace_xy, radius, render_grid)
+        n_tiles = ((rect_tile_space[:, 2] - rect_tile_space[:, 0]) *
+                   (rect_tile_space[:, 3] - rect_tile_space[:, 1]))
+        valid = visible & (n_tiles > 0)
+
+        tiles_touched = torch.where(valid, n_tiles, torch.zeros_like(n_tiles)).to(torch.int32)
+        rect_tile_space = torch.where(valid[:, None], rect_tile_space, torch.zeros_like(rect_tile_space))
+        radii = torch.where(valid, radius, torch.zeros_like(radius)).to(torch.int32)
+
+    safe_det = torch.where(valid, det, torch.ones_like(det))
+    inv_cov_vs = torch.stack([cov_vs[:, 1, 1], -cov_vs[:, 0, 1],
+                              -cov_vs[:, 1, 0], cov_vs[:, 0, 0]], dim=1).view(-1, 2, 2) / safe_det[:, None, None]
+    inv_cov_vs = inv_cov_vs.to(splat_dtype)
+
+    xyz_vs = torch.cat([xy_ndc, z_vs[:, None]], dim=1)
+    if tight_tile_bounds:
+        with torch.no_grad():
+            splat_idx, _, _ = tight_tile_overlap(xyz_vs, inv_cov_vs.float(), opacity, rect_tile_space,
+                                                 xyz_ws.shape[0], render_grid)
+            tiles_touched = torch.bincount(splat_idx, minlength=xyz_vs.shape[0]).to(torch.int32)
+            valid = valid & (tiles_touched > 0)
+            radii = torch.where(valid, radii, torch.zeros_like(radii))
+    xyz_vs = torch.where(valid[:, None], xyz_vs, torch.zeros_like(xyz_vs))
+    inv_cov_vs = torch.where(valid[:, None, None], inv_cov_vs, torch.zeros_like(inv_cov_vs))
+    rgb = torch.where(valid[:, None], rgb.to(splat_dtype), torch.zeros_like(rgb, dtype=splat_dtype))
+
+    return tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb
+
+
+def splat_radius_bound(t, max_scale, rotation_norm, fovy, fovx, image_height, image_width):
+    """Vectorized splat_radius_bound of utils.slang, t are the view-space points [C, N, 3]."""
+    tan_half_fovx = torch.tan(fovx / 2.0)[:, None]
+    tan_half_fovy = torch.tan(fovy / 2.0)[:, None]
+    h_x = image_width / (2.0 * tan_half_fovx)
+    h_y = image_height / (2.0 * tan_half_fovy)
+    txtz = torch.maximum(torch.minimum(t[..., 0] / t[..., 2], 1.3 * tan_half_fovx), -1.3 * tan_half_fovx)
+    tytz = torch.maximum(torch.minimum(t[..., 1] / t[..., 2], 1.3 * tan_half_fovy), -1.3 * tan_half_fovy)
+    jacobian_sq = (h_x * h_x * (1.0 + txtz * txtz) + h_y * h_y * (1.0 + tytz * tytz)) / (t[..., 2] * t[..., 2])
+    extent = max_scale * (torch.abs(1.0 - rotation_norm) + rotation_norm)
+    return torch.ceil(3.0 * torch.sqrt(jacobian_sq * extent * extent + 2 * COV_2D_DILATION + 0.1 ** 0.5)) + 1.0
+
+
+def frustum_cull_torch(xyz_ws, rotations, scales, opacity, world_view_transform, proj_mat, cam_pos,
+                       fovy, fovx, render_grid, min_opacity=0.0, min_radius=0.0, splat_idx=None):
+    """PyTorch equivalent of tile_shader_slang.frustum_cull, returns the int32 entries [M] of the kept pairs."""
+    with torch.no_grad(), profile_stage("frustum_cull", xyz_ws.device):
+        n_cameras = world_view_transform.shape[0]
+        xyz_ws = xyz_ws.detach()
+        p_proj = transform_points(xyz_ws, proj_mat @ world_view_transform)
+        p_view = transform_points(xyz_ws, world_view_transform)
+        in_front = p_view[..., 2] > NEAR_Z
+        xy_ndc = p_proj[..., :2] / (p_proj[..., 3:4] + EPS)
+        t = p_view[..., :3] / (p_view[..., 3:4] + EPS)
+        t = torch.where(in_front[..., None], t, torch.ones_like(t))
+
+        max_scale = torch.abs(scales.detach()).amax(dim=1)
+        rotation_norm = (rotations.detach() * rotations.detach()).sum(dim=1)
+        radius = splat_radius_bound(t, max_scale, rotation_norm, fovy, fovx,
+                                    render_grid.image_height, render_grid.image_width).flatten()
+        pixelspace_xy = torch.stack([ndc2pix(xy_ndc[..., 0], render_grid.image_width),
+                                     ndc2pix(xy_ndc[..., 1], render_grid.image_height)], dim=-1).flatten(0, 1)
+        rect_tile_space = get_rectangle_tile_space(pixelspace_xy, radius, render_grid)
+        visible = (in_front.flatten() &
+                   (rect_tile_space[:, 2] > rect_tile_space[:, 0]) &
+                   (rect_tile_space[:, 3] > rect_tile_space[:, 1]) &
+                   (radius >= min_radius) &
+                   (opacity.detach().reshape(-1).repeat(n_cameras) >= min_opacity))
+        if splat_idx is not None:
+            splat_idx = splat_idx[visible[splat_idx.long()]]
+        else:
+            splat_idx = torch.nonzero(visible).flatten().to(torch.int32)
+        record_allocation(splat_idx.nbytes)
+    return splat_idx
+
+
+def generate_keys_torch(xyz_vs, rect_tile_space, tiles_touched, n_points, render_grid,
+                        depth_range=None, depth_bits=None, inv_cov_vs=None, opacity=None, tight_tile_bounds=False,
+                        splat_idx=None, balanced_keys=False):
+    """Vectorized equivalent of the generate_keys and generate_compact_keys kernels.
+
+    Emits one (tile_id << 32 | float_bits(z)) key per touched tile, in the same
+    order as the kernel: Gaussian by Gaussian, row-major over the rectangle.
+    The tile ids of camera c are offset by c * grid_height * grid_width.
+    If depth_bits is given, emits 32-bit (tile_id << depth_bits | quantized_z)
+    keys instead, with z quantized between depth_range[0] and depth_range[1].
+    With tight_tile_bounds, only the tiles of the rectangle that the 1/255
+    alpha ellipse overlaps get a key. For splats compacted by frustum culling,
+    splat_idx holds the c * N + i entry of each of them. balanced_keys expands
+    the keys like the load-balanced kernels, with the same result.
+    """
+    if balanced_keys:
+        gauss_idx, tile_x, tile_y = balanced_key_tiles(xyz_vs, inv_cov_vs, opacity, rect_tile_space, tiles_touched,
+                                                       n_points, render_grid, tight_tile_bounds, splat_idx)
+    elif tight_tile_bounds:
+        gauss_idx, tile_x, tile_y = tight_tile_overlap(xyz_vs, inv_cov_vs, opacity, rect_tile_space,
+                                                       n_points, render_grid, splat_idx)
+        # Splats without any overlapping tile keep their rectangle but were cleared by the vertex shader.
+        keep = tiles_touched[gauss_idx] > 0
+        gauss_idx, tile_x, tile_y = gauss_idx[keep], tile_x[keep], tile_y[keep]
+    else:
+        gauss_idx, tile_x, tile_y = expand_rect_tiles(rect_tile_space, tiles_touched)
+    entry = gauss_idx if splat_idx is None else splat_idx.long()[gauss_idx]
+    cam_tile_offset = (entry // n_points) * render_grid.grid_height * render_grid.grid_width
+    tile_id = cam_tile_offset + tile_y * render_grid.grid_width + tile_x
+
+    if depth_bits is not None:
+        depth_key = quantize_depth_torch(xyz_vs[:, 2].detach(), depth_range, depth_bits)
+        unsorted_keys = ((tile_id << depth_bits) | depth_key[gauss_idx]).to(torch.int32)
+        return unsorted_keys, gauss_idx.to(torch.int32)
+
+    depth_key = xyz_vs[:, 2].detach().contiguous().view(torch.int32).to(torch.int64)
+    unsorted_keys = (tile_id << 32) | depth_key[gauss_idx]
+    return unsorted_keys, gauss_idx.to(torch.int32)
+
+
+def compute_tile_ranges_torch(sorted_keys, n_cameras, render_grid, workspace=None, depth_bits=None):
+    """Vectorized equivalent of the compute_tile_ranges kernels, empty tiles get [0, 0]."""
+    n_tiles = n_cameras * render_grid.grid_height * render_grid.grid_width
+    tile_counts = torch.bincount(key_tile_ids(sorted_keys, depth_bits), minlength=n_tiles)
+    tile_ends = torch.cumsum(tile_counts, dim=0)
+    tile_ranges = allocate_buffer(workspace, "tile_ranges", (n_tiles, 2), torch.int32, sorted_keys.device, zero=False)
+    tile_ranges[:, 0] = torch.where(tile_counts > 0, tile_ends - tile_counts, 0)
+    tile_ranges[:, 1] = torch.where(tile_counts > 0, tile_ends, 0)
+    return tile_ranges
+
+
+def vertex_and_tile_shader_torch(xyz_ws,
+                                 rotations,
+                                 scales,
+                                 sh_coeffs,
+                                 active_sh,
+                                 world_view_transform,
+                                 proj_mat,
+                                 cam_pos,
+                                 fovy,
+                                 fovx,
+                                 render_grid,
+                                 workspace=None,
+                                 depth_bits=None,
+                                 opacity=None,
+                                 tight_tile_bounds=False,
+                                 splat_idx=None,
+                                 sparse_grad=False,
+                                 balanced_keys=False,
+                                 inference=False,
+                                 temporal_sort=None,
+                                 splat_dtype=torch.float,
+                                 tile_mask=None,
+                                 recompute_vertex=None,
+                                 vertex_outputs=None):
+    """
+    PyTorch equivalent of tile_shader_slang.vertex_and_tile_shader.
+
+    Takes the same arguments and returns the same
+    (sorted_gauss_idx, tile_ranges, radii, xyz_vs, inv_cov_vs, rgb, n_keys_saved) tuple.
+    With splat_idx the vertex shader still runs over every pair and its outputs are
+    compacted afterwards, autograd scatters their gradients back. sparse_grad is
+    accepted for parity, the SparseRowGrad nodes of the render function turn the
+    dense autograd gradients into sparse ones. So is inference, the reference
+    runs outside of autograd whenever it is called under torch.no_grad.
+    recompute_vertex checkpoints the vertex shader, autograd then runs it again
+    in the backward pass instead of keeping its intermediate tensors. The
+    vertex_outputs of an earlier run are already compacted.
+    """
+    n_points = xyz_ws.shape[0]
+    n_cameras = world_view_transform.shape[0]
+    assert opacity is not None or not tight_tile_bounds, "tight_tile_bounds needs the opacities."
+    assert temporal_sort is None or (depth_bits is None and not tight_tile_bounds and tile_mask is None), (
+        "temporal_sort needs the exact depth keys and the full tile rectangles.")
+    if tight_tile_bounds:
+        opacity = opacity.detach()
+    with profile_stage("vertex_shader", xyz_ws.device):
+        vertex_args = (xyz_ws, rotations, scales, sh_coeffs, active_sh, world_view_transform, proj_mat, cam_pos,
+                       fovy, fovx, render_grid, opacity, tight_tile_bounds, splat_dtype)
+        if vertex_outputs is not None:
+            tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = vertex_outputs
+        elif recompute_vertex is not None and torch.is_grad_enabled():
+            tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = torch.utils.checkpoint.checkpoint(
+                vertex_shader_torch, *vertex_args, use_reentrant=False)
+        else:
+            tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = vertex_shader_torch(*vertex_args)
+        if splat_idx is not None and vertex_outputs is None:
+            entries = splat_idx.long()
+            tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb = (
+                t[entries] for t in (tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb))
+        record_allocation(sum(t.nbytes for t in (tiles_touched, rect_tile_space, radii, xyz_vs, inv_cov_vs, rgb)))
+
+    with torch.no_grad():
+        with profile_stage("generate_keys", xyz_ws.device):
+            n_tiles = n_cameras * render_grid.grid_height * render_grid.grid_width
+            compact_keys, end_bit = depth_key_layout(n_tiles, depth_bits)
+            overlap_args = dict(inv_cov_vs=inv_cov_vs.float(), opacity=opacity, tight_tile_bounds=tight_tile_bounds,
+                                splat_idx=splat_idx, balanced_keys=balanced_keys)
+            if compact_keys:
+                unsorted_keys, unsorted_gauss_idx = generate_keys_torch(xyz_vs, rect_tile_space, tiles_touched,
+                                                                        n_points, render_grid,
+                                                                        visible_depth_range(xyz_vs, radii), depth_bits,
+                                                                        **overlap_args)
+            else:
+                unsorted_keys, unsorted_gauss_idx = generate_keys_torch(xyz_vs, rect_tile_space, tiles_touched,
+                                                                        n_points, render_grid, **overlap_args)
+            n_keys_saved = None
+            if tight_tile_bounds:
+                rect_areas = ((rect_tile_space[:, 2] - rect_tile_space[:, 0]) *
+                              (rect_tile_space[:, 3] - rect_tile_space[:, 1]))
+                n_keys_saved = rect_areas.sum() - unsorted_keys.shape[0]
+            if tile_mask is not None:
+                unsorted_keys, unsorted_gauss_idx, radii = select_roi_keys(unsorted_keys, unsorted_gauss_idx, radii,
+                                                                           tile_mask,
+                                                                           depth_bits if compact_keys else None)
+            record_allocation(unsorted_keys.nbytes + unsorted_gauss_idx.nbytes)
+        with profile_stage("sort_by_keys", xyz_ws.device):
+            if temporal_sort is not None:
+                sorted_keys, sorted_gauss_idx = temporal_sort.sort(unsorted_keys, unsorted_gauss_idx, xyz_vs,
+                                                                   rect_tile_space, tiles_touched, n_cameras * n_points,
+                                                                   n_tiles, end_bit, splat_idx)
+                record_temporal_sort_counters(temporal_sort.last_stats)
+            else:
+                sorted_keys, sorted_gauss_idx = sort_by_keys_torch(unsorted_keys, unsorted_gauss_idx)
+            record_allocation(sorted_keys.nbytes + sorted_gauss_idx.nbytes)
+        with profile_stage("compute_tile_ranges", xyz_ws.device):
+            tile_ranges = compute_tile_ranges_torch(sorted_keys, n_cameras, render_grid, workspace,
+                                                    depth_bits if compact_keys else None)
+
+    return sorted_gauss_idx, tile_ranges, radii, xyz_vs, inv_cov_vs, rgb, n_keys_saved
+
+
+def depth_key_accuracy_report(xyz_vs, rect_tile_space, tiles_touched, radii, n_points, render_grid, depth_bits):
+    """Compares the per-tile order of quantized depth keys against the exact float keys.
+
+    Takes the vertex shader outputs of a frame (from either backend) and sorts
+    its keys both ways with the reference implementation.
+
+    Returns:
+      A dict with the key layout that depth_bits leads to, the number of keys
+      and tiles, how many keys land at a different position of the sorted
+      order (n_reordered_keys) and in how many tiles, how many neighbours in
+      the exact order collapse onto the same quantized depth
+      (n_depth_collisions), and the size of one quantization step.
+    """
+    with torch.no_grad():
+        n_cameras = xyz_vs.shape[0] // n_points
+        n_tiles = n_cameras * render_grid.grid_height * render_grid.grid_width
+        compact_keys, end_bit = depth_key_layout(n_tiles, depth_bits)
+        depth_range = visible_depth_range(xyz_vs, radii)
+
+        exact_keys, gauss_idx = generate_keys_torch(xyz_vs, rect_tile_space, tiles_touched, n_points, render_grid)
+        exact_keys, exact_idx = sort_by_keys_torch(exact_keys, gauss_idx)
+        if compact_keys:
+            quantized_keys, gauss_idx = generate_keys_torch(xyz_vs, rect_tile_space, tiles_touched, n_points,
+                                                            render_grid, depth_range, depth_bits)
+            _, quantized_idx = sort_by_keys_torch(quantized_keys, gauss_idx)
+        else:
+            # The tile ids leave no room for the quantized depth, the renderer keeps the exact keys.
+            quantized_idx = exact_idx
+
+        tile_ids = key_tile_ids(exact_keys)
+        reordered = exact_idx != quantized_idx
+        exact_depth = xyz_vs[exact_idx.long(), 2]
+        quantized_depth = quantize_depth_torch(exact_depth, depth_range, depth_bits)
+        collisions = ((tile_ids[1:] == tile_ids[:-1]) &
+                      (quantized_depth[1:] == quantized_depth[:-1]) &
+                      (exact_depth[1:] != exact_depth[:-1]))
+
+        n_keys = exact_keys.shape[0]
+        return {'depth_bits': depth_bits,
+                'compact_keys': compact_keys,
+                'end_bit': end_bit,
+                'key_bytes': 4 if compact_keys else 8,
+                'n_keys': n_keys,
+                'n_tiles': int(torch.unique(tile_ids).shape[0]),
+                'n_reordered_keys': int(reordered.sum()),
+                'reordered_fraction': float(reordered.sum()) / max(n_keys, 1),
+                'n_reordered_tiles': int(torch.unique(tile_ids[reordered]).shape[0]),
+                'n_depth_collisions': int(collisions.sum()),
+                'depth_step': float((depth_range[1] - depth_range[0]) / (1 << depth_bits))}
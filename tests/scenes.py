@@ -0,0 +1,100 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Small deterministic scenes and cameras shared by the tests.
+
+The tests run the PyTorch reference on the CPU, the ones that need the Slang
+kernels are skipped without CUDA. The scenes are drawn from a seeded CPU
+generator and moved to the device afterwards, so every backend renders the
+same scene.
+"""
+
+import math
+import pytest
+import torch
+
+HEIGHT = 32
+WIDTH = 48
+N_POINTS = 300
+
+requires_cuda = pytest.mark.skipif(not torch.cuda.is_available(), reason="needs the Slang kernels on CUDA")
+
+
+def make_scene(device="cpu", n_points=N_POINTS, seed=0, scale=0.05):
+    """Returns N Gaussians in the cube [-1, 1]^3 whose tensors require gradients, as a dict.
+
+    The scales are log-normal around scale, the opacities uniform in [0, 1]
+    and all 16 spherical harmonics coefficients are set.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    scene = {'xyz_ws': torch.rand(n_points, 3, generator=generator) * 2 - 1,
+             'rotations': torch.nn.functional.normalize(torch.randn(n_points, 4, generator=generator), dim=1),
+             'scales': torch.exp(torch.randn(n_points, 3, generator=generator) * 0.5) * scale,
+             'opacity': torch.rand(n_points, 1, generator=generator),
+             'sh_coeffs': torch.randn(n_points, 16, 3, generator=generator) * 0.2}
+    return {name: tensor.to(device).requires_grad_(True) for name, tensor in scene.items()}
+
+
+def make_camera(device="cpu", angle=0.3, distance=3.0, fovx=1.0):
+    """Returns (world_view_transform, proj_mat, cam_pos, fovy, fovx) of a camera on a circle looking at the origin.
+
+    The camera axes are x right, y down and z forward, the projection follows the Inria code base.
+    """
+    fovy = 2 * math.atan(math.tan(fovx / 2) * HEIGHT / WIDTH)
+    cam_pos = torch.tensor([distance * math.sin(angle), 0.0, -distance * math.cos(angle)])
+    forward = -cam_pos / cam_pos.norm()
+    right = torch.linalg.cross(torch.tensor([0.0, 1.0, 0.0]), forward)
+    right = right / right.norm()
+    down = torch.linalg.cross(forward, right)
+    world_view_transform = torch.eye(4)
+    world_view_transform[:3, :3] = torch.stack([right, down, forward])
+    world_view_transform[:3, 3] = -world_view_transform[:3, :3] @ cam_pos
+    znear, zfar = 0.01, 100.0
+    proj_mat = torch.zeros(4, 4)
+    proj_mat[0, 0] = 1 / math.tan(fovx / 2)
+    proj_mat[1, 1] = 1 / math.tan(fovy / 2)
+    proj_mat[2, 2] = zfar / (zfar - znear)
+    proj_mat[2, 3] = -(zfar * znear) / (zfar - znear)
+    proj_mat[3, 2] = 1.0
+    return world_view_transform.to(device), proj_mat.to(device), cam_pos.to(device), fovy, fovx
+
+
+def make_gsplat_camera(device="cpu", angle=0.3):
+    """Returns the [4, 4] viewmat and the [3, 3] intrinsics K of make_camera, for the gsplat wrapper."""
+    world_view_transform, _, _, fovy, fovx = make_camera(device, angle)
+    K = torch.tensor([[WIDTH / (2 * math.tan(fovx / 2)), 0.0, WIDTH / 2],
+                      [0.0, HEIGHT / (2 * math.tan(fovy / 2)), HEIGHT / 2],
+                      [0.0, 0.0, 1.0]], device=device)
+    return world_view_transform, K
+
+
+def render(scene, camera, **kwargs):
+    from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_raw
+    return render_alpha_blend_tiles_slang_raw(scene['xyz_ws'], scene['rotations'], scene['scales'],
+                                              scene['opacity'], scene['sh_coeffs'], 3, *camera, HEIGHT, WIDTH,
+                                              **kwargs)
+
+
+def loss_weights(image):
+    """Returns the fixed per-pixel weights of the loss the tests backpropagate."""
+    return torch.linspace(0.5, 1.5, image.numel(), device=image.device).view_as(image)
+
+
+def gradients(scene, render_pkg):
+    """Backpropagates a fixed loss of the image and returns the gradients of the scene, clearing them."""
+    image = render_pkg['render']
+    (image * loss_weights(image)).sum().backward()
+    grads = {name: tensor.grad.clone() for name, tensor in scene.items()}
+    for tensor in scene.values():
+        tensor.grad = None
+    return grads
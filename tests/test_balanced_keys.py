@@ -0,0 +1,58 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+from scenes import HEIGHT, N_POINTS, WIDTH, make_camera, make_scene, render
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.sort_by_keys.sort_by_keys_torch import sort_by_keys_torch
+from slang_gaussian_rasterization.internal.tile_shader_torch import (frustum_cull_torch, generate_keys_torch,
+                                                                     vertex_shader_torch)
+
+
+@pytest.mark.parametrize("tight_tile_bounds", [False, True])
+@pytest.mark.parametrize("culled", [False, True])
+def test_balanced_keys_sort_like_the_per_splat_keys(tight_tile_bounds, culled):
+    # Splats close to the camera cover many tiles.
+    scene = {name: tensor.detach() for name, tensor in make_scene(scale=0.1).items()}
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = make_camera(distance=1.2)
+    world_view_transform, proj_mat, cam_pos = world_view_transform[None], proj_mat[None], cam_pos[None]
+    fovy, fovx = torch.tensor([fovy]), torch.tensor([fovx])
+    render_grid = RenderGrid(HEIGHT, WIDTH, tile_height=8, tile_width=8)
+    vertex_outputs = vertex_shader_torch(scene['xyz_ws'], scene['rotations'], scene['scales'], scene['sh_coeffs'], 3,
+                                         world_view_transform, proj_mat, cam_pos, fovy, fovx, render_grid,
+                                         scene['opacity'], tight_tile_bounds)
+    splat_idx = None
+    if culled:
+        splat_idx = frustum_cull_torch(scene['xyz_ws'], scene['rotations'], scene['scales'], scene['opacity'],
+                                       world_view_transform, proj_mat, cam_pos, fovy, fovx, render_grid)
+        assert splat_idx.shape[0] < N_POINTS
+        vertex_outputs = tuple(t[splat_idx.long()] for t in vertex_outputs)
+    tiles_touched, rect_tile_space, _, xyz_vs, inv_cov_vs, _ = vertex_outputs
+    assert tiles_touched.max() > 4
+
+    sorted_keys = {}
+    for balanced_keys in (False, True):
+        keys, gauss_idx = generate_keys_torch(xyz_vs, rect_tile_space, tiles_touched, N_POINTS, render_grid,
+                                              inv_cov_vs=inv_cov_vs, opacity=scene['opacity'],
+                                              tight_tile_bounds=tight_tile_bounds, splat_idx=splat_idx,
+                                              balanced_keys=balanced_keys)
+        sorted_keys[balanced_keys] = sort_by_keys_torch(keys, gauss_idx)
+    assert torch.equal(sorted_keys[True][0], sorted_keys[False][0])
+    assert torch.equal(sorted_keys[True][1], sorted_keys[False][1])
+
+
+def test_balanced_keys_render_the_same_image(scene, camera):
+    reference = render(scene, camera)['render']
+    assert torch.equal(render(scene, camera, balanced_keys=True)['render'], reference)
@@ -0,0 +1,35 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import gradients, make_camera, render
+
+
+def test_batch_matches_single_cameras(scene):
+    cameras = [make_camera(angle=angle) for angle in (0.3, -0.5)]
+    batch = tuple(torch.stack([camera[i] for camera in cameras]) for i in range(3)) + (
+        torch.tensor([camera[3] for camera in cameras]), torch.tensor([camera[4] for camera in cameras]))
+    batch_pkg = render(scene, batch)
+    assert batch_pkg['render'].shape[0] == 2
+    batch_grads = gradients(scene, {'render': batch_pkg['render'].sum(dim=0)})
+
+    grads = None
+    for c, camera in enumerate(cameras):
+        render_pkg = render(scene, camera)
+        torch.testing.assert_close(batch_pkg['render'][c], render_pkg['render'])
+        assert torch.equal(batch_pkg['radii'][c], render_pkg['radii'])
+        camera_grads = gradients(scene, render_pkg)
+        grads = camera_grads if grads is None else {name: grads[name] + camera_grads[name] for name in grads}
+    for name in grads:
+        torch.testing.assert_close(batch_grads[name], grads[name], atol=1e-5, rtol=1e-4)
@@ -0,0 +1,60 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+from scenes import HEIGHT, N_POINTS, WIDTH, make_camera, make_scene, render
+from slang_gaussian_rasterization.internal.chunked_scene import ChunkedScene, write_chunked_scene
+
+CHUNK_SIZE = 16
+NAMES = ['xyz_ws', 'rotations', 'scales', 'opacity', 'sh_coeffs']
+
+
+def _write(tmp_path, scene, quantize=None):
+    path = str(tmp_path / "scene.gsc")
+    write_chunked_scene(path, *(scene[name] for name in NAMES), chunk_size=CHUNK_SIZE, quantize=quantize)
+    return ChunkedScene(path, device="cpu")
+
+
+@pytest.mark.parametrize("quantize, atol", [(None, 1e-6), ("float16", 1e-3), ("uint8", 1e-2)])
+def test_round_trip(tmp_path, quantize, atol):
+    scene = {name: tensor.detach() for name, tensor in make_scene().items()}
+    chunked = _write(tmp_path, scene, quantize)
+    assert chunked.n_points == N_POINTS and chunked.n_chunks == -(-N_POINTS // CHUNK_SIZE)
+    loaded = [torch.cat(tensors) for tensors in zip(*(chunked.load_chunk(chunk) for chunk in range(chunked.n_chunks)))]
+    # The file holds the Gaussians in Morton order, find the row of every one of them by its mean.
+    order = torch.cdist(loaded[0], scene['xyz_ws']).argmin(dim=1)
+    assert torch.equal(torch.sort(order).values, torch.arange(N_POINTS))
+    for name, tensor in zip(NAMES, loaded):
+        torch.testing.assert_close(tensor.float(), scene[name][order], atol=atol, rtol=0.0)
+
+
+def test_streaming_render_matches_direct_render(tmp_path):
+    scene = {name: tensor.detach() for name, tensor in make_scene().items()}
+    # Stretched along x, the scene is wider than the view and the camera does not see every chunk.
+    scene['xyz_ws'] = scene['xyz_ws'] * torch.tensor([8.0, 1.0, 1.0])
+    chunked = _write(tmp_path, scene)
+    camera = make_camera()
+    reference = render(scene, camera)
+    render_pkg = chunked.render(*camera, HEIGHT, WIDTH)
+    stats = render_pkg['stream_stats']
+    assert 0 < stats['n_visible_chunks'] < chunked.n_chunks
+    assert stats['n_chunk_loads'] == stats['n_visible_chunks']
+    torch.testing.assert_close(render_pkg['render'], reference['render'], atol=1e-6, rtol=0.0)
+    # The Gaussians that reach the image are all streamed, with the radii of the direct render.
+    rows = torch.cdist(chunked.arrays['xyz_ws'][render_pkg['gaussian_ids']], scene['xyz_ws']).argmin(dim=1)
+    radii = torch.zeros_like(reference['radii']).index_copy_(0, rows, render_pkg['radii'])
+    assert torch.equal(radii, reference['radii'])
+
+    assert chunked.render(*camera, HEIGHT, WIDTH)['stream_stats']['n_chunk_loads'] == 0
@@ -0,0 +1,42 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import pytest
+import torch
+from scenes import HEIGHT, WIDTH, make_camera, make_scene, render, requires_cuda
+from slang_gaussian_rasterization.internal.depth_keys import depth_key_layout
+
+DEPTH_BITS = 20
+
+
+def test_depth_bits_use_compact_keys():
+    n_tiles = math.ceil(HEIGHT / 16) * math.ceil(WIDTH / 16)
+    assert depth_key_layout(n_tiles, DEPTH_BITS)[0]
+
+
+def test_compact_keys_match_exact_keys(scene, camera):
+    exact = render(scene, camera)['render']
+    compact = render(scene, camera, depth_bits=DEPTH_BITS)['render']
+    torch.testing.assert_close(compact, exact, atol=1e-3, rtol=0.0)
+
+
+@requires_cuda
+@pytest.mark.parametrize("tight_tile_bounds", [False, True])
+def test_compact_keys_slang(tight_tile_bounds):
+    # depth_bits launches generate_compact_keys.
+    reference = render(make_scene(), make_camera(), tight_tile_bounds=tight_tile_bounds)['render']
+    image = render(make_scene("cuda"), make_camera("cuda"), depth_bits=DEPTH_BITS,
+                   tight_tile_bounds=tight_tile_bounds)['render']
+    torch.testing.assert_close(image.cpu(), reference, atol=1e-3, rtol=0.0)
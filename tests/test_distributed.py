@@ -0,0 +1,110 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Renders with several gloo processes on the CPU and compares against a single-process render."""
+
+import os
+import socket
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from scenes import HEIGHT, WIDTH, gradients, loss_weights, make_camera, make_gsplat_camera, make_scene, render
+from slang_gaussian_rasterization.internal.distributed import render_alpha_blend_tiles_distributed
+
+WORLD_SIZE = 2
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _shard(scene, rank):
+    return {name: tensor.detach()[rank::WORLD_SIZE].clone().requires_grad_(True) for name, tensor in scene.items()}
+
+
+def _render_shard(shard, camera, **kwargs):
+    return render_alpha_blend_tiles_distributed(shard['xyz_ws'], shard['rotations'], shard['scales'],
+                                                shard['opacity'], shard['sh_coeffs'], 3, *camera, HEIGHT, WIDTH,
+                                                **kwargs)
+
+
+def _batched(cameras):
+    return tuple(torch.stack([torch.as_tensor(c[i], dtype=torch.float) for c in cameras]) for i in range(5))
+
+
+def _worker(rank, port, balance, local_cameras):
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    dist.init_process_group("gloo", rank=rank, world_size=WORLD_SIZE)
+    try:
+        scene = make_scene()
+        shard = _shard(scene, rank)
+        if local_cameras:
+            # Every rank renders its own camera, the reference renders all of them with the sum of the losses.
+            cameras = _batched([make_camera(angle=0.3 * (r + 1)) for r in range(WORLD_SIZE)])
+            reference = render(scene, cameras)
+            render_pkg = _render_shard(shard, tuple(c[rank:rank + 1] for c in cameras), balance=balance,
+                                       local_cameras=True)
+            own = slice(rank, rank + 1)
+        else:
+            camera = make_camera()
+            reference = render(scene, camera)
+            render_pkg = _render_shard(shard, camera, balance=balance)
+            own = slice(None)
+        weights = loss_weights(reference['render'])[own]
+        expected = reference['render'].detach()[own]
+        reference_grads = gradients(scene, reference)
+
+        torch.testing.assert_close(render_pkg['render'].detach(), expected, atol=1e-5, rtol=0.0)
+        (render_pkg['render'] * weights).sum().backward()
+        for name, tensor in shard.items():
+            torch.testing.assert_close(tensor.grad, reference_grads[name][rank::WORLD_SIZE], atol=1e-5, rtol=1e-4)
+    finally:
+        dist.destroy_process_group()
+
+
+def _gsplat_worker(rank, port):
+    from slang_gaussian_rasterization.api.gsplat_3dgs import rasterization
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    dist.init_process_group("gloo", rank=rank, world_size=WORLD_SIZE)
+    try:
+        # Like the gsplat trainer, every rank has its own cameras and gets back only their images.
+        world_view_transform, K = make_gsplat_camera(angle=0.3 * (rank + 1))
+        scene = {name: tensor.detach() for name, tensor in make_scene().items()}
+        shard = _shard(scene, rank)
+
+        def rasterize(gaussians, distributed):
+            return rasterization(gaussians['xyz_ws'], gaussians['rotations'], gaussians['scales'],
+                                 gaussians['opacity'][:, 0], gaussians['sh_coeffs'], world_view_transform[None],
+                                 K[None], WIDTH, HEIGHT, sh_degree=3, packed=False, distributed=distributed)[0]
+
+        torch.testing.assert_close(rasterize(shard, True), rasterize(scene, False).detach(), atol=1e-5, rtol=0.0)
+    finally:
+        dist.destroy_process_group()
+
+
+@pytest.mark.parametrize("balance", ["keys", "rows"])
+def test_distributed_matches_single_process(balance):
+    mp.spawn(_worker, args=(_free_port(), balance, False), nprocs=WORLD_SIZE, join=True)
+
+
+def test_distributed_local_cameras():
+    mp.spawn(_worker, args=(_free_port(), "keys", True), nprocs=WORLD_SIZE, join=True)
+
+
+def test_gsplat_distributed_cameras_per_rank():
+    mp.spawn(_gsplat_worker, args=(_free_port(),), nprocs=WORLD_SIZE, join=True)
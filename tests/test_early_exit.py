@@ -0,0 +1,45 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import HEIGHT, WIDTH, loss_weights
+from slang_gaussian_rasterization.internal.alphablend_tiled_torch import alpha_blend_torch, bwd_alpha_blend_torch
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.tile_shader_torch import vertex_and_tile_shader_torch
+
+
+def test_early_exit_gradients_match_full_walk(scene, camera):
+    # Large, nearly opaque splats saturate the pixels long before the end of the tile lists.
+    with torch.no_grad():
+        scene['scales'].mul_(4.0)
+        scene['opacity'].fill_(0.99)
+    render_grid = RenderGrid(HEIGHT, WIDTH, tile_height=16, tile_width=16)
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = camera
+    with torch.no_grad():
+        sorted_gauss_idx, tile_ranges, _, xyz_vs, inv_cov_vs, rgb, _ = vertex_and_tile_shader_torch(
+            scene['xyz_ws'], scene['rotations'], scene['scales'], scene['sh_coeffs'], 3,
+            world_view_transform[None], proj_mat[None], cam_pos[None], torch.tensor([fovy]), torch.tensor([fovx]),
+            render_grid)
+        opacity = scene['opacity'].detach()
+        output_img, n_contributors, tile_n_contributors = alpha_blend_torch(sorted_gauss_idx, tile_ranges, xyz_vs,
+                                                                            inv_cov_vs, opacity, rgb, render_grid)
+    tile_length = (tile_ranges[:, 1] - tile_ranges[:, 0]).to(torch.int32)
+    assert (tile_n_contributors < tile_length).any()
+
+    args = (sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, opacity, rgb, output_img, n_contributors,
+            loss_weights(output_img), render_grid)
+    full = bwd_alpha_blend_torch(*args)
+    early_exit = bwd_alpha_blend_torch(*args, tile_n_contributors=tile_n_contributors)
+    for grad, reference in zip(early_exit, full):
+        assert torch.equal(grad, reference)
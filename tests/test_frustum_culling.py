@@ -0,0 +1,30 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import N_POINTS, gradients, make_camera, render
+
+
+def test_frustum_culling_matches_full_render(scene):
+    # A camera close to the scene sees only part of it.
+    camera = make_camera(distance=1.2)
+    full_pkg = render(scene, camera)
+    full = gradients(scene, full_pkg)
+    culled_pkg = render(scene, camera, frustum_culling=True)
+    culled = gradients(scene, culled_pkg)
+    assert full_pkg['visibility_filter'].sum() < N_POINTS
+    torch.testing.assert_close(culled_pkg['render'], full_pkg['render'], atol=1e-6, rtol=0.0)
+    assert torch.equal(culled_pkg['radii'], full_pkg['radii'])
+    for name in full:
+        torch.testing.assert_close(culled[name], full[name], atol=1e-5, rtol=1e-4)
@@ -0,0 +1,59 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+from scenes import gradients, make_camera, make_scene, render, requires_cuda
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import GRAD_REDUCTION_MODES
+
+
+def _assert_equal(grads, reference):
+    for name in reference:
+        assert torch.equal(grads[name], reference[name]), name
+
+
+def test_deterministic_gradients_are_reproducible(scene, camera):
+    reference = gradients(scene, render(scene, camera, grad_reduction="deterministic"))
+    for _ in range(3):
+        _assert_equal(gradients(scene, render(scene, camera, grad_reduction="deterministic")), reference)
+
+
+@pytest.mark.parametrize("grad_reduction", list(GRAD_REDUCTION_MODES))
+def test_reference_modes_agree(scene, camera, grad_reduction):
+    # The CPU reference accumulates in a fixed order in every mode.
+    reference = gradients(scene, render(scene, camera, grad_reduction="deterministic"))
+    _assert_equal(gradients(scene, render(scene, camera, grad_reduction=grad_reduction)), reference)
+
+
+def test_deterministic_algorithms_select_deterministic_mode(scene, camera):
+    reference = gradients(scene, render(scene, camera, grad_reduction="deterministic"))
+    deterministic = torch.are_deterministic_algorithms_enabled()
+    torch.use_deterministic_algorithms(True)
+    try:
+        _assert_equal(gradients(scene, render(scene, camera)), reference)
+    finally:
+        torch.use_deterministic_algorithms(deterministic)
+
+
+def test_unknown_grad_reduction(scene, camera):
+    with pytest.raises(AssertionError):
+        render(scene, camera, grad_reduction="sorted")
+
+
+@requires_cuda
+def test_deterministic_gradients_are_reproducible_slang():
+    scene, camera = make_scene("cuda", n_points=3000), make_camera("cuda")
+    reference = gradients(scene, render(scene, camera, grad_reduction="deterministic"))
+    for _ in range(3):
+        _assert_equal(gradients(scene, render(scene, camera, grad_reduction="deterministic")), reference)
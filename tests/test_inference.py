@@ -0,0 +1,35 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+from scenes import HEIGHT, WIDTH, render
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import render_alpha_blend_tiles_slang_inference
+
+
+@pytest.mark.parametrize("kwargs", [{}, {'frustum_culling': True, 'tight_tile_bounds': True}, {'depth_bits': 20},
+                                    {'render_depth': True, 'background': [0.2, 0.4, 0.6]}],
+                         ids=["default", "culled_tight", "depth_bits", "depth_background"])
+def test_inference_matches_raw(scene, camera, kwargs):
+    reference = render(scene, camera, **kwargs)
+    with torch.no_grad():
+        render_pkg = render_alpha_blend_tiles_slang_inference(scene['xyz_ws'], scene['rotations'], scene['scales'],
+                                                              scene['opacity'], scene['sh_coeffs'], 3, *camera,
+                                                              HEIGHT, WIDTH, **kwargs)
+    assert 'viewspace_points' not in render_pkg
+    for name, value in render_pkg.items():
+        if isinstance(value, torch.Tensor):
+            assert torch.equal(value, reference[name].detach()), name
+        else:
+            assert value == reference[name], name
@@ -0,0 +1,68 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import HEIGHT, WIDTH, make_camera, make_scene, render
+from slang_gaussian_rasterization.internal.lod import LODHierarchy, merge_gaussians
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.tile_shader_torch import (EPS, frustum_cull_torch,
+                                                                     get_covariance_from_quat_scales)
+
+NAMES = ['xyz_ws', 'rotations', 'scales', 'opacity', 'sh_coeffs']
+
+
+def test_merge_gaussians_matches_the_moments():
+    scene = {name: tensor.detach().double() for name, tensor in make_scene(n_points=60, scale=0.2).items()}
+    n_groups = 5
+    index = torch.arange(60) % n_groups
+    merged = merge_gaussians(index, n_groups, *(scene[name] for name in NAMES))
+    scales = scene['scales']
+    weight = scene['opacity'][:, 0] * (scales[:, 0] * scales[:, 1] + scales[:, 1] * scales[:, 2] +
+                                       scales[:, 0] * scales[:, 2]) + EPS
+    cov = get_covariance_from_quat_scales(scene['rotations'], scales)
+    for group in range(n_groups):
+        w = weight[index == group] / weight[index == group].sum()
+        xyz = scene['xyz_ws'][index == group]
+        mean = (w[:, None] * xyz).sum(dim=0)
+        offset = xyz - mean
+        expected_cov = (w[:, None, None] * (cov[index == group] + offset[:, :, None] * offset[:, None, :])).sum(dim=0)
+        torch.testing.assert_close(merged[0][group], mean)
+        merged_cov = get_covariance_from_quat_scales(merged[1][group:group + 1], merged[2][group:group + 1])[0]
+        torch.testing.assert_close(merged_cov, expected_cov)
+        torch.testing.assert_close(merged[4][group], (w[:, None, None] * scene['sh_coeffs'][index == group]).sum(dim=0))
+    assert torch.allclose(merged[1].norm(dim=1), torch.ones(n_groups, dtype=torch.double))
+    assert ((merged[3] > 0) & (merged[3] < 1)).all()
+
+
+def test_cut_at_threshold_zero_keeps_every_visible_gaussian():
+    scene = {name: tensor.detach() for name, tensor in make_scene().items()}
+    # A camera close to the scene does not see every Gaussian.
+    camera = make_camera(distance=1.2)
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = camera
+    lod = LODHierarchy(*(scene[name] for name in NAMES), leaf_size=8)
+    assert lod.depth > 1
+    render_grid = RenderGrid(HEIGHT, WIDTH, tile_height=16, tile_width=16)
+    batch = (world_view_transform[None], proj_mat[None], torch.tensor([fovy]), torch.tensor([fovx]))
+    gaussians, lod_stats = lod.cut(*batch, render_grid, threshold=0.0)
+    assert lod_stats['level_counts'] == [0] * (lod.depth + 1)
+    assert lod_stats['n_leaf_gaussians'] == gaussians[0].shape[0]
+    visible = frustum_cull_torch(*(scene[name] for name in NAMES[:4]), world_view_transform[None], proj_mat[None],
+                                 cam_pos[None], *batch[2:], render_grid)
+    assert visible.shape[0] < scene['xyz_ws'].shape[0]
+    picked = (scene['xyz_ws'][:, None] == gaussians[0][None]).all(dim=2).any(dim=1)
+    assert picked[visible.long()].all()
+
+    reference = render(scene, camera)['render']
+    torch.testing.assert_close(lod.render(*camera, HEIGHT, WIDTH, threshold=0.0)['render'], reference,
+                               atol=1e-6, rtol=0.0)
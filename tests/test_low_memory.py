@@ -0,0 +1,47 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+from scenes import HEIGHT, WIDTH, gradients, make_camera, make_scene, render, requires_cuda
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.render_workspace import RenderWorkspace
+
+
+def _assert_bit_identical(scene, camera, **kwargs):
+    default_pkg = render(scene, camera, **kwargs)
+    default = gradients(scene, default_pkg)
+    low_memory_pkg = render(scene, camera, low_memory=True, **kwargs)
+    assert torch.equal(low_memory_pkg['render'], default_pkg['render'])
+    assert low_memory_pkg['n_bytes_recomputed'] > 0
+    low_memory = gradients(scene, low_memory_pkg)
+    for name in default:
+        assert torch.equal(low_memory[name], default[name]), name
+
+
+@pytest.mark.parametrize("kwargs", [{}, {'frustum_culling': True}, {'tight_tile_bounds': True}],
+                         ids=["default", "frustum_culling", "tight_tile_bounds"])
+def test_low_memory_gradients_are_bit_identical(scene, camera, kwargs):
+    _assert_bit_identical(scene, camera, **kwargs)
+
+
+def test_low_memory_rejects_workspace(scene, camera):
+    workspace = RenderWorkspace(RenderGrid(HEIGHT, WIDTH, tile_height=16, tile_width=16), device="cpu")
+    with pytest.raises(AssertionError):
+        render(scene, camera, low_memory=True, workspace=workspace)
+
+
+@requires_cuda
+def test_low_memory_gradients_are_bit_identical_slang():
+    _assert_bit_identical(make_scene("cuda"), make_camera("cuda"), grad_reduction="deterministic")
@@ -0,0 +1,43 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from scenes import N_POINTS, gradients, render
+from slang_gaussian_rasterization.internal.profiler import RenderProfiler, active_profiler
+
+
+def test_profiler_counters_on_cpu(scene, camera):
+    with RenderProfiler() as profiler:
+        render_pkg = render(scene, camera, frustum_culling=True)
+        gradients(scene, render_pkg)
+    summary = profiler.summary()
+    counters = summary['counters']
+    assert counters['n_splats'] == [N_POINTS]
+    assert counters['n_visible_splats'][0] == int(render_pkg['visibility_filter'].sum())
+    assert 0 < counters['n_visible_splats'][0] <= N_POINTS
+    assert counters['n_splats_after_culling'][0] + counters['n_culled_splats'][0] == N_POINTS
+    n_keys = counters['n_keys'][0]
+    assert n_keys > 0 and sum(counters['tile_list_length_histogram'][0].values()) > 0
+    assert counters['max_tile_list_length'][0] >= counters['mean_tile_list_length'][0]
+    assert 0 < counters['max_n_contributors'][0] <= n_keys
+    assert counters['n_bwd_rounds_skipped'][0] <= counters['n_bwd_rounds'][0]
+    assert {'splat_tiled', 'splat_tiled.bwd'} <= set(summary['stages'])
+    assert all('gpu_ms' not in stage for stage in summary['stages'].values())
+    json.dumps(profiler.chrome_trace())
+
+
+def test_profile_argument_returns_the_profiler(scene, camera):
+    render_pkg = render(scene, camera, profile=True)
+    assert active_profiler() is None
+    assert render_pkg['profiler'].summary()['counters']['n_keys']
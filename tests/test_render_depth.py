@@ -0,0 +1,107 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+from scenes import HEIGHT, WIDTH, make_camera, make_gsplat_camera, make_scene, render
+from slang_gaussian_rasterization.api.gsplat_3dgs import rasterization
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import blend_outputs
+from slang_gaussian_rasterization.internal.alphablend_tiled_torch import AlphaBlendTiledRenderTorch
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.tile_shader_torch import vertex_and_tile_shader_torch
+
+RENDER_GRID = RenderGrid(HEIGHT, WIDTH, tile_height=16, tile_width=16)
+
+
+def _blend_inputs(scene):
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = make_camera()
+    with torch.no_grad():
+        sorted_gauss_idx, tile_ranges, _, xyz_vs, inv_cov_vs, rgb, _ = vertex_and_tile_shader_torch(
+            scene['xyz_ws'], scene['rotations'], scene['scales'], scene['sh_coeffs'], 3,
+            world_view_transform[None], proj_mat[None], cam_pos[None], torch.tensor([fovy]), torch.tensor([fovx]),
+            RENDER_GRID)
+    return sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, rgb
+
+
+def test_blend_outputs():
+    generator = torch.Generator().manual_seed(0)
+    output_img = torch.rand(2 * HEIGHT, WIDTH, 4, generator=generator)
+    output_depth = torch.rand(2 * HEIGHT, WIDTH, generator=generator) * 3
+    background = torch.tensor([[0.2, 0.4, 0.6], [1.0, 0.0, 0.5]])
+    outputs = blend_outputs(output_img, output_depth, RENDER_GRID, background)
+    image = output_img.view(2, HEIGHT, WIDTH, 4).permute(0, 3, 1, 2)
+    alpha = 1.0 - image[:, 3:]
+    depth = output_depth.view(2, 1, HEIGHT, WIDTH)
+    assert torch.equal(outputs['render'], image[:, :3] + image[:, 3:] * background[:, :, None, None])
+    assert torch.equal(outputs['alpha'], alpha)
+    assert torch.equal(outputs['depth'], depth)
+    assert torch.equal(outputs['expected_depth'], depth / alpha)
+
+    roi = (5, 3, 21, 30)
+    cropped = blend_outputs(output_img, None, RENDER_GRID, roi=roi)
+    assert set(cropped) == {'render', 'alpha'}
+    assert torch.equal(cropped['render'], image[:, :3, 3:30, 5:21])
+    assert torch.equal(cropped['alpha'], alpha[:, :, 3:30, 5:21])
+
+
+def test_depth_is_blended_like_a_color():
+    scene = make_scene()
+    sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, rgb = _blend_inputs(scene)
+    opacity = scene['opacity'].detach()
+    output_img, output_depth = AlphaBlendTiledRenderTorch.apply(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs,
+                                                                opacity, rgb, RENDER_GRID, None, "atomic", None, True)
+    depth_as_color, no_depth = AlphaBlendTiledRenderTorch.apply(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs,
+                                                                opacity, xyz_vs[:, 2:3].expand(-1, 3),
+                                                                RENDER_GRID)
+    assert no_depth is None
+    assert output_depth.abs().sum() > 0
+    torch.testing.assert_close(output_depth, depth_as_color[..., 0], atol=1e-6, rtol=1e-6)
+
+
+def test_reference_depth_gradcheck():
+    scene = make_scene(n_points=12, scale=0.2)
+    sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, rgb = _blend_inputs(scene)
+    inputs = tuple(t.detach().double().requires_grad_(True)
+                   for t in (xyz_vs, inv_cov_vs, scene['opacity'].clamp(0.05, 0.9), rgb))
+
+    def depth(xyz_vs, inv_cov_vs, opacity, rgb):
+        return AlphaBlendTiledRenderTorch.apply(sorted_gauss_idx, tile_ranges, xyz_vs, inv_cov_vs, opacity, rgb,
+                                                RENDER_GRID, None, "atomic", None, True)[1]
+
+    assert torch.autograd.gradcheck(depth, inputs, eps=1e-6, atol=1e-5, rtol=1e-3, fast_mode=True)
+
+
+@pytest.mark.parametrize("render_mode", ["RGB", "D", "ED", "RGB+D", "RGB+ED"])
+def test_gsplat_render_modes(render_mode):
+    scene = {name: tensor.detach() for name, tensor in make_scene().items()}
+    reference = render(scene, make_camera(), render_depth=True)
+    world_view_transform, K = make_gsplat_camera()
+    channels = {"RGB": ["render"], "D": ["depth"], "ED": ["expected_depth"],
+                "RGB+D": ["render", "depth"], "RGB+ED": ["render", "expected_depth"]}[render_mode]
+    expected = torch.cat([reference[name] for name in channels], dim=0)[None].permute(0, 2, 3, 1)
+    expected_alpha = reference['alpha'][None].permute(0, 2, 3, 1)
+    background = torch.linspace(0.2, 0.8, expected.shape[-1])[None]
+
+    def rasterize(backgrounds=None):
+        return rasterization(scene['xyz_ws'], scene['rotations'], scene['scales'], scene['opacity'][:, 0],
+                             scene['sh_coeffs'], world_view_transform[None], K[None], WIDTH, HEIGHT, sh_degree=3,
+                             packed=False, backgrounds=backgrounds, render_mode=render_mode)[:2]
+
+    image, alpha = rasterize()
+    assert image.shape == expected.shape
+    torch.testing.assert_close(image, expected, atol=1e-4, rtol=1e-4)
+    torch.testing.assert_close(alpha, expected_alpha, atol=1e-5, rtol=0.0)
+    # Like gsplat, the background is composited over every channel, also the depths.
+    image_over_background, _ = rasterize(background)
+    torch.testing.assert_close(image_over_background, image + (1.0 - alpha) * background, atol=1e-6, rtol=0.0)
@@ -0,0 +1,78 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+from scenes import HEIGHT, WIDTH, render
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.render_workspace import RenderWorkspace
+
+
+def _workspace(**kwargs):
+    return RenderWorkspace(RenderGrid(HEIGHT, WIDTH, tile_height=16, tile_width=16), **kwargs)
+
+
+def test_frames_reuse_the_buffers(scene, camera):
+    reference = render(scene, camera)['render']
+    workspace = _workspace()
+    n_allocations = []
+    for _ in range(3):
+        image = render(scene, camera, workspace=workspace)['render']
+        assert torch.equal(image, reference)
+        n_allocations.append(workspace.n_allocations)
+    assert n_allocations[0] > 0 and n_allocations[1:] == n_allocations[:1] * 2
+    assert workspace.stats()['frame'] == 3
+
+
+def test_buffers_only_grow():
+    workspace = _workspace(device="cpu", growth_factor=1.5)
+    buf = workspace.buffer("keys", (8,), torch.int64)
+    assert torch.equal(workspace.buffer("keys", (4,), torch.int64), buf[:4])
+    assert workspace.n_allocations == 1
+    assert workspace.buffer("keys", (10,), torch.int64).shape == (10,)
+    assert workspace.n_allocations == 2 and workspace.allocated_bytes == 12 * 8
+    assert workspace.buffer("keys", (4, 3), torch.int64).shape == (4, 3)
+    assert workspace.n_allocations == 2
+
+
+def test_only_the_used_prefix_is_zeroed():
+    workspace = _workspace(device="cpu")
+    workspace.buffer("img", (6,), torch.float).fill_(1.0)
+    assert torch.equal(workspace.buffer("img", (4,), torch.float, zero=False), torch.ones(4))
+    assert torch.equal(workspace.buffer("img", (2, 2), torch.float), torch.zeros(2, 2))
+    assert torch.equal(workspace.buffer("img", (6,), torch.float, zero=False), torch.tensor([0., 0, 0, 0, 1, 1]))
+    assert workspace.bytes_zeroed == (6 + 4) * 4
+
+
+def test_unused_buffers_are_evicted_and_oversized_ones_shrunk():
+    workspace = _workspace(device="cpu", growth_factor=1.0, shrink_interval=2, shrink_ratio=2.0)
+    workspace.next_frame()
+    workspace.buffer("unused", (16,), torch.int32)
+    workspace.buffer("oversized", (100,), torch.int32)
+    for _ in range(2):
+        # The first window still saw both requests, the second one only small ones.
+        workspace.next_frame()
+        assert workspace.allocated_bytes == (16 + 100) * 4
+        workspace.buffer("oversized", (10,), torch.int32)
+    workspace.next_frame()
+    assert workspace.allocated_bytes == 10 * 4
+    assert workspace.n_allocations == 3
+
+
+def test_the_device_comes_from_the_buffer_request():
+    workspace = _workspace()
+    with pytest.raises(AssertionError):
+        workspace.buffer("img", (4,), torch.float)
+    assert workspace.buffer("img", (4,), torch.float, torch.device("cpu")).device.type == "cpu"
+    assert _workspace(device="cpu").buffer("img", (4,), torch.float).device.type == "cpu"
@@ -0,0 +1,63 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import types
+from slang_gaussian_rasterization.internal import shader_cache
+from slang_gaussian_rasterization.internal.alphablend_tiled_slang import GRAD_REDUCTION_MODES
+from slang_gaussian_rasterization.internal.slang import slang_modules
+
+
+def test_module_key_depends_on_the_arch(monkeypatch):
+    monkeypatch.setenv("TORCH_CUDA_ARCH_LIST", "8.0")
+    key_80, inputs = shader_cache.module_key("tile_shader", shader_cache.slang_sources())
+    assert inputs['arch'] == "8.0"
+    monkeypatch.setenv("TORCH_CUDA_ARCH_LIST", "8.9")
+    key_89, _ = shader_cache.module_key("tile_shader", shader_cache.slang_sources())
+    assert key_80 != key_89
+
+
+def test_load_slang_module_keeps_the_working_directory(monkeypatch, tmp_path):
+    calls = []
+
+    def load_module(file_name, defines):
+        calls.append((file_name, os.getcwd()))
+        return types.SimpleNamespace(file_name=file_name)
+
+    monkeypatch.setitem(sys.modules, "slangtorch", types.SimpleNamespace(loadModule=load_module))
+    monkeypatch.setenv(shader_cache.CACHE_DIR_ENV, str(tmp_path))
+    monkeypatch.setattr(shader_cache, "_loaded", {})
+    cwd = os.getcwd()
+    module = shader_cache.load_slang_module("tile_shader")
+    entry = shader_cache.find_entry(shader_cache.module_key("tile_shader", shader_cache.slang_sources())[0])
+    assert calls == [(os.path.join(entry, "tile_shader.slang"), cwd)]
+    assert os.path.isabs(module.file_name) and os.getcwd() == cwd
+    assert shader_cache.load_slang_module("tile_shader") is module
+
+
+def test_alpha_blend_shaders_compile_the_grad_reduction(monkeypatch):
+    loaded = []
+
+    def load_slang_module(name, defines):
+        loaded.append(defines)
+        return defines
+
+    monkeypatch.setattr(shader_cache, "load_slang_module", load_slang_module)
+    shaders = slang_modules.AlphaBlendShaders()
+    assert shaders[(8, 8)]["PYTHON_GRAD_REDUCTION"] == GRAD_REDUCTION_MODES["atomic"]
+    assert shaders[(8, 8, GRAD_REDUCTION_MODES["block"])]["PYTHON_GRAD_REDUCTION"] == GRAD_REDUCTION_MODES["block"]
+    assert shaders[(8, 8, 0)] is shaders[(8, 8)] and len(loaded) == 2
+    assert sorted(slang_modules.GRAD_REDUCTIONS) == sorted(GRAD_REDUCTION_MODES.values())
+    assert len(shader_cache.cached_modules()) == 2 + len(slang_modules.TILE_SIZES_HW) * len(GRAD_REDUCTION_MODES)
@@ -0,0 +1,55 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import HEIGHT, WIDTH, gradients, loss_weights, make_gsplat_camera, render
+from slang_gaussian_rasterization.api.gsplat_3dgs import rasterization
+
+
+def test_sparse_grad_of_leaves(scene, camera):
+    dense = gradients(scene, render(scene, camera))
+    sparse = gradients(scene, render(scene, camera, sparse_grad=True))
+    for name in dense:
+        assert sparse[name].is_sparse, name
+        torch.testing.assert_close(sparse[name].to_dense(), dense[name], atol=0.0, rtol=0.0)
+
+
+def test_gsplat_sparse_grad_through_activations(scene):
+    # The gsplat trainer activates its parameters, sigmoid and normalize have no sparse backward.
+    viewmat, K = make_gsplat_camera()
+    params = {'means': scene['xyz_ws'],
+              'quats': scene['rotations'],
+              'scales': scene['scales'].detach().log().requires_grad_(True),
+              'opacities': scene['opacity'].detach()[:, 0].logit().requires_grad_(True),
+              'colors': scene['sh_coeffs']}
+
+    def backward(sparse_grad):
+        image = rasterization(params['means'], torch.nn.functional.normalize(params['quats'], dim=-1),
+                              torch.exp(params['scales']), torch.sigmoid(params['opacities']), params['colors'],
+                              viewmat[None], K[None], WIDTH, HEIGHT, sh_degree=3, packed=False,
+                              sparse_grad=sparse_grad)[0]
+        (image * loss_weights(image)).sum().backward()
+        grads = {name: param.grad for name, param in params.items()}
+        for param in params.values():
+            param.grad = None
+        return grads
+
+    dense = backward(False)
+    sparse = backward(True)
+    for name in ('means', 'scales', 'colors'):
+        assert sparse[name].is_sparse, name
+    for name in ('quats', 'opacities'):
+        assert not sparse[name].is_sparse, name
+    for name in dense:
+        torch.testing.assert_close(sparse[name].to_dense(), dense[name], atol=1e-6, rtol=1e-5)
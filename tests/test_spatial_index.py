@@ -0,0 +1,54 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import HEIGHT, N_POINTS, WIDTH, make_camera, make_scene
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.spatial_index import GaussianOctree
+from slang_gaussian_rasterization.internal.tile_shader_torch import frustum_cull_torch
+
+
+def _cameras():
+    cameras = [make_camera(angle=angle, distance=distance) for angle, distance in ((0.3, 3.0), (2.0, 1.2))]
+    world_view_transform, proj_mat, cam_pos = (torch.stack(tensors) for tensors in list(zip(*cameras))[:3])
+    fovy = torch.tensor([camera[3] for camera in cameras])
+    fovx = torch.tensor([camera[4] for camera in cameras])
+    return world_view_transform, proj_mat, cam_pos, fovy, fovx
+
+
+def _assert_superset(octree, scene, cameras, render_grid):
+    world_view_transform, proj_mat, _, fovy, fovx = cameras
+    candidates = octree.query(world_view_transform, proj_mat, fovy, fovx, render_grid)
+    visible = frustum_cull_torch(scene['xyz_ws'], scene['rotations'], scene['scales'], scene['opacity'],
+                                 *cameras, render_grid)
+    assert 0 < visible.shape[0] < 2 * N_POINTS
+    assert torch.isin(visible, candidates).all()
+
+
+def test_query_is_a_superset_of_frustum_culling():
+    render_grid = RenderGrid(HEIGHT, WIDTH, tile_height=16, tile_width=16)
+    cameras = _cameras()
+    scene = {name: tensor.detach() for name, tensor in make_scene(n_points=N_POINTS, scale=0.2).items()}
+    # Quaternions that are not normalized stretch the splats.
+    scene['rotations'] = scene['rotations'] * 1.5
+    octree = GaussianOctree(scene['xyz_ws'], scene['rotations'], scene['scales'], leaf_size=4)
+    assert octree.depth > 1
+    _assert_superset(octree, scene, cameras, render_grid)
+
+    generator = torch.Generator().manual_seed(1)
+    scene['xyz_ws'] = scene['xyz_ws'] + torch.randn(N_POINTS, 3, generator=generator) * 0.3
+    scene['scales'] = scene['scales'] * torch.exp(torch.randn(N_POINTS, 3, generator=generator))
+    scene['rotations'] = scene['rotations'] * torch.rand(N_POINTS, 1, generator=generator) * 2
+    octree.refit(scene['xyz_ws'], scene['rotations'], scene['scales'])
+    _assert_superset(octree, scene, cameras, render_grid)
@@ -0,0 +1,69 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import HEIGHT, N_POINTS, WIDTH, make_camera
+from slang_gaussian_rasterization.internal.depth_keys import depth_key_layout
+from slang_gaussian_rasterization.internal.render_grid import RenderGrid
+from slang_gaussian_rasterization.internal.sort_by_keys.sort_by_keys_torch import sort_by_keys_torch
+from slang_gaussian_rasterization.internal.temporal_sort import TemporalSort, repair_order
+from slang_gaussian_rasterization.internal.tile_shader_torch import generate_keys_torch, vertex_shader_torch
+
+RENDER_GRID = RenderGrid(HEIGHT, WIDTH, tile_height=16, tile_width=16)
+
+
+def _frame(scene, angle):
+    """Returns the vertex shader outputs and the unsorted keys of one camera on the path."""
+    world_view_transform, proj_mat, cam_pos, fovy, fovx = make_camera(angle=angle)
+    with torch.no_grad():
+        tiles_touched, rect_tile_space, _, xyz_vs, _, _ = vertex_shader_torch(
+            scene['xyz_ws'], scene['rotations'], scene['scales'], scene['sh_coeffs'], 3,
+            world_view_transform[None], proj_mat[None], cam_pos[None],
+            torch.tensor([fovy]), torch.tensor([fovx]), RENDER_GRID)
+        keys, gauss_idx = generate_keys_torch(xyz_vs, rect_tile_space, tiles_touched, N_POINTS, RENDER_GRID)
+    return keys, gauss_idx, xyz_vs, rect_tile_space, tiles_touched
+
+
+def test_repair_order_matches_a_full_sort():
+    generator = torch.Generator().manual_seed(0)
+    keys = torch.randperm(1000, generator=generator)[:200] * 3
+    order = torch.sort(keys).indices
+    # A guess from the previous frame: two neighbours swapped, an item far out of place and two new items.
+    guess = order.clone()
+    guess[[10, 11]] = guess[[11, 10]]
+    guess = torch.cat([guess[:50], guess[150:151], guess[50:150], guess[151:]])
+    guess = guess[~torch.isin(guess, order[[3, 120]])]
+    repaired, n_reused = repair_order(keys, guess, max_passes=4, max_repair_fraction=0.1)
+    assert torch.equal(repaired, order)
+    assert 0 < n_reused < keys.shape[0]
+    assert repair_order(keys, order.flip(0), max_passes=4, max_repair_fraction=0.1) is None
+
+
+def test_temporal_sort_matches_sort_by_keys(scene):
+    temporal_sort = TemporalSort()
+    n_tiles = RENDER_GRID.grid_height * RENDER_GRID.grid_width
+    end_bit = depth_key_layout(n_tiles, None)[1]
+    # A smooth path, then a jump to the other side of the scene that needs a full sort.
+    for frame, angle in enumerate([0.3, 0.301, 0.302, 0.304, 0.31, 2.5]):
+        keys, gauss_idx, xyz_vs, rect_tile_space, tiles_touched = _frame(scene, angle)
+        expected_keys, expected_gauss_idx = sort_by_keys_torch(keys, gauss_idx)
+        sorted_keys, sorted_gauss_idx = temporal_sort.sort(keys, gauss_idx, xyz_vs, rect_tile_space, tiles_touched,
+                                                           N_POINTS, n_tiles, end_bit)
+        assert torch.equal(sorted_gauss_idx, expected_gauss_idx)
+        assert torch.equal(sorted_keys >> 32, expected_keys >> 32)
+        stats = temporal_sort.stats()
+        assert stats['full_sort'] == (frame in (0, 5))
+        if 0 < frame < 5:
+            assert stats['key_reuse_fraction'] > 0.5
+    assert temporal_sort.stats()['n_full_sorts'] == 2
@@ -0,0 +1,27 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import torch
+from scenes import gradients, render
+
+
+def test_tight_tile_bounds_drop_keys_not_pixels(scene, camera):
+    loose_pkg = render(scene, camera)
+    loose = gradients(scene, loose_pkg)
+    tight_pkg = render(scene, camera, tight_tile_bounds=True)
+    assert tight_pkg['n_keys_saved'] > 0
+    torch.testing.assert_close(tight_pkg['render'], loose_pkg['render'], atol=1e-6, rtol=0.0)
+    tight = gradients(scene, tight_pkg)
+    for name in loose:
+        torch.testing.assert_close(tight[name], loose[name], atol=1e-5, rtol=1e-4)